@@ -0,0 +1,61 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from utils.db_router import bind_user
+from utils.server_timing import timed
+
+from .claims import claims_valid
+from .models import User
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from the token's role claims
+    instead of loading the `User` row.
+
+    The returned user is a real `User` instance with only `id` and `role_id`
+    set; any other field is loaded (all at once) the first time a view
+    touches it. Tokens without the claims, or issued before the last change
+    of their user's role, active flag or existence (tracked per user in the
+    shared cache, see authapp/claims.py), take the regular database lookup,
+    which rejects deleted and inactive users.
+    """
+
+    def authenticate(self, request):
+        with timed("auth"):
+            result = super().authenticate(request)
+        if result is not None:
+            # Read-after-write stickiness is tracked per user
+            bind_user(result[0].pk)
+        return result
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+        role_id = validated_token.get("role_id")
+        if role_id is None or not claims_valid(
+            user_id, validated_token.get("claims_version")
+        ):
+            return super().get_user(validated_token)
+
+        return claims_user(user_id, role_id)
+
+
+def claims_user(user_id, role_id):
+    # simplejwt serializes the user id claim as a string
+    values = {"id": User._meta.pk.to_python(user_id), "role_id": role_id}
+    field_names = [
+        field.attname
+        for field in User._meta.concrete_fields
+        if field.attname in values
+    ]
+    user = User.from_db(None, field_names, [values[name] for name in field_names])
+    user._from_claims = True
+    return user
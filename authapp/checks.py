@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Permission, token claim, follower and replica stickiness changes reach
+    the other worker processes through the default cache.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend in PROCESS_LOCAL_CACHES and not settings.ALLOW_PROCESS_LOCAL_CACHE:
+        return [
+            Error(
+                f"The default cache ({backend}) is not shared between processes.",
+                hint=(
+                    "Point REDIS_URL at a Redis server, or set "
+                    "ALLOW_PROCESS_LOCAL_CACHE = True when a single process runs."
+                ),
+                id="authapp.E001",
+            )
+        ]
+    return []
@@ -0,0 +1,41 @@
+import secrets
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+CLAIMS_VERSION_CACHE_KEY = "authapp:claims:{user_id}"
+
+
+def claims_version(user_id):
+    """
+    The version a token issued now for `user_id` carries. A random value
+    rather than a counter: a version lost from the cache is replaced by one
+    that no earlier token holds.
+    """
+    key = CLAIMS_VERSION_CACHE_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, secrets.token_hex(8), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def claims_valid(user_id, version):
+    """
+    Whether a token's claims of `user_id` at `version` are still current.
+    """
+    return version is not None and version == cache.get(
+        CLAIMS_VERSION_CACHE_KEY.format(user_id=user_id)
+    )
+
+
+def invalidate_claims(user_id):
+    """
+    Send the tokens issued to `user_id` so far back to the database lookup.
+    Dropped again on commit: a token issued while the change was uncommitted
+    still carries the old claims.
+    """
+    key = CLAIMS_VERSION_CACHE_KEY.format(user_id=user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
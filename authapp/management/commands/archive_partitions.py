@@ -0,0 +1,122 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from authapp.repositories.partition_repo import (
+    PARTITIONED_TABLES,
+    add_months,
+    archive_partition,
+    create_monthly_partition,
+    default_partition_months,
+    ensure_monthly_partitions,
+    partition_name,
+    is_partitioned,
+    list_partitions,
+    month_start,
+    partition_has_rows,
+    partition_month,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly partitions for the Transaction/MarketData "
+        "ledgers, then archive partitions older than --keep-months, and the "
+        "default partition's rows that old, to compressed CSV files and drop "
+        "them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--table",
+            choices=[*PARTITIONED_TABLES, "all"],
+            default="all",
+            help="Which ledger to maintain (default: all).",
+        )
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            default=12,
+            help="Number of recent months to keep online (default: 12).",
+        )
+        parser.add_argument(
+            "--create-ahead",
+            type=int,
+            default=3,
+            help="Number of future monthly partitions to pre-create (default: 3).",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=str(settings.BASE_DIR / "archive"),
+            help="Directory for the .csv.gz archives.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report which partitions would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partition maintenance requires PostgreSQL.")
+        if options["keep_months"] < 1:
+            raise CommandError("--keep-months must be at least 1.")
+
+        keys = PARTITIONED_TABLES if options["table"] == "all" else [options["table"]]
+        current = month_start(date.today())
+        cutoff = add_months(current, -options["keep_months"] + 1)
+
+        for key in keys:
+            table, column = PARTITIONED_TABLES[key]
+            with connection.cursor() as cursor:
+                if not is_partitioned(cursor, table):
+                    raise CommandError(f"{table} is not partitioned; run migrate.")
+
+                # Old rows that landed in the default partition get a monthly
+                # partition of their own, archived below like any other
+                old_months = default_partition_months(cursor, table, column, cutoff)
+                if options["dry_run"]:
+                    partitions = list_partitions(cursor, table)
+                    partitions += [
+                        partition_name(table, month)
+                        for month in old_months
+                        if partition_name(table, month) not in partitions
+                    ]
+                else:
+                    for month in old_months:
+                        create_monthly_partition(cursor, table, month)
+                    ensure_monthly_partitions(
+                        cursor,
+                        table,
+                        current,
+                        add_months(current, options["create_ahead"]),
+                    )
+                    partitions = list_partitions(cursor, table)
+
+            for name in partitions:
+                month = partition_month(name)
+                if month is None or month >= cutoff:
+                    continue
+
+                # Open sell orders live in MarketData; archiving them would
+                # silently take the seller's shares off the market.
+                if key == "marketdata":
+                    with connection.cursor() as cursor:
+                        if partition_has_rows(
+                            cursor, name, "WHERE transaction_type = 'SELL'"
+                        ):
+                            self.stdout.write(
+                                self.style.WARNING(
+                                    f"Skipping {name}: it still holds open sell orders"
+                                )
+                            )
+                            continue
+
+                if options["dry_run"]:
+                    self.stdout.write(f"Would archive {name}")
+                    continue
+
+                path = archive_partition(table, name, options["archive_dir"])
+                self.stdout.write(self.style.SUCCESS(f"Archived {name} to {path}"))
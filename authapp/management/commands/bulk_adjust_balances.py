@@ -0,0 +1,126 @@
+import csv
+import json
+import tempfile
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from authapp.repositories.balance_ledger_repo import (
+    apply_adjustments,
+    roll_back_adjustments,
+)
+
+
+def read_csv(fileobj):
+    for row in csv.DictReader(fileobj):
+        yield row
+
+
+def read_ndjson(fileobj):
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def parse_adjustment(line_number, row):
+    try:
+        adjustment = {
+            "user_id": int(row["user_id"]),
+            "amount": Decimal(str(row["amount"])).quantize(Decimal("0.01")),
+            "reference": str(row.get("reference") or "")[:255],
+        }
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise CommandError(f"Line {line_number}: invalid adjustment {row!r}")
+    if adjustment["amount"] == 0:
+        raise CommandError(f"Line {line_number}: amount must not be zero")
+    return adjustment
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply credits (positive amounts) and debits (negative amounts) from a "
+        "CSV (user_id,amount[,reference]) or NDJSON file in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Adjustment file to apply.")
+        parser.add_argument(
+            "--format",
+            choices=READERS,
+            help="File format (default: guessed from the extension).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows read and written per round trip (default: 5000).",
+        )
+        parser.add_argument(
+            "--all-or-nothing",
+            action="store_true",
+            help="Roll everything back if any row is rejected.",
+        )
+        parser.add_argument(
+            "--report",
+            help="Write per-row results as NDJSON to this path.",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or (
+            "ndjson" if options["path"].endswith((".ndjson", ".jsonl")) else "csv"
+        )
+        all_or_nothing = options["all_or_nothing"]
+        applied = rejected = 0
+
+        # Results are spooled and only reported once the transaction's
+        # outcome is known
+        with tempfile.TemporaryFile("w+") as results:
+            try:
+                with open(options["path"], newline="") as fileobj, transaction.atomic():
+                    rows = enumerate(READERS[file_format](fileobj), start=1)
+                    while not (all_or_nothing and rejected):
+                        batch = [
+                            parse_adjustment(line_number, row)
+                            for line_number, row in islice(rows, options["batch_size"])
+                        ]
+                        if not batch:
+                            break
+
+                        for result in apply_adjustments(
+                            batch, stop_on_rejection=all_or_nothing
+                        ):
+                            if result["status"] == "applied":
+                                applied += 1
+                            elif result["status"] == "rejected":
+                                rejected += 1
+                            results.write(json.dumps(result) + "\n")
+
+                    # Raising inside the atomic block rolls every batch back
+                    if all_or_nothing and rejected:
+                        raise CommandError(
+                            f"{rejected} adjustments rejected; nothing was applied"
+                        )
+            except Exception:
+                self.write_report(options["report"], results, rolled_back=True)
+                raise
+            self.write_report(options["report"], results)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Applied {applied} adjustments, rejected {rejected}")
+        )
+
+    def write_report(self, path, results, rolled_back=False):
+        if not path:
+            return
+        results.seek(0)
+        with open(path, "w") as report:
+            for line in results:
+                if rolled_back:
+                    line = json.dumps(roll_back_adjustments([json.loads(line)])[0])
+                    line += "\n"
+                report.write(line)
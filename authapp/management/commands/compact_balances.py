@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from authapp.repositories.balance_ledger_repo import compact_balances
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll cash-ledger entries into per-user balance snapshots so "
+        "balance reads only sum the entries appended since the last run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users snapshotted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        written = compact_balances(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} balance snapshots"))
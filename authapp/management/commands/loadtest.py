@@ -0,0 +1,379 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import requests
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from authapp.models import MarketData, MarketListing, Role, User, UserStock
+from authapp.repositories.balance_ledger_repo import get_balances, post_entries
+from authapp.repositories.market_listing_repo import rebuild_market_listings
+from authapp.repositories.price_level_repo import rebuild_price_levels
+from authapp.serializers import ClaimsTokenObtainPairSerializer
+from stocks.models import PriceLevel, Stock
+from utils.metrics import POOL_METRICS
+
+
+OPERATIONS = ("buy", "sell", "price", "profile")
+MIN_PRICE = 1000  # cents
+MAX_PRICE = 1200
+
+
+def parse_mix(value):
+    """
+    "buy=4,sell=4,price=1,profile=1" -> {"buy": 4, "sell": 4, ...}
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise CommandError(f"Unknown operation {name!r} in --mix")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def scrape_pool_metrics(base_url):
+    """
+    {(metric, alias): value} of the db_pool_* series on the server's /metrics.
+    """
+    names = {name for _, name, _, _ in POOL_METRICS}
+    try:
+        response = requests.get(f"{base_url}/metrics", timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return {}
+    values = {}
+    for line in response.text.splitlines():
+        series, _, value = line.rpartition(" ")
+        name, _, labels = series.partition("{")
+        if name in names:
+            alias = labels.partition('alias="')[2].partition('"')[0]
+            values[(name, alias)] = float(value)
+    return values
+
+
+def random_price(rng):
+    return str(Decimal(rng.randint(MIN_PRICE, MAX_PRICE)) / 100)
+
+
+class Command(BaseCommand):
+    help = (
+        "Provision users with balances, holdings and sell orders, then drive a "
+        "mix of buys, sells, price reads and profile reads against a running "
+        "server from concurrent clients. Reports throughput and p50/p99 "
+        "latency, then checks the balance and share invariants."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            default="http://localhost:8000",
+            help="Server under test (default: http://localhost:8000).",
+        )
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--stocks", type=int, default=5)
+        parser.add_argument(
+            "--clients", type=int, default=20, help="Concurrent clients."
+        )
+        parser.add_argument(
+            "--duration", type=float, default=30.0, help="Seconds to run."
+        )
+        parser.add_argument(
+            "--mix",
+            type=parse_mix,
+            default=parse_mix("buy=4,sell=4,price=1,profile=1"),
+            help="Operation weights (default: buy=4,sell=4,price=1,profile=1).",
+        )
+        parser.add_argument(
+            "--balance",
+            type=Decimal,
+            default=Decimal("1000000.00"),
+            help="Cash deposited for every user.",
+        )
+        parser.add_argument(
+            "--shares",
+            type=int,
+            default=1000,
+            help="Shares of every stock each user starts with.",
+        )
+        parser.add_argument(
+            "--listed",
+            type=int,
+            default=100,
+            help="Shares of every stock each user starts with on sale.",
+        )
+        parser.add_argument(
+            "--prefix",
+            default=f"lt{int(time.time())}",
+            help="Prefix of the provisioned usernames and stock symbols.",
+        )
+        parser.add_argument("--seed", type=int, default=39)
+
+    def handle(self, *args, **options):
+        if options["listed"] > options["shares"]:
+            raise CommandError("--listed cannot exceed --shares")
+        if connection.vendor != "postgresql":
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Running against {connection.vendor}: row locks and "
+                    "concurrency differ from the production Postgres setup"
+                )
+            )
+
+        users, stocks = self.provision(options)
+        self.stdout.write(
+            f"Provisioned {len(users)} users and {len(stocks)} stocks "
+            f"({options['prefix']})"
+        )
+
+        tokens = {
+            user.pk: str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+            for user in users
+        }
+        base_url = options["base_url"].rstrip("/")
+        pools_before = scrape_pool_metrics(base_url)
+        samples, elapsed = self.drive(options, users, stocks, tokens)
+        self.report(samples, elapsed)
+        self.report_pools(pools_before, scrape_pool_metrics(base_url))
+
+        failures = self.check_invariants(options, users, stocks)
+        for failure in failures:
+            self.stdout.write(self.style.ERROR(failure))
+        if failures:
+            raise CommandError(f"{len(failures)} invariant checks failed")
+        self.stdout.write(self.style.SUCCESS("All invariants hold"))
+
+    def provision(self, options):
+        prefix = options["prefix"]
+        role, _ = Role.objects.get_or_create(name="User")
+        # Hash once: every load-test user shares the same password
+        password = make_password(prefix)
+        listed = options["listed"]
+
+        with transaction.atomic():
+            stocks = Stock.objects.bulk_create(
+                Stock(
+                    id=f"{prefix}S{i}",
+                    name=f"Load test stock {i}",
+                    marketPrice=Decimal("11.00"),
+                    sectionIndex="LOADTEST",
+                    details={},
+                )
+                for i in range(options["stocks"])
+            )
+            users = User.objects.bulk_create(
+                User(username=f"{prefix}u{i}", password=password, role=role)
+                for i in range(options["users"])
+            )
+            post_entries(
+                (user.pk, options["balance"], "DEPOSIT", f"loadtest:{prefix}")
+                for user in users
+            )
+            UserStock.objects.bulk_create(
+                UserStock(
+                    user=user,
+                    stock=stock,
+                    quantity=options["shares"] - listed,
+                    sold_quantity=listed,
+                )
+                for user in users
+                for stock in stocks
+            )
+            if listed:
+                rng = random.Random(options["seed"])
+                now = timezone.now()
+                MarketData.objects.bulk_create(
+                    MarketData(
+                        user=user,
+                        stock=stock,
+                        quantity=listed,
+                        price=random_price(rng),
+                        transaction_type="SELL",
+                        transaction_date=now,
+                    )
+                    for user in users
+                    for stock in stocks
+                )
+                with connection.cursor() as cursor:
+                    stock_ids = [stock.pk for stock in stocks]
+                    rebuild_price_levels(cursor, stock_ids)
+                    rebuild_market_listings(cursor, stock_ids)
+        return users, stocks
+
+    def drive(self, options, users, stocks, tokens):
+        operations = list(options["mix"])
+        weights = [options["mix"][name] for name in operations]
+        base_url = options["base_url"].rstrip("/")
+        deadline = time.monotonic() + options["duration"]
+        samples = defaultdict(list)
+        samples_lock = threading.Lock()
+
+        def client(index):
+            rng = random.Random(options["seed"] * 1000 + index)
+            session = requests.Session()
+            local = defaultdict(list)
+
+            while time.monotonic() < deadline:
+                operation = rng.choices(operations, weights)[0]
+                user = rng.choice(users)
+                stock = rng.choice(stocks)
+                headers = {"Authorization": f"Bearer {tokens[user.pk]}"}
+
+                if operation == "buy":
+                    request = session.post
+                    url = f"{base_url}/api/transactions/buy/"
+                    payload = {
+                        "stock": stock.pk,
+                        "quantity": rng.randint(1, 20),
+                        "price": str(Decimal(MAX_PRICE) / 100),
+                        "transaction_type": "BUY",
+                    }
+                elif operation == "sell":
+                    request = session.post
+                    url = f"{base_url}/api/transactions/sell/"
+                    payload = {
+                        "stock": stock.pk,
+                        "quantity": rng.randint(1, 20),
+                        "price": random_price(rng),
+                        "transaction_type": "SELL",
+                    }
+                elif operation == "price":
+                    request = session.get
+                    url = f"{base_url}/api/stocks/market-price/"
+                    payload = None
+                else:
+                    request = session.get
+                    url = f"{base_url}/api/users/profile/"
+                    payload = None
+
+                start = time.perf_counter()
+                try:
+                    response = request(url, json=payload, headers=headers, timeout=60)
+                    status = response.status_code
+                except requests.RequestException:
+                    status = None
+                local[operation].append((status, time.perf_counter() - start))
+
+            with samples_lock:
+                for operation, values in local.items():
+                    samples[operation].extend(values)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["clients"]) as executor:
+            list(executor.map(client, range(options["clients"])))
+        return samples, time.monotonic() - start
+
+    def report(self, samples, elapsed):
+        self.stdout.write(
+            f"{'operation':<10} {'requests':>9} {'ok':>7} {'4xx':>7} {'errors':>7} "
+            f"{'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}"
+        )
+        everything = []
+        for operation in OPERATIONS:
+            values = samples.get(operation)
+            if not values:
+                continue
+            everything.extend(values)
+            self.stdout.write(self.format_row(operation, values, elapsed))
+        if everything:
+            self.stdout.write(self.format_row("total", everything, elapsed))
+
+    def report_pools(self, before, after):
+        """
+        Pool gauges as seen after the run and counters as deltas over it.
+        """
+        if not after:
+            return
+        self.stdout.write("Connection pools (counters are deltas over the run):")
+        for _, name, metric_type, _ in POOL_METRICS:
+            for (metric, alias), value in sorted(after.items()):
+                if metric != name:
+                    continue
+                if metric_type == "counter":
+                    value -= before.get((metric, alias), 0)
+                self.stdout.write(f"  {alias:<12} {name:<34} {value:>12,.0f}")
+
+    def format_row(self, name, values, elapsed):
+        latencies = sorted(latency for _, latency in values)
+        ok = sum(1 for status, _ in values if status and status < 400)
+        rejected = sum(1 for status, _ in values if status and 400 <= status < 500)
+        errors = len(values) - ok - rejected
+        return (
+            f"{name:<10} {len(values):>9} {ok:>7} {rejected:>7} {errors:>7} "
+            f"{len(values) / elapsed:>9.1f} "
+            f"{percentile(latencies, 0.50) * 1000:>9.1f} "
+            f"{percentile(latencies, 0.99) * 1000:>9.1f}"
+        )
+
+    def check_invariants(self, options, users, stocks):
+        failures = []
+        user_ids = [user.pk for user in users]
+
+        balances = get_balances(user_ids)
+        negative = {pk: balance for pk, balance in balances.items() if balance < 0}
+        if negative:
+            failures.append(f"Negative balances: {negative}")
+
+        # Buys debit exactly what they credit to the sellers
+        expected_cash = options["balance"] * len(users)
+        if sum(balances.values()) != expected_cash:
+            failures.append(
+                f"Cash not conserved: {sum(balances.values())} != {expected_cash}"
+            )
+
+        holdings = {
+            row["stock_id"]: row
+            for row in UserStock.objects.filter(stock__in=stocks)
+            .values("stock_id")
+            .annotate(held=Sum("quantity"), on_sale=Sum("sold_quantity"))
+        }
+
+        def shares_per_stock(queryset):
+            return dict(
+                queryset.filter(stock__in=stocks)
+                .values("stock_id")
+                .annotate(total=Sum("quantity"))
+                .values_list("stock_id", "total")
+            )
+
+        listed = shares_per_stock(MarketData.objects.filter(transaction_type="SELL"))
+        # Read models maintained by the trading paths
+        derived = {
+            "the price levels": shares_per_stock(PriceLevel.objects.all()),
+            "the market listings": shares_per_stock(MarketListing.objects.all()),
+        }
+        expected_shares = options["shares"] * len(users)
+        for stock in stocks:
+            row = holdings.get(stock.pk, {"held": 0, "on_sale": 0})
+            shares = (row["held"] or 0) + (row["on_sale"] or 0)
+            if shares != expected_shares:
+                failures.append(
+                    f"{stock.pk}: {shares} shares exist, expected {expected_shares}"
+                )
+            if (row["on_sale"] or 0) != listed.get(stock.pk, 0):
+                failures.append(
+                    f"{stock.pk}: {row['on_sale']} shares reserved for sale but "
+                    f"{listed.get(stock.pk, 0)} listed"
+                )
+            for name, totals in derived.items():
+                if totals.get(stock.pk, 0) != listed.get(stock.pk, 0):
+                    failures.append(
+                        f"{stock.pk}: {totals.get(stock.pk, 0)} shares in {name} "
+                        f"but {listed.get(stock.pk, 0)} listed"
+                    )
+        return failures
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired OutstandingToken rows and their BlacklistedToken rows "
+        "in small batches, keeping each transaction and lock short."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Outstanding tokens deleted per transaction (default: 5000).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to pause between batches to limit load.",
+        )
+
+    def handle(self, *args, **options):
+        now = aware_utcnow()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by("id")
+        outstanding_deleted = blacklisted_deleted = 0
+
+        while True:
+            ids = list(expired.values_list("id", flat=True)[: options["batch_size"]])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                blacklisted, _ = BlacklistedToken.objects.filter(
+                    token_id__in=ids
+                ).delete()
+                outstanding, _ = OutstandingToken.objects.filter(id__in=ids).delete()
+
+            blacklisted_deleted += blacklisted
+            outstanding_deleted += outstanding
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {outstanding_deleted} outstanding and "
+                f"{blacklisted_deleted} blacklisted tokens"
+            )
+        )
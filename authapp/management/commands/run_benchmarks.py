@@ -0,0 +1,106 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import cases  # noqa: F401  (registers the cases)
+from benchmarks.runner import BENCHMARKS, compare, format_seconds, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the serializer, matching, pagination and error-handling hot paths "
+        "on seeded data; save the results as a JSON baseline or compare them "
+        "with one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-k",
+            "--filter",
+            default="",
+            help="Only run cases whose name contains this text.",
+        )
+        parser.add_argument("--list", action="store_true", help="List the cases.")
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Timed repeats per case; the median is reported (default: 5).",
+        )
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.2,
+            help="Minimum seconds per repeat; sets the calls per repeat.",
+        )
+        parser.add_argument("--save", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Baseline JSON file to compare with.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.05,
+            help="Relative change reported as faster/slower (default: 0.05).",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when a case is slower than the baseline.",
+        )
+
+    def handle(self, *args, **options):
+        names = [name for name in BENCHMARKS if options["filter"] in name]
+        if options["list"]:
+            self.stdout.write("\n".join(names))
+            return
+        if not names:
+            raise CommandError(f"No benchmark matches {options['filter']!r}")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as fileobj:
+                baseline = json.load(fileobj)
+            # Cases left out by --filter are not "missing"
+            baseline["results"] = {
+                name: result
+                for name, result in baseline["results"].items()
+                if options["filter"] in name
+            }
+
+        def log(name, result):
+            self.stdout.write(
+                f"{name:<50} {format_seconds(result['median']):>10} "
+                f"(min {format_seconds(result['min'])}, "
+                f"{result['repeat']}x{result['number']})"
+            )
+
+        current = run(
+            names, repeat=options["repeat"], min_time=options["min_time"], log=log
+        )
+
+        if options["save"]:
+            with open(options["save"], "w") as fileobj:
+                json.dump(current, fileobj, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['save']}"))
+
+        if baseline is None:
+            return
+
+        rows, regressions = compare(baseline, current, options["threshold"])
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'case':<50} {'baseline':>10} {'current':>10} {'change':>8}  verdict"
+        )
+        for name, old, new, change, verdict in rows:
+            change = "-" if change is None else f"{change:+.1%}"
+            line = (
+                f"{name:<50} {format_seconds(old):>10} {format_seconds(new):>10} "
+                f"{change:>8}  {verdict}"
+            )
+            if verdict == "slower":
+                line = self.style.ERROR(line)
+            elif verdict == "faster":
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
+
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{len(regressions)} cases regressed")
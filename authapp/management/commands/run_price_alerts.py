@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from authapp.price_alerts import PriceAlertEvaluator
+from authapp.repositories.price_alert_repo import (
+    active_alerts,
+    changed_alerts,
+    current_prices,
+    trigger_alerts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Evaluate active price alerts against the current stock prices every "
+        "--interval seconds and mark the ones whose threshold the price crossed "
+        "in batches. Run one instance per deployment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between evaluations (default: 1).",
+        )
+        parser.add_argument(
+            "--reload-every",
+            type=float,
+            default=300.0,
+            help="Seconds between full reloads of the active alerts (default: 300).",
+        )
+        parser.add_argument(
+            "--overlap",
+            type=float,
+            default=5.0,
+            help=(
+                "Seconds of changes re-read on every sync, covering alerts "
+                "committed late (default: 5)."
+            ),
+        )
+        parser.add_argument("--once", action="store_true", help="Evaluate once.")
+
+    def handle(self, *args, **options):
+        overlap = timedelta(seconds=options["overlap"])
+        # Kept across reloads: it remembers the last prices alerts cross from
+        evaluator = PriceAlertEvaluator()
+        loaded_at = synced_at = None
+
+        while True:
+            started = time.monotonic()
+            now = timezone.now()
+            if loaded_at is None or started - loaded_at >= options["reload_every"]:
+                evaluator.reload(active_alerts())
+                loaded_at = started
+            else:
+                for alert_id, *alert, is_active in changed_alerts(synced_at - overlap):
+                    if is_active:
+                        evaluator.add(alert_id, *alert)
+                    else:
+                        evaluator.remove(alert_id)
+            synced_at = now
+
+            triggered = {}
+            for symbol, price in current_prices(evaluator.symbols()).items():
+                for alert_id in evaluator.evaluate(symbol, price):
+                    triggered[alert_id] = price
+            if triggered:
+                updated = trigger_alerts(triggered)
+                self.stdout.write(
+                    f"Triggered {updated} alerts ({len(evaluator)} still active)"
+                )
+
+            if options["once"]:
+                return
+            time.sleep(max(options["interval"] - (time.monotonic() - started), 0))
@@ -0,0 +1,311 @@
+import io
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max
+from django.utils import timezone
+
+from authapp.models import Role, User
+from authapp.repositories.market_listing_repo import rebuild_market_listings
+from authapp.repositories.partition_repo import (
+    PARTITIONED_TABLES,
+    ensure_monthly_partitions,
+    is_partitioned,
+)
+from authapp.repositories.price_level_repo import rebuild_price_levels
+from utils.pg_copy import copy_from
+
+
+COPY_SQL = {
+    "stock": (
+        'COPY stocks_stock (id, name, "marketPrice", "sectionIndex", details) '
+        "FROM STDIN"
+    ),
+    "user": (
+        "COPY authapp_user (id, password, created_at, updated_at, username, "
+        "role_id, account_balance, is_active) FROM STDIN"
+    ),
+    "userstock": (
+        "COPY authapp_userstock (created_at, updated_at, user_id, stock_id, "
+        "quantity, sold_quantity, purchase_date) FROM STDIN"
+    ),
+    "marketdata": (
+        "COPY authapp_marketdata (created_at, updated_at, user_id, stock_id, "
+        "quantity, price, transaction_type, transaction_date) FROM STDIN"
+    ),
+    "transaction": (
+        "COPY authapp_transaction (created_at, updated_at, user_id, stock_id, "
+        "transaction_type, quantity, price, transaction_date, status) FROM STDIN"
+    ),
+}
+
+SECTIONS = ("VN30", "HNX30", "UPCOM", "VNMID", "VNSML")
+
+
+def stock_symbol(plan, index):
+    return f"{plan['prefix'].upper()}{index:06d}"
+
+
+def chunk_rng(plan, kind, start):
+    # Seeded per chunk so the output does not depend on scheduling
+    return random.Random(f"{plan['seed']}:{kind}:{start}")
+
+
+def random_moment(rng, plan):
+    return plan["now"] - timedelta(seconds=rng.randrange(plan["days"] * 86400))
+
+
+def price(rng):
+    return f"{rng.randint(100, 200000) / 100:.2f}"
+
+
+def stock_rows(plan, start, count):
+    rng = chunk_rng(plan, "stock", start)
+    for index in range(start, start + count):
+        details = json.dumps({"sector": f"S{index % 24}", "lot_size": 100})
+        yield (
+            stock_symbol(plan, index),
+            f"Synthetic stock {index}",
+            price(rng),
+            rng.choice(SECTIONS),
+            details,
+        )
+
+
+def user_rows(plan, start, count):
+    rng = chunk_rng(plan, "user", start)
+    now = plan["now"].isoformat()
+    for index in range(start, start + count):
+        yield (
+            plan["first_user_id"] + index,
+            plan["password"],
+            now,
+            now,
+            f"{plan['prefix']}{index}",
+            plan["role_id"],
+            f"{rng.randint(1000, 10_000_000)}.00",
+            "t",
+        )
+
+
+def holding_rows(plan, start, count):
+    """
+    Positions of users [start, start + count), each with the BUY that opened
+    it and, for a share of them, an open SELL order backed by sold_quantity.
+    """
+    rng = chunk_rng(plan, "holding", start)
+    holdings, market_data = [], []
+    for index in range(start, start + count):
+        user_id = plan["first_user_id"] + index
+        for stock_index in rng.sample(range(plan["stocks"]), plan["holdings"]):
+            symbol = stock_symbol(plan, stock_index)
+            bought = random_moment(rng, plan).isoformat()
+            quantity = rng.randint(1, 100) * 100
+            listed = 0
+            if rng.random() < plan["listed_ratio"]:
+                listed = rng.randint(1, quantity // 100) * 100
+                ask = price(rng)
+                market_data.append(
+                    (bought, bought, user_id, symbol, listed, ask, "SELL", bought)
+                )
+            market_data.append(
+                (bought, bought, user_id, symbol, quantity, price(rng), "BUY", bought)
+            )
+            holdings.append(
+                (bought, bought, user_id, symbol, quantity - listed, listed, bought)
+            )
+    return {"userstock": holdings, "marketdata": market_data}
+
+
+def transaction_rows(plan, start, count):
+    rng = chunk_rng(plan, "transaction", start)
+    for _ in range(count):
+        moment = random_moment(rng, plan).isoformat()
+        yield (
+            moment,
+            moment,
+            plan["first_user_id"] + rng.randrange(plan["users"]),
+            stock_symbol(plan, rng.randrange(plan["stocks"])),
+            rng.choice(("BUY", "SELL")),
+            rng.randint(1, 100) * 100,
+            price(rng),
+            moment,
+            "COMPLETED",
+        )
+
+
+def copy_rows(cursor, kind, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(str, row)))
+        buffer.write("\n")
+    data = io.BytesIO(buffer.getvalue().encode())
+    copy_from(cursor, COPY_SQL[kind], data)
+
+
+def load_chunk(plan, kind, start, count):
+    """
+    Generate one chunk and COPY it in its own transaction. Runs in a worker
+    process; returns the number of rows written per table.
+    """
+    written = {}
+    with connection.cursor() as cursor:
+        if kind == "holding":
+            for table, rows in holding_rows(plan, start, count).items():
+                copy_rows(cursor, table, rows)
+                written[table] = len(rows)
+        else:
+            generate = {
+                "stock": stock_rows,
+                "user": user_rows,
+                "transaction": transaction_rows,
+            }[kind]
+            rows = list(generate(plan, start, count))
+            copy_rows(cursor, kind, rows)
+            written[kind] = len(rows)
+    return written
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate deterministic synthetic stocks, users, positions, market data "
+        "and transactions and bulk-load them with Postgres COPY from parallel "
+        "worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stocks", type=int, default=2000)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument(
+            "--holdings",
+            type=int,
+            default=20,
+            help="Positions per user; each also writes its BUY (default: 20).",
+        )
+        parser.add_argument(
+            "--listed-ratio",
+            type=float,
+            default=0.3,
+            help="Share of positions with an open SELL order (default: 0.3).",
+        )
+        parser.add_argument("--transactions", type=int, default=5_000_000)
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Spread timestamps over this many past days (default: 365).",
+        )
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50_000,
+            help="Rows generated per COPY (default: 50000).",
+        )
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--seed", type=int, default=40)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("seed_scale loads data with Postgres COPY")
+        if options["holdings"] > options["stocks"]:
+            raise CommandError("--holdings cannot exceed --stocks")
+        if User.objects.filter(username=f"{options['prefix']}0").exists():
+            raise CommandError(
+                f"Users with prefix {options['prefix']!r} exist; pick another --prefix"
+            )
+
+        plan = self.make_plan(options)
+        self.ensure_partitions(plan)
+
+        started = time.monotonic()
+        chunk_size = options["chunk_size"]
+        holding_chunk = max(chunk_size // (options["holdings"] * 2), 1)
+        # Parents first: every phase only references rows of earlier phases
+        phases = [
+            [("stock", options["stocks"], chunk_size)],
+            [("user", options["users"], chunk_size)],
+            [
+                ("holding", options["users"], holding_chunk),
+                ("transaction", options["transactions"], chunk_size),
+            ],
+        ]
+
+        totals = {}
+        # Forked workers open their own connections; none may be inherited
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(options["workers"], mp_context=context) as executor:
+            for phase in phases:
+                futures = [
+                    executor.submit(
+                        load_chunk, plan, kind, start, min(size, total - start)
+                    )
+                    for kind, total, size in phase
+                    for start in range(0, total, size)
+                ]
+                for future in futures:
+                    for table, rows in future.result().items():
+                        totals[table] = totals.get(table, 0) + rows
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence('authapp_user', 'id'), "
+                "(SELECT MAX(id) FROM authapp_user))"
+            )
+            # COPY bypasses the sell path that maintains the read models
+            rebuild_price_levels(cursor)
+            rebuild_market_listings(cursor)
+            for table in COPY_SQL:
+                name = "stocks_stock" if table == "stock" else f"authapp_{table}"
+                cursor.execute(f"ANALYZE {name}")
+            cursor.execute("ANALYZE stocks_pricelevel")
+            cursor.execute("ANALYZE authapp_marketlisting")
+
+        elapsed = time.monotonic() - started
+        total = sum(totals.values())
+        for table, rows in sorted(totals.items()):
+            self.stdout.write(f"{table:<12} {rows:>12,}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {total:,} rows in {elapsed:.1f}s "
+                f"({total / elapsed:,.0f} rows/s)"
+            )
+        )
+
+    def make_plan(self, options):
+        role, _ = Role.objects.get_or_create(name="User")
+        last_id = User.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        return {
+            "prefix": options["prefix"],
+            "seed": options["seed"],
+            "stocks": options["stocks"],
+            "users": options["users"],
+            "holdings": options["holdings"],
+            "listed_ratio": options["listed_ratio"],
+            "transactions": options["transactions"],
+            "days": options["days"],
+            "now": timezone.now(),
+            "first_user_id": last_id + 1,
+            "role_id": role.pk,
+            # Hashed once; hashing per user would dominate the run time
+            "password": make_password(options["prefix"]),
+        }
+
+    def ensure_partitions(self, plan):
+        with connection.cursor() as cursor:
+            for table, _ in PARTITIONED_TABLES.values():
+                if is_partitioned(cursor, table):
+                    ensure_monthly_partitions(
+                        cursor,
+                        table,
+                        plan["now"].date() - timedelta(days=plan["days"]),
+                        plan["now"].date(),
+                    )
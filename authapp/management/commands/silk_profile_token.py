@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from utils.silk_sampling import make_profile_token, sampling_setting
+
+
+class Command(BaseCommand):
+    help = "Print a signed header that forces silk to profile a single request."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{sampling_setting('HEADER')}: {make_profile_token()}")
+        self.stdout.write(
+            f"(valid for {sampling_setting('TOKEN_MAX_AGE')} seconds)"
+        )
@@ -0,0 +1,128 @@
+from datetime import date
+
+from django.db import migrations
+
+# Frozen copy of the partitioning steps: the migration must keep producing
+# the same schema whatever later happens to authapp.repositories.partition_repo
+PARTITIONED_TABLES = [
+    ("authapp_transaction", "transaction_date"),
+    ("authapp_marketdata", "transaction_date"),
+]
+MONTHS_AHEAD = 3
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s)", [table]
+    )
+    row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def partition_table(cursor, table, column):
+    """
+    Convert a plain heap table into a table range-partitioned by month on
+    `column`, keeping its rows, id sequence, indexes and foreign keys.
+
+    Postgres requires the partition key in the primary key, so the new key is
+    (id, column); ids stay unique because they still come from one sequence.
+    """
+    legacy = f"{table}_legacy"
+    # The identity sequence of the old table goes away with it
+    sequence = f"{table}_partitioned_id_seq"
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary",
+        [table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f"SELECT min({column}) FROM {table}")
+    oldest = cursor.fetchone()[0]
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    cursor.execute(
+        f"CREATE TABLE {table} "
+        f"(LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE ({column})"
+    )
+    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence} AS bigint")
+    cursor.execute(
+        f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')"
+    )
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+    current = month_start(date.today())
+    month = month_start(oldest) if oldest else current
+    while month <= add_months(current, MONTHS_AHEAD):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y%m} PARTITION OF {table} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [month.isoformat(), add_months(month, 1).isoformat()],
+        )
+        month = add_months(month, 1)
+    cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+    cursor.execute(
+        f"SELECT setval('{sequence}', "
+        f"COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+    )
+    cursor.execute(f"DROP TABLE {legacy}")
+
+    cursor.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {column})"
+    )
+    for definition in indexes:
+        cursor.execute(
+            definition.replace(f" ON public.{legacy} ", f" ON {table} ").replace(
+                f" ON {legacy} ", f" ON {table} "
+            )
+        )
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS {table}_{column}_idx ON {table} ({column})"
+    )
+
+
+def partition_ledgers(apps, schema_editor):
+    """
+    Turn Transaction and MarketData into monthly range-partitioned tables.
+    Only Postgres supports this; other backends keep plain tables.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table, column in PARTITIONED_TABLES:
+            if not is_partitioned(cursor, table):
+                partition_table(cursor, table, column)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authapp", "0004_userstock_sold_quantity"),
+    ]
+
+    operations = [
+        # Partitioned tables behave like plain ones for the ORM, so there is
+        # nothing to undo when migrating backwards.
+        migrations.RunPython(partition_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0005_partition_transaction_marketdata'),
+        ('stocks', '0002_alter_stock_id_alter_stock_marketprice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marketdata',
+            index=models.Index(condition=models.Q(('transaction_type', 'SELL')), fields=['stock', 'price'], name='marketdata_sell_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketdata',
+            index=models.Index(condition=models.Q(('transaction_type', 'BUY')), fields=['user', 'stock', 'transaction_date'], name='marketdata_user_buy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-transaction_date', '-id'], name='transaction_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userstock',
+            index=models.Index(fields=['user', 'stock'], name='userstock_user_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userstockfollowed',
+            index=models.Index(fields=['user', 'stock'], name='stockfollow_user_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# List every open sell order. A frozen copy of the rebuild: the migration
+# must keep doing the same whatever later happens to
+# authapp.repositories.market_listing_repo
+BACKFILL_SQL = (
+    "INSERT INTO authapp_marketlisting (order_id, user_id, username, stock_id, "
+    "quantity, price, transaction_date, updated_at) "
+    "SELECT m.id, m.user_id, u.username, m.stock_id, m.quantity, m.price, "
+    "m.transaction_date, m.updated_at "
+    "FROM authapp_marketdata m JOIN authapp_user u ON u.id = m.user_id "
+    "WHERE m.transaction_type = 'SELL'"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0008_price_alert'),
+        ('stocks', '0003_price_level'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketListing',
+            fields=[
+                ('order_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('transaction_date', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('stock', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stocks.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stock', 'price'], name='listing_stock_price_idx'), models.Index(fields=['stock', 'updated_at'], name='listing_stock_updated_idx'), models.Index(fields=['price'], name='listing_price_idx'), models.Index(fields=['updated_at'], name='listing_updated_idx')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authapp", "0009_market_listing"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="is_active",
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:04
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def flag_compacted_entries(apps, schema_editor):
+    """
+    Flag the entries the existing snapshots already cover.
+    """
+    BalanceEntry = apps.get_model("authapp", "BalanceEntry")
+    BalanceSnapshot = apps.get_model("authapp", "BalanceSnapshot")
+    latest = BalanceSnapshot.objects.filter(user=OuterRef("user")).order_by(
+        "-last_entry_id"
+    )
+    BalanceEntry.objects.filter(
+        id__lte=Subquery(latest.values("last_entry_id")[:1])
+    ).update(compacted=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authapp", "0010_user_is_active"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="balanceentry",
+            name="compacted",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(flag_compacted_entries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="balanceentry",
+            index=models.Index(
+                condition=models.Q(("compacted", False)),
+                fields=["user"],
+                name="balanceentry_open_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_reference_prices(apps, schema_editor):
+    """
+    Active alerts only fire on a crossing from now on: take the current price
+    as their reference.
+    """
+    PriceAlert = apps.get_model("authapp", "PriceAlert")
+    Stock = apps.get_model("stocks", "Stock")
+    PriceAlert.objects.filter(is_active=True).update(
+        reference_price=Subquery(
+            Stock.objects.filter(pk=OuterRef("stock")).values("marketPrice")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authapp", "0011_balance_entry_compacted"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pricealert",
+            name="reference_price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=20, null=True
+            ),
+        ),
+        migrations.RunPython(set_reference_prices, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,9 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from decimal import Decimal
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from datetime import timedelta
+from rest_framework.exceptions import AuthenticationFailed
 
 from stocks.models import Stock
 
@@ -56,18 +58,74 @@ class User(AbstractBaseUser, BaseModel):
     username = models.CharField(max_length=255, unique=True, null=False)
     role = models.ForeignKey(Role, on_delete=models.CASCADE, null=False, default=1)
     stocks_followed = models.ManyToManyField(Stock, through="UserStockFollowed")
+    # Opening balance only: the live balance is derived from the cash ledger
+    # (BalanceSnapshot + BalanceEntry), see repositories/balance_ledger_repo.py
     account_balance = models.DecimalField(
         default=Decimal("0.00"), max_digits=10, decimal_places=2
     )
+    is_active = models.BooleanField(default=True)
 
     USERNAME_FIELD = "username"  # default: email
     REQUIRED_FIELDS = ["password", "role"]
 
+    # Issued access tokens vouch for these: changing one invalidates them
+    # (see authapp/signals.py)
+    CLAIM_FIELDS = ("role_id", "is_active")
+
     objects = CustomUserManager()
 
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_claims = user.claim_values()
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Touching one deferred field loads all of them, so a user built from
+        # token claims costs at most one query however many fields a view reads
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        try:
+            super().refresh_from_db(
+                using=using, fields=fields, from_queryset=from_queryset
+            )
+        except User.DoesNotExist:
+            if getattr(self, "_from_claims", False):
+                # Deleted since its token was checked: fail as authentication
+                raise AuthenticationFailed(
+                    _("User not found"), code="user_not_found"
+                ) from None
+            raise
+        loaded = getattr(self, "_loaded_claims", None)
+        if loaded is not None:
+            for name, value in self.claim_values().items():
+                loaded.setdefault(name, value)
+
+    def claim_values(self):
+        # Deferred fields are left unread, so this never queries
+        return {
+            name: self.__dict__[name]
+            for name in self.CLAIM_FIELDS
+            if name in self.__dict__
+        }
+
+    def claims_changed(self):
+        """
+        Whether a claim field differs from the value last read from or saved
+        to the database. Fields set without being read count as changed.
+        """
+        loaded = getattr(self, "_loaded_claims", None)
+        if loaded is None:
+            return True
+        return any(
+            name not in loaded or loaded[name] != value
+            for name, value in self.claim_values().items()
+        )
+
 
 class UserStockFollowed(BaseModel):
     user = models.ForeignKey(
@@ -75,6 +133,11 @@ class UserStockFollowed(BaseModel):
     )
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "stock"], name="stockfollow_user_stock_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.stock.id}"
 
@@ -86,6 +149,12 @@ class UserStock(BaseModel):
     sold_quantity = models.PositiveIntegerField(default=0)
     purchase_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # fetch_user_stock / seller settlement look positions up by both keys
+            models.Index(fields=["user", "stock"], name="userstock_user_stock_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username} owns {self.quantity} of {self.stock.id}"
 
@@ -130,6 +199,15 @@ class Transaction(BaseModel):
     transaction_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="Pending")
 
+    class Meta:
+        indexes = [
+            # Transaction history: filter by user, newest first
+            models.Index(
+                fields=["user", "-transaction_date", "-id"],
+                name="transaction_user_date_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} {self.quantity} {self.stock.id} for {self.user.username} "
 
@@ -142,6 +220,22 @@ class MarketData(BaseModel):
     transaction_type = models.CharField(max_length=50)
     transaction_date = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # Order book: open sell orders of a stock, cheapest first
+            models.Index(
+                fields=["stock", "price"],
+                condition=models.Q(transaction_type="SELL"),
+                name="marketdata_sell_book_idx",
+            ),
+            # T+3 check: earliest BUY of a user for a stock
+            models.Index(
+                fields=["user", "stock", "transaction_date"],
+                condition=models.Q(transaction_type="BUY"),
+                name="marketdata_user_buy_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.stock.id} - {self.quantity} - {self.price}"
 
@@ -150,6 +244,137 @@ class MarketData(BaseModel):
         return self.quantity * self.price
 
 
+class MarketListing(models.Model):
+    """
+    Read model of the open sell orders for the market data listing: one row
+    per SELL MarketData row, carrying the seller's username so the list needs
+    no join. Kept in step by the sell and buy paths.
+    """
+
+    transaction_type = "SELL"
+
+    order_id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    username = models.CharField(max_length=255)
+    # Covered by the (stock, ...) indexes below
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, db_index=False)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=20, decimal_places=2)
+    transaction_date = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        # One per filter/ordering combination `MarketDataViewSet` exposes
+        indexes = [
+            models.Index(fields=["stock", "price"], name="listing_stock_price_idx"),
+            models.Index(
+                fields=["stock", "updated_at"], name="listing_stock_updated_idx"
+            ),
+            models.Index(fields=["price"], name="listing_price_idx"),
+            models.Index(fields=["updated_at"], name="listing_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_id} - {self.quantity} - {self.price}"
+
+
+class PriceAlert(BaseModel):
+    """
+    "Notify me when <stock> goes above/below <threshold>". Active until the
+    price crosses the threshold from the side of `reference_price`, the price
+    when the alert was created (triggered), or the user cancels it.
+    """
+
+    DIRECTIONS = [
+        ("ABOVE", "Above"),
+        ("BELOW", "Below"),
+    ]
+
+    user = models.ForeignKey(
+        User, related_name="price_alerts", on_delete=models.CASCADE
+    )
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    direction = models.CharField(max_length=5, choices=DIRECTIONS)
+    threshold = models.DecimalField(max_digits=20, decimal_places=2)
+    reference_price = models.DecimalField(
+        max_digits=20, decimal_places=2, null=True, blank=True
+    )
+    is_active = models.BooleanField(default=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    triggered_price = models.DecimalField(
+        max_digits=20, decimal_places=2, null=True, blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="pricealert_user_idx"),
+            # The evaluator picks up new, cancelled and triggered alerts by time
+            models.Index(fields=["updated_at"], name="pricealert_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_id} {self.direction} {self.threshold} for {self.user_id}"
+
+
+class BalanceEntry(BaseModel):
+    """
+    Signed cash movement of a user. Rows are only ever appended; compaction
+    flags the ones it folded into a BalanceSnapshot.
+    """
+
+    REASONS = [
+        ("DEPOSIT", "Deposit"),
+        ("BUY", "Buy"),
+        ("SELL", "Sell"),
+        ("ADJUSTMENT", "Adjustment"),
+    ]
+
+    user = models.ForeignKey(
+        User, related_name="balance_entries", on_delete=models.CASCADE
+    )
+    amount = models.DecimalField(max_digits=20, decimal_places=2)
+    reason = models.CharField(max_length=20, choices=REASONS)
+    reference = models.CharField(max_length=255, blank=True, default="")
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="balanceentry_user_id_idx"),
+            # Balance reads only sum the entries not compacted yet
+            models.Index(
+                fields=["user"],
+                condition=models.Q(compacted=False),
+                name="balanceentry_open_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.reason} {self.amount}"
+
+
+class BalanceSnapshot(BaseModel):
+    """
+    Balance of a user covering every compacted BalanceEntry; last_entry_id
+    is the newest of them.
+    """
+
+    user = models.ForeignKey(
+        User, related_name="balance_snapshots", on_delete=models.CASCADE
+    )
+    balance = models.DecimalField(max_digits=20, decimal_places=2)
+    last_entry_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-last_entry_id"], name="balancesnap_user_entry_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} = {self.balance} @ {self.last_entry_id}"
+
+
 class Order(BaseModel):
     ORDER_TYPES = [
         ("BUY", "Buy"),
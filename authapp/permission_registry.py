@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+
+VERSION_CACHE_KEY = "authapp:rbac:version"
+
+# How often (seconds) the shared version is compared with the loaded one, and
+# the longest a process keeps a matrix, should an invalidation be lost (e.g. a
+# cache restart).
+VERSION_CHECK_INTERVAL = 1.0
+MAX_MATRIX_AGE = 60.0
+
+
+class PermissionRegistry:
+    """
+    In-memory copy of the Role -> Permission matrix.
+
+    The matrix is loaded with two queries and reused until the version kept
+    in the default cache, which every worker process shares (authapp.E001),
+    moves. Signals on Role, Permission and
+    RolePermission bump that version, so authorization checks cost no queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._role_names = {}
+        self._role_permissions = {}
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    @property
+    def version(self):
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(VERSION_CACHE_KEY, 1, timeout=None)
+            version = cache.get(VERSION_CACHE_KEY, 1)
+        return version
+
+    def invalidate(self):
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.add(VERSION_CACHE_KEY, 1, timeout=None)
+        self._version = None
+
+    def _load(self, version):
+        from .models import Role, RolePermission
+
+        role_names = dict(Role.objects.values_list("id", "name"))
+        role_permissions = defaultdict(set)
+        for role_id, permission in RolePermission.objects.values_list(
+            "role_id", "permission__name"
+        ):
+            role_permissions[role_id].add(permission)
+
+        with self._lock:
+            self._role_names = role_names
+            self._role_permissions = {
+                role_id: frozenset(names) for role_id, names in role_permissions.items()
+            }
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if (
+            self._version is not None
+            and now - self._checked_at < VERSION_CHECK_INTERVAL
+            and now - self._loaded_at < MAX_MATRIX_AGE
+        ):
+            return
+
+        version = self.version
+        self._checked_at = now
+        if version != self._version or now - self._loaded_at >= MAX_MATRIX_AGE:
+            self._load(version)
+
+    def role_name(self, user):
+        if not user or not user.is_authenticated:
+            return None
+        self._ensure_loaded()
+        return self._role_names.get(user.role_id)
+
+    def has_perm(self, user, permission):
+        if not user or not user.is_authenticated:
+            return False
+        self._ensure_loaded()
+        return permission in self._role_permissions.get(user.role_id, ())
+
+
+registry = PermissionRegistry()
+
+has_perm = registry.has_perm
+role_name = registry.role_name
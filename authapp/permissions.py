@@ -1,5 +1,5 @@
 from rest_framework.permissions import BasePermission
-from .models import RolePermission
+from .permission_registry import has_perm
 
 
 class CanAddMoneyPermission(BasePermission):
@@ -7,11 +7,4 @@ class CanAddMoneyPermission(BasePermission):
         if not request.user.is_authenticated:
             return False
 
-        role = request.user.role
-
-        if RolePermission.objects.filter(
-            role=role, permission__name="can_add_money"
-        ).exists():
-            return True
-
-        return False
+        return has_perm(request.user, "can_add_money")
@@ -0,0 +1,131 @@
+from bisect import bisect_left, bisect_right
+
+
+# (sign of the keys, bisect) per (direction, armed). The alerts a price
+# reaches always form the tail of their array, from bisect(keys, sign * price):
+# armed alerts fire (ABOVE when price >= threshold, BELOW when price <=
+# threshold) and disarmed ones arm once the price is strictly on the other
+# side (ABOVE when price < threshold, BELOW when price > threshold).
+SIDES = {
+    ("ABOVE", True): (-1, bisect_left),
+    ("BELOW", True): (1, bisect_left),
+    ("ABOVE", False): (1, bisect_right),
+    ("BELOW", False): (-1, bisect_right),
+}
+
+
+class PriceAlertEvaluator:
+    """
+    Active price alerts held in sorted arrays, one per (symbol, direction,
+    armed).
+
+    An alert fires only when the price crosses its threshold: it is armed
+    while its reference price (the last evaluated price of the symbol, or the
+    price at creation) is on the other side of the threshold, and disarmed
+    alerts arm once the price moves there. Evaluating a price is one bisect
+    per array plus moving the k alerts reached, O(log n + k), however many
+    alerts the symbol has.
+    """
+
+    def __init__(self):
+        self._sides = {}
+        self._alerts = {}
+        # Last evaluated price per symbol
+        self.prices = {}
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def __contains__(self, alert_id):
+        return alert_id in self._alerts
+
+    def _insert(self, alert_id, symbol, direction, threshold, armed):
+        sign, _ = SIDES[(direction, armed)]
+        keys, ids = self._sides.setdefault((symbol, direction, armed), ([], []))
+        key = sign * threshold
+        index = bisect_right(keys, key)
+        keys.insert(index, key)
+        ids.insert(index, alert_id)
+        self._alerts[alert_id] = (symbol, direction, threshold, armed)
+
+    def _take_tail(self, side, price):
+        """
+        Remove and return (ids, thresholds) of the alerts of `side` that
+        `price` reaches.
+        """
+        keys, ids = self._sides.get(side, ((), ()))
+        sign, bisect = SIDES[side[1:]]
+        index = bisect(keys, sign * price)
+        if index == len(keys):
+            return [], []
+        hits, reached = ids[index:], keys[index:]
+        del keys[index:]
+        del ids[index:]
+        if not keys:
+            del self._sides[side]
+        return hits, [sign * key for key in reached]
+
+    def add(self, alert_id, symbol, direction, threshold, reference=None):
+        """
+        Hold an alert, armed when `reference` (the price at creation) is on
+        the other side of `threshold` than the one it fires on. An alert
+        already held keeps following the evaluated prices instead, and
+        without either price the alert starts armed.
+        """
+        if reference is None or alert_id in self._alerts:
+            reference = self.prices.get(symbol, reference)
+        self.remove(alert_id)
+        if reference is None:
+            armed = True
+        elif direction == "ABOVE":
+            armed = reference < threshold
+        else:
+            armed = reference > threshold
+        self._insert(alert_id, symbol, direction, threshold, armed)
+
+    def reload(self, alerts):
+        """
+        Replace the alerts held with `alerts` ((id, symbol, direction,
+        threshold, reference) rows). Those already held keep their state.
+        """
+        held, self._alerts, self._sides = self._alerts, {}, {}
+        for alert_id, symbol, direction, threshold, reference in alerts:
+            if alert_id in held:
+                reference = self.prices.get(symbol, reference)
+            self.add(alert_id, symbol, direction, threshold, reference)
+
+    def remove(self, alert_id):
+        entry = self._alerts.pop(alert_id, None)
+        if entry is None:
+            return
+        symbol, direction, threshold, armed = entry
+        side = (symbol, direction, armed)
+        keys, ids = self._sides[side]
+        index = bisect_left(keys, SIDES[(direction, armed)][0] * threshold)
+        while ids[index] != alert_id:
+            index += 1
+        del keys[index]
+        del ids[index]
+        if not keys:
+            del self._sides[side]
+
+    def symbols(self):
+        return {symbol for symbol, _, _ in self._sides}
+
+    def evaluate(self, symbol, price):
+        """
+        Remove and return the ids of the alerts of `symbol` whose threshold
+        `price` crosses, and arm those it moves past the other way.
+        """
+        self.prices[symbol] = price
+        triggered = []
+        for direction in ("ABOVE", "BELOW"):
+            hits, _ = self._take_tail((symbol, direction, True), price)
+            for alert_id in hits:
+                del self._alerts[alert_id]
+            triggered.extend(hits)
+
+            hits, thresholds = self._take_tail((symbol, direction, False), price)
+            for alert_id, threshold in zip(hits, thresholds):
+                self._insert(alert_id, symbol, direction, threshold, True)
+        return triggered
@@ -0,0 +1,217 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from authapp.models import BalanceEntry, BalanceSnapshot, User
+
+
+ZERO = Decimal("0.00")
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+
+
+def _with_snapshot(queryset):
+    latest = BalanceSnapshot.objects.filter(user=OuterRef("pk")).order_by(
+        "-last_entry_id"
+    )
+    return queryset.annotate(
+        snapshot_balance=Coalesce(
+            Subquery(latest.values("balance")[:1], output_field=MONEY),
+            F("account_balance"),
+            output_field=MONEY,
+        ),
+        snapshot_entry_id=Coalesce(
+            Subquery(latest.values("last_entry_id")[:1]), Value(0)
+        ),
+    )
+
+
+def with_balances(queryset):
+    """
+    Annotate users with `snapshot_balance` (the latest snapshot, or the
+    opening `account_balance` when there is none) and `entries_total` (every
+    entry not compacted into it yet), so a list of users stays a single
+    query. Read the balance with balance_of().
+    """
+    entries_total = (
+        BalanceEntry.objects.filter(user=OuterRef("pk"), compacted=False)
+        .values("user")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    return _with_snapshot(queryset).annotate(
+        entries_total=Coalesce(
+            Subquery(entries_total, output_field=MONEY),
+            Value(ZERO),
+            output_field=MONEY,
+        )
+    )
+
+
+def balance_of(user):
+    return user.snapshot_balance + user.entries_total
+
+
+def get_balances(user_ids):
+    """
+    Return {user_id: balance}, in one query regardless of the number of
+    users.
+    """
+    rows = with_balances(User.objects.filter(pk__in=user_ids)).values_list(
+        "pk", "snapshot_balance", "entries_total"
+    )
+    return {pk: base + delta for pk, base, delta in rows}
+
+
+def get_balance(user):
+    return get_balances([user.pk]).get(user.pk, ZERO)
+
+
+def lock_balances(user_ids):
+    """
+    Serialize debits of the given users for the rest of the transaction.
+
+    FOR NO KEY UPDATE does not conflict with the key-share locks taken by
+    inserts referencing the user, so credits keep flowing while it is held.
+    Rows are locked in id order so concurrent callers cannot deadlock.
+    """
+    list(
+        User.objects.select_for_update(no_key=True)
+        .filter(pk__in=user_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def lock_balance(user):
+    lock_balances([user.pk])
+
+
+def post_entries(entries):
+    """
+    Append ledger entries given as (user_id, signed_amount, reason, reference).
+    """
+    return BalanceEntry.objects.bulk_create(
+        BalanceEntry(
+            user_id=user_id, amount=amount, reason=reason, reference=reference
+        )
+        for user_id, amount, reason, reference in entries
+    )
+
+
+def credit(user, amount, reason, reference=""):
+    return post_entries([(user.pk, amount, reason, reference)])[0]
+
+
+def debit(user, amount, reason, reference=""):
+    return post_entries([(user.pk, -amount, reason, reference)])[0]
+
+
+def apply_adjustments(adjustments, reason="ADJUSTMENT", stop_on_rejection=False):
+    """
+    Append one ledger entry per adjustment ({"user_id", "amount", "reference"})
+    and return a result per row. Unknown users and debits that would take a
+    balance below zero are rejected; everything else is written in one
+    bulk insert. Rows apply in order, so a credit covers the debits after
+    it. With `stop_on_rejection`, the rows after the first rejected one are
+    skipped and nothing is written. Call inside a transaction: debited users
+    stay locked.
+    """
+    adjustments = list(adjustments)
+    debited = {row["user_id"] for row in adjustments if row["amount"] < 0}
+    if debited:
+        lock_balances(debited)
+    # Only existing users have a balance
+    balances = get_balances({row["user_id"] for row in adjustments})
+
+    entries = []
+    results = []
+    rejected = False
+    for row in adjustments:
+        user_id, amount = row["user_id"], row["amount"]
+        result = {"user_id": user_id, "amount": str(amount), "status": "applied"}
+
+        if rejected and stop_on_rejection:
+            result["status"] = "skipped"
+        elif user_id not in balances:
+            result.update(status="rejected", error="User not found")
+        elif amount < 0 and balances[user_id] + amount < 0:
+            result.update(status="rejected", error="Insufficient balance")
+        else:
+            balances[user_id] += amount
+            entries.append((user_id, amount, reason, row.get("reference", "")))
+
+        rejected = rejected or result["status"] == "rejected"
+        results.append(result)
+
+    if not (rejected and stop_on_rejection):
+        post_entries(entries)
+    return results
+
+
+def roll_back_adjustments(results):
+    """
+    Mark the results of adjustments rolled back as a whole.
+    """
+    for result in results:
+        if result["status"] == "applied":
+            result["status"] = "rolled_back"
+    return results
+
+
+def compact_balances(batch_size=1000):
+    """
+    Fold every entry not compacted yet into one new snapshot per user and
+    drop the snapshots it supersedes. Entries are only flagged: they stay as
+    the audit trail. An entry committed while a batch runs, whatever its id,
+    is left for the next run. Returns the number of snapshots written.
+    """
+    pending_user_ids = list(
+        BalanceEntry.objects.filter(compacted=False)
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+
+    written = 0
+    for start in range(0, len(pending_user_ids), batch_size):
+        with transaction.atomic():
+            written += _compact(pending_user_ids[start : start + batch_size])
+    return written
+
+
+def _compact(user_ids):
+    # The lock makes a concurrent run wait for this one, then skip the
+    # entries it flagged
+    entries = list(
+        BalanceEntry.objects.select_for_update()
+        .filter(user_id__in=user_ids, compacted=False)
+        .order_by("id")
+        .values_list("id", "user_id", "amount")
+    )
+    totals, last_ids = defaultdict(lambda: ZERO), {}
+    for entry_id, user_id, amount in entries:
+        totals[user_id] += amount
+        last_ids[user_id] = entry_id
+    if not totals:
+        return 0
+
+    snapshots = [
+        BalanceSnapshot(
+            user_id=user_id,
+            balance=balance + totals[user_id],
+            last_entry_id=max(last_entry_id, last_ids[user_id]),
+        )
+        for user_id, balance, last_entry_id in _with_snapshot(
+            User.objects.filter(pk__in=totals)
+        ).values_list("pk", "snapshot_balance", "snapshot_entry_id")
+    ]
+    BalanceSnapshot.objects.filter(user_id__in=totals).delete()
+    BalanceSnapshot.objects.bulk_create(snapshots)
+    # Flag exactly the entries summed, never whatever matches the filter now
+    BalanceEntry.objects.filter(id__in=[entry[0] for entry in entries]).update(
+        compacted=True
+    )
+    return len(snapshots)
@@ -0,0 +1,227 @@
+import logging
+from bisect import insort
+from collections import defaultdict
+from copy import copy
+
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+
+from authapp.models import MarketData, UserStock
+from authapp.repositories.balance_ledger_repo import get_balance, lock_balance
+from authapp.repositories.buy_stock_repo import (
+    InsufficientLiquidity,
+    process_transactions,
+    update_user_stock_and_balance,
+)
+from authapp.repositories.price_level_repo import cutoff_from_levels, load_books
+from authapp.repositories.sell_stock_repo import (
+    process_sell_order,
+    t_plus_3_restricted_stocks,
+)
+from stocks.models import Stock
+
+logger = logging.getLogger(__name__)
+
+
+class OrderRejected(Exception):
+    pass
+
+
+class OrderBatch:
+    """
+    Place a user's batch of buy and sell orders in submission order.
+
+    Everything the orders are checked against is read, and every row they
+    may write is locked, up front in one ordered pass that follows the lock
+    order of a single buy: the balance, the sell orders the buys may match
+    (in stock, price, id order), then the user's and those sellers'
+    positions (in id order). The batch then keeps that state current in
+    memory as its own orders change it, and each order runs in its own
+    savepoint so that a failing one leaves the others intact. Call inside a
+    transaction.
+    """
+
+    def __init__(self, user, orders):
+        self.user = user
+        self.orders = orders
+
+    def load(self):
+        symbols = {order["stock"] for order in self.orders}
+        sold = {o["stock"] for o in self.orders if o["transaction_type"] == "SELL"}
+        bought = [o for o in self.orders if o["transaction_type"] == "BUY"]
+
+        self.stocks = Stock.objects.in_bulk(symbols)
+        self.balance = None
+        if bought:
+            lock_balance(self.user)
+            self.balance = get_balance(self.user)
+        self.books = self.lock_books(bought)
+
+        sellers = defaultdict(set)
+        for stock_id, book in self.books.items():
+            sellers[stock_id].update(sell_order.user_id for sell_order in book)
+        condition = Q(user=self.user, stock_id__in=list(self.stocks))
+        for stock_id, user_ids in sellers.items():
+            condition |= Q(stock_id=stock_id, user_id__in=user_ids)
+        self.positions = {
+            position.stock_id: position
+            for position in UserStock.objects.select_for_update()
+            .filter(condition)
+            .order_by("id")
+            if position.user_id == self.user.pk
+        }
+        self.restricted = t_plus_3_restricted_stocks(self.user, sold) if sold else set()
+
+    def lock_books(self, bought):
+        """
+        {stock_id: [sell orders]} of the stocks bought, cheapest first. The
+        price levels only bound the read: the locked orders are what the buys
+        fill from.
+        """
+        max_prices, quantities = {}, defaultdict(int)
+        for order in bought:
+            stock_id = order["stock"]
+            if stock_id not in self.stocks:
+                continue
+            max_prices[stock_id] = max(
+                order["price"], max_prices.get(stock_id, order["price"])
+            )
+            quantities[stock_id] += order["quantity"]
+
+        books = {stock_id: [] for stock_id in max_prices}
+        if not max_prices:
+            return books
+        condition = Q()
+        for stock_id, levels in load_books(max_prices).items():
+            cutoff = cutoff_from_levels(sorted(levels.items()), quantities[stock_id])
+            if cutoff is None:
+                cutoff = max_prices[stock_id]
+            condition |= Q(stock_id=stock_id, price__lte=cutoff)
+        for sell_order in (
+            MarketData.objects.select_for_update()
+            .filter(condition, transaction_type="SELL")
+            .order_by("stock_id", "price", "id")
+        ):
+            books[sell_order.stock_id].append(sell_order)
+        return books
+
+    def run(self, stop_on_rejection=False):
+        """
+        Place every order and return one result per order. With
+        `stop_on_rejection`, the orders after the first rejected one are
+        skipped.
+        """
+        self.load()
+        results = []
+        rejected = False
+        for index, order in enumerate(self.orders):
+            result = {
+                "index": index,
+                "stock": order["stock"],
+                "transaction_type": order["transaction_type"],
+                "quantity": order["quantity"],
+                "price": str(order["price"]),
+            }
+            results.append(result)
+            if rejected and stop_on_rejection:
+                result["status"] = "skipped"
+                continue
+
+            try:
+                with transaction.atomic():
+                    if order["transaction_type"] == "SELL":
+                        result.update(self.sell(order))
+                    else:
+                        result.update(self.buy(order))
+            except OrderRejected as exc:
+                result.update(status="rejected", error=str(exc))
+            except (ValueError, DatabaseError):
+                logger.exception(
+                    "Order %s of a batch of user %s failed", index, self.user.pk
+                )
+                result.update(status="rejected", error="Order could not be processed")
+            rejected = rejected or result["status"] == "rejected"
+        return results
+
+    def stock(self, order):
+        stock = self.stocks.get(order["stock"])
+        if stock is None:
+            raise OrderRejected("Stock not found")
+        return stock
+
+    def sell(self, order):
+        stock = self.stock(order)
+        quantity, price = order["quantity"], order["price"]
+        position = self.positions.get(stock.pk)
+        if position is None:
+            raise OrderRejected("User does not own this stock")
+        if position.quantity < quantity:
+            raise OrderRejected("Not enough stock to sell")
+        if stock.pk in self.restricted:
+            raise OrderRejected("Cannot sell stock before T+3")
+
+        sell_order = process_sell_order(position, stock, quantity, price)
+
+        # Only committed orders may change the in-memory state
+        position.quantity -= quantity
+        book = self.books.get(stock.pk)
+        if book is not None:
+            insort(book, sell_order, key=lambda o: (o.price, o.id))
+        return {"status": "placed"}
+
+    def buy(self, order):
+        stock = self.stock(order)
+        quantity, price = order["quantity"], order["price"]
+        if self.balance < price * quantity:
+            raise OrderRejected("Insufficient balance")
+        book = self.books[stock.pk]
+
+        # Fill copies, so a failing order leaves the book as it was
+        matched = [copy(sell_order) for sell_order in book if sell_order.price <= price]
+        try:
+            (
+                total_cost,
+                filled_quantity,
+                buyer_transactions,
+                seller_transactions,
+            ) = process_transactions(self.user, stock, quantity, price, matched)
+        except InsufficientLiquidity as exc:
+            raise OrderRejected(str(exc)) from exc
+        position = update_user_stock_and_balance(
+            self.user,
+            stock,
+            filled_quantity,
+            total_cost,
+            buyer_transactions,
+            seller_transactions,
+        )
+
+        self.balance -= total_cost
+        # Later sells in the batch see the shares, and the T+3 hold on them
+        self.positions[stock.pk] = position
+        self.restricted.add(stock.pk)
+        remaining = {sell_order.id: sell_order.quantity for sell_order in matched}
+        for sell_order in book:
+            sell_order.quantity = remaining.get(sell_order.id, sell_order.quantity)
+        book[:] = [sell_order for sell_order in book if sell_order.quantity]
+        return {
+            "status": "filled",
+            "total_cost": str(total_cost),
+            "transaction_ids": [t.id for t in buyer_transactions],
+        }
+
+
+def roll_back(results):
+    """
+    Mark the orders of a batch rolled back as a whole: nothing they placed
+    or filled, transactions included, was kept.
+    """
+    for result in results:
+        if result["status"] in ("placed", "filled"):
+            result["status"] = "rolled_back"
+            result.pop("transaction_ids", None)
+    return results
+
+
+def place_orders(user, orders, stop_on_rejection=False):
+    return OrderBatch(user, orders).run(stop_on_rejection)
@@ -1,101 +1,161 @@
 from django.utils import timezone
 
 from authapp.models import MarketData, Transaction, UserStock
+from authapp.repositories.balance_ledger_repo import (
+    get_balance,
+    lock_balance,
+    post_entries,
+)
+from authapp.repositories.market_listing_repo import update_listings
+from authapp.repositories.price_level_repo import cutoff_price, remove_fills
+
+
+NO_LIQUIDITY_ERROR = "Not enough matching sell orders on the market"
+
+
+class InsufficientLiquidity(Exception):
+    """
+    The locked sell orders hold fewer shares than the buy asked for.
+    """
 
 
 # Helper to validate the buyer's balance
 def validate_buyer_balance(user, total_cost):
-    if user.account_balance < total_cost:
+    # Held until the buy commits, so concurrent buys cannot overspend
+    lock_balance(user)
+    if get_balance(user) < total_cost:
         return {"error": "Insufficient balance"}
     return None
 
 
 # Helper to calculate total cost and validate market availability
 def validate_market_data(stock, price, quantity):
-    market_data_queryset = MarketData.objects.filter(
-        stock=stock, transaction_type="SELL", price__lte=price
-    ).order_by("price")
-
-    total_quantity_available = sum(m.quantity for m in market_data_queryset)
-    if total_quantity_available < quantity:
-        return {"error": "Not enough matching sell orders on the market"}, None
-
-    return None, market_data_queryset
+    """
+    Check the price levels for `quantity` shares at or below `price` and
+    return the sell orders to match, bounded to the cheapest levels that
+    cover the quantity.
+    """
+    cutoff = cutoff_price(stock, price, quantity)
+    if cutoff is None:
+        return {"error": NO_LIQUIDITY_ERROR}, None
+    return None, sell_orders_up_to(stock, cutoff)
+
+
+def sell_orders_up_to(stock, cutoff):
+    """
+    The sell orders at or below `cutoff`, cheapest first, locked in (price,
+    id) order so that concurrent buys cannot fill the same order twice.
+    """
+    return (
+        MarketData.objects.select_for_update()
+        .filter(stock=stock, transaction_type="SELL", price__lte=cutoff)
+        .order_by("price", "id")
+    )
 
 
 def process_transactions(user, stock, quantity, price, market_data_queryset):
+    """
+    Fill `quantity` from the cheapest sell orders. Writes are batched per
+    table, so the number of queries does not grow with the orders matched.
+
+    The price levels only tell where liquidity should be; the locked orders
+    decide. Raises InsufficientLiquidity, before writing anything, when they
+    cannot fill the whole quantity.
+    """
     total_cost = 0
-    initial_quantity = quantity
-    buyer_transactions = []
-    seller_transactions = []
+    fills = []
 
     for sell_order in market_data_queryset:
         quantity_to_buy = min(sell_order.quantity, quantity)
+        fills.append((sell_order, quantity_to_buy))
+        total_cost += quantity_to_buy * sell_order.price
+        quantity -= quantity_to_buy
+        if quantity == 0:
+            break
+    if quantity:
+        raise InsufficientLiquidity(NO_LIQUIDITY_ERROR)
+    filled_quantity = sum(filled for _, filled in fills)
 
-        # Create BUY transaction for buyer
-        buyer_transaction = Transaction.objects.create(
+    now = timezone.now()
+    buyer_transactions = Transaction.objects.bulk_create(
+        Transaction(
             user=user,
             stock=stock,
             transaction_type="BUY",
             quantity=quantity_to_buy,
             price=sell_order.price,
             status="COMPLETED",
-            transaction_date=timezone.now(),
+            transaction_date=now,
         )
-        buyer_transactions.append(buyer_transaction)
-
-        # Create SELL transaction for seller
-        seller_transaction = Transaction.objects.create(
-            user=sell_order.user,
+        for sell_order, quantity_to_buy in fills
+    )
+    seller_transactions = Transaction.objects.bulk_create(
+        Transaction(
+            user_id=sell_order.user_id,
             stock=stock,
             transaction_type="SELL",
             quantity=quantity_to_buy,
             price=sell_order.price,
             status="COMPLETED",
-            transaction_date=timezone.now(),
+            transaction_date=now,
         )
-        seller_transactions.append(seller_transaction)
+        for sell_order, quantity_to_buy in fills
+    )
 
-        # Update seller's UserStock
-        seller_stock = UserStock.objects.get(user=sell_order.user, stock=stock)
-        if seller_stock.sold_quantity < quantity_to_buy:
+    # Update sellers' UserStock. The buyer's position is locked in the same
+    # id-ordered pass, so buys and batches lock positions in one order.
+    seller_ids = {order.user_id for order, _ in fills}
+    seller_stocks = {
+        seller_stock.user_id: seller_stock
+        for seller_stock in UserStock.objects.select_for_update()
+        .filter(stock=stock, user_id__in=seller_ids | {user.pk})
+        .order_by("id")
+        if seller_stock.user_id in seller_ids
+    }
+    for sell_order, quantity_to_buy in fills:
+        seller_stock = seller_stocks.get(sell_order.user_id)
+        if seller_stock is None or seller_stock.sold_quantity < quantity_to_buy:
             raise ValueError("Sold quantity mismatch during transaction")
-
         seller_stock.sold_quantity -= quantity_to_buy
-        seller_stock.save()
+    UserStock.objects.bulk_update(seller_stocks.values(), ["sold_quantity"])
 
-        # Update sell order
+    # Update sell orders: every fill but the last one empties its order
+    filled_ids = []
+    for sell_order, quantity_to_buy in fills:
         sell_order.quantity -= quantity_to_buy
         if sell_order.quantity == 0:
-            sell_order.delete()
+            filled_ids.append(sell_order.id)
         else:
-            sell_order.save()
+            sell_order.save(update_fields=["quantity", "updated_at"])
+    MarketData.objects.filter(id__in=filled_ids).delete()
+    remove_fills(stock.pk, fills)
+    update_listings(fills)
 
-        total_cost += quantity_to_buy * sell_order.price
-        quantity -= quantity_to_buy
-        if quantity == 0:
-            break
-
-    return total_cost, initial_quantity, buyer_transactions, seller_transactions
+    return total_cost, filled_quantity, buyer_transactions, seller_transactions
 
 
-# Helper to update user stocks and balances after transactions
+# Helper to update user stocks and balances after transactions; returns the
+# buyer's updated UserStock
 def update_user_stock_and_balance(
-    user, stock, initial_quantity, total_cost, buyer_transactions, seller_transactions
+    user, stock, filled_quantity, total_cost, buyer_transactions, seller_transactions
 ):
     # Update buyer stock
     user_stock, created = UserStock.objects.get_or_create(
         user=user, stock=stock, defaults={"quantity": 0, "sold_quantity": 0}
     )
-    user_stock.quantity += initial_quantity
+    user_stock.quantity += filled_quantity
     user_stock.save()
 
-    # Decrease buyer's balance
-    user.account_balance -= total_cost
-    user.save()
-
-    # Update seller stocks and balances
-    for transaction in seller_transactions:
-        seller = transaction.user
-        seller.account_balance += transaction.quantity * transaction.price
-        seller.save()
+    # Append ledger entries: debit the buyer, credit every seller
+    entries = [(user.pk, -total_cost, "BUY", f"stock:{stock.id}")]
+    entries.extend(
+        (
+            transaction.user_id,
+            transaction.quantity * transaction.price,
+            "SELL",
+            f"transaction:{transaction.id}",
+        )
+        for transaction in seller_transactions
+    )
+    post_entries(entries)
+    return user_stock
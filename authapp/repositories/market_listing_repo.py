@@ -0,0 +1,77 @@
+from django.db import connection
+
+from authapp.models import MarketListing
+
+
+INSERT_SQL = (
+    "INSERT INTO authapp_marketlisting (order_id, user_id, username, stock_id, "
+    "quantity, price, transaction_date, updated_at) "
+    "SELECT %s, id, username, %s, %s, %s, %s, %s FROM authapp_user WHERE id = %s"
+)
+
+REBUILD_SQL = (
+    "INSERT INTO authapp_marketlisting (order_id, user_id, username, stock_id, "
+    "quantity, price, transaction_date, updated_at) "
+    "SELECT m.id, m.user_id, u.username, m.stock_id, m.quantity, m.price, "
+    "m.transaction_date, m.updated_at "
+    "FROM authapp_marketdata m JOIN authapp_user u ON u.id = m.user_id "
+    "WHERE m.transaction_type = 'SELL' {where}"
+)
+
+
+def add_listing(sell_order):
+    """
+    List a new sell order. The seller's username is copied in the same
+    statement, so it costs no extra round trip.
+    """
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.execute(
+            INSERT_SQL,
+            [
+                sell_order.id,
+                sell_order.stock_id,
+                sell_order.quantity,
+                sell_order.price,
+                adapt(sell_order.transaction_date),
+                adapt(sell_order.updated_at),
+                sell_order.user_id,
+            ],
+        )
+
+
+def update_listings(fills):
+    """
+    Apply the `fills` ((sell_order, quantity) pairs, with `sell_order.quantity`
+    already reduced) of a buy: emptied orders are unlisted, a partly filled
+    one keeps its listing with the remaining quantity.
+    """
+    filled_ids = [order.id for order, _ in fills if order.quantity == 0]
+    if filled_ids:
+        MarketListing.objects.filter(order_id__in=filled_ids).delete()
+    for order, _ in fills:
+        if order.quantity:
+            MarketListing.objects.filter(order_id=order.id).update(
+                quantity=order.quantity, updated_at=order.updated_at
+            )
+
+
+def rebuild_market_listings(cursor, stock_ids=None):
+    """
+    Recompute the listings of `stock_ids` (every stock by default) from the
+    open sell orders, for bulk loads that bypass the trading paths.
+    """
+    in_stocks, params = "", []
+    if stock_ids is not None:
+        params = list(stock_ids)
+        if not params:
+            return
+        in_stocks = "stock_id IN ({})".format(", ".join(["%s"] * len(params)))
+    cursor.execute(
+        "DELETE FROM authapp_marketlisting"
+        + (f" WHERE {in_stocks}" if in_stocks else ""),
+        params,
+    )
+    cursor.execute(
+        REBUILD_SQL.format(where=f"AND m.{in_stocks}" if in_stocks else ""), params
+    )
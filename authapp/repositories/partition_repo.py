@@ -0,0 +1,167 @@
+import gzip
+import os
+import re
+from datetime import date
+
+from django.db import connection, transaction
+
+from utils.pg_copy import copy_to
+
+
+# Ledger tables that are range-partitioned by month on `transaction_date`
+PARTITIONED_TABLES = {
+    "transaction": ("authapp_transaction", "transaction_date"),
+    "marketdata": ("authapp_marketdata", "transaction_date"),
+}
+
+PARTITIONED_COLUMNS = dict(PARTITIONED_TABLES.values())
+
+PARTITION_NAME_RE = re.compile(r"_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(name):
+    """
+    Return the first day of the month covered by a monthly partition, or None
+    for partitions that do not follow the naming scheme (e.g. the default one).
+    """
+    match = PARTITION_NAME_RE.search(name)
+    if not match:
+        return None
+    return date(int(match["year"]), int(match["month"]), 1)
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        "SELECT c.relkind FROM pg_class c "
+        "WHERE c.oid = to_regclass(%s)",
+        [table],
+    )
+    row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions(cursor, table):
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s) "
+        "ORDER BY child.relname",
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def create_monthly_partition(cursor, table, month):
+    """
+    Create the partition covering `month` if it does not exist yet.
+
+    Postgres refuses to create it while the default partition holds rows of
+    that month, so those rows are moved: the default partition is detached,
+    the new one created, the rows reinserted through the parent and the
+    default partition attached again, in one transaction.
+    """
+    name = partition_name(table, month)
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+    default = default_partition_name(table)
+    column = PARTITIONED_COLUMNS[table]
+
+    cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [name, default])
+    exists, has_default = (value is not None for value in cursor.fetchone())
+    if exists:
+        return name
+    in_month = f"WHERE {column} >= %s AND {column} < %s"
+    if not has_default or not partition_has_rows(cursor, default, in_month, bounds):
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        return name
+
+    with transaction.atomic():
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        cursor.execute(
+            f"INSERT INTO {table} SELECT * FROM {default} {in_month}", bounds
+        )
+        cursor.execute(f"DELETE FROM {default} {in_month}", bounds)
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+    return name
+
+
+def default_partition_months(cursor, table, column, before):
+    """
+    The months before `before` that have rows in the default partition.
+    """
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', {column})::date "
+        f"FROM {default_partition_name(table)} WHERE {column} < %s ORDER BY 1",
+        [before.isoformat()],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_monthly_partitions(cursor, table, start, end):
+    """
+    Make sure a partition exists for every month in [start, end].
+    """
+    created = []
+    month = month_start(start)
+    while month <= end:
+        created.append(create_monthly_partition(cursor, table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def partition_has_rows(cursor, name, where="", params=None):
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {name} {where})", params)
+    return cursor.fetchone()[0]
+
+
+def archive_partition(table, name, archive_dir):
+    """
+    Dump `name` to `<archive_dir>/<name>.csv.gz`, then detach and drop it.
+
+    Old partitions no longer receive writes, so the dump runs before the
+    detach and the parent is only locked for the short detach/drop step.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+
+    try:
+        with connection.cursor() as cursor, gzip.open(tmp_path, "wb") as fileobj:
+            copy_to(
+                cursor, f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", fileobj
+            )
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+
+    return path
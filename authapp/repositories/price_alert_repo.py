@@ -0,0 +1,64 @@
+from django.db.models import Case, DecimalField, Value, When
+from django.utils import timezone
+
+from authapp.models import PriceAlert
+from stocks.models import Stock
+
+
+TRIGGER_BATCH_SIZE = 1000
+LOAD_CHUNK_SIZE = 10000
+
+
+def active_alerts():
+    """
+    (id, stock_id, direction, threshold, reference_price) of every active
+    alert.
+    """
+    return (
+        PriceAlert.objects.filter(is_active=True)
+        .values_list("id", "stock_id", "direction", "threshold", "reference_price")
+        .iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+
+
+def changed_alerts(since):
+    """
+    (id, stock_id, direction, threshold, reference_price, is_active) of the
+    alerts created, cancelled or triggered since `since`.
+    """
+    return (
+        PriceAlert.objects.filter(updated_at__gte=since)
+        .values_list(
+            "id", "stock_id", "direction", "threshold", "reference_price", "is_active"
+        )
+        .iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+
+
+def current_prices(symbols):
+    return dict(
+        Stock.objects.filter(pk__in=symbols).values_list("id", "marketPrice")
+    )
+
+
+def trigger_alerts(triggered, batch_size=TRIGGER_BATCH_SIZE):
+    """
+    Mark the alerts in `triggered` ({alert_id: price}) as triggered, one
+    UPDATE per `batch_size` alerts. Alerts cancelled in the meantime are left
+    alone. Returns the number of alerts updated.
+    """
+    now = timezone.now()
+    alert_ids = list(triggered)
+    updated = 0
+    for start in range(0, len(alert_ids), batch_size):
+        batch = alert_ids[start : start + batch_size]
+        updated += PriceAlert.objects.filter(pk__in=batch, is_active=True).update(
+            is_active=False,
+            triggered_at=now,
+            triggered_price=Case(
+                *(When(pk=pk, then=Value(triggered[pk])) for pk in batch),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            ),
+            updated_at=now,
+        )
+    return updated
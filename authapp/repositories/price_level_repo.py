@@ -0,0 +1,168 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import (
+    Case,
+    DecimalField,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from stocks.models import PriceLevel
+
+
+UPSERT_SQL = (
+    "INSERT INTO stocks_pricelevel (stock_id, price, quantity, orders) "
+    "VALUES (%s, %s, %s, 1) "
+    "ON CONFLICT (stock_id, price) DO UPDATE SET "
+    "quantity = stocks_pricelevel.quantity + EXCLUDED.quantity, "
+    "orders = stocks_pricelevel.orders + 1"
+)
+
+REBUILD_SQL = (
+    "INSERT INTO stocks_pricelevel (stock_id, price, quantity, orders) "
+    "SELECT stock_id, price, SUM(quantity), COUNT(*) FROM authapp_marketdata "
+    "WHERE transaction_type = 'SELL' {where}"
+    "GROUP BY stock_id, price"
+)
+
+
+def add_sell_order(stock_id, price, quantity):
+    """
+    Add a new sell order to its price level, creating the level if needed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL, [stock_id, price, quantity])
+
+
+def remove_fills(stock_id, fills):
+    """
+    Take the `fills` ((sell_order, quantity) pairs, with `sell_order.quantity`
+    already reduced) of a buy off the price levels in one UPDATE: every
+    filled share, plus one order per sell order emptied. Levels left empty
+    are deleted.
+    """
+    shares, orders = defaultdict(int), defaultdict(int)
+    for sell_order, quantity in fills:
+        shares[sell_order.price] += quantity
+        if sell_order.quantity == 0:
+            orders[sell_order.price] += 1
+    if not shares:
+        return
+
+    levels = PriceLevel.objects.filter(stock_id=stock_id, price__in=list(shares))
+    levels.update(
+        quantity=F("quantity")
+        - Case(*(When(price=price, then=Value(n)) for price, n in shares.items())),
+        orders=F("orders")
+        - Case(
+            *(When(price=price, then=Value(n)) for price, n in orders.items()),
+            default=Value(0),
+        ),
+    )
+    if orders:
+        levels.filter(quantity=0).delete()
+
+
+def cutoff_from_levels(levels, quantity):
+    """
+    The price of the first of `levels` ((price, quantity) pairs, cheapest
+    first) at which their cumulative quantity reaches `quantity`, or None.
+    """
+    available = 0
+    for level_price, level_quantity in levels:
+        available += level_quantity
+        if available >= quantity:
+            return level_price
+    return None
+
+
+def cutoff_price(stock, price, quantity):
+    """
+    The lowest price at or below `price` up to which the levels of `stock`
+    hold `quantity` shares, or None when they hold fewer.
+    """
+    levels = (
+        PriceLevel.objects.filter(stock=stock, price__lte=price)
+        .order_by("price")
+        .values_list("price", "quantity")
+    )
+    return cutoff_from_levels(levels, quantity)
+
+
+def load_books(max_prices):
+    """
+    {stock_id: {price: quantity}} of the levels at or below `max_prices`
+    ({stock_id: price}), in one query.
+    """
+    books = {stock_id: {} for stock_id in max_prices}
+    if not max_prices:
+        return books
+    condition = Q()
+    for stock_id, price in max_prices.items():
+        condition |= Q(stock_id=stock_id, price__lte=price)
+    for stock_id, price, quantity in PriceLevel.objects.filter(condition).values_list(
+        "stock_id", "price", "quantity"
+    ):
+        books[stock_id][price] = quantity
+    return books
+
+
+def ask_levels(stock, levels):
+    """
+    The `levels` cheapest price levels of `stock`.
+    """
+    return list(
+        PriceLevel.objects.filter(stock=stock)
+        .order_by("price")
+        .values("price", "quantity", "orders")[:levels]
+    )
+
+
+def with_top_of_book(queryset):
+    """
+    Annotate stocks with `best_ask` and `total_ask_size` as subqueries, so a
+    list of stocks stays a single query.
+    """
+    levels = PriceLevel.objects.filter(stock=OuterRef("pk"))
+    return queryset.annotate(
+        best_ask=Subquery(
+            levels.order_by("price").values("price")[:1],
+            output_field=DecimalField(max_digits=20, decimal_places=2),
+        ),
+        total_ask_size=Coalesce(
+            Subquery(
+                levels.order_by()
+                .values("stock")
+                .annotate(total=Sum("quantity"))
+                .values("total")
+            ),
+            0,
+        ),
+    )
+
+
+def rebuild_price_levels(cursor, stock_ids=None):
+    """
+    Recompute the price levels of `stock_ids` (every stock by default) from
+    the open sell orders, for bulk loads that bypass the trading paths.
+    """
+    in_stocks, params = "", []
+    if stock_ids is not None:
+        params = list(stock_ids)
+        if not params:
+            return
+        in_stocks = "stock_id IN ({})".format(", ".join(["%s"] * len(params)))
+    cursor.execute(
+        "DELETE FROM stocks_pricelevel" + (f" WHERE {in_stocks}" if in_stocks else ""),
+        params,
+    )
+    cursor.execute(
+        REBUILD_SQL.format(where=f"AND {in_stocks} " if in_stocks else ""), params
+    )
@@ -1,10 +1,16 @@
 from authapp.models import MarketData, UserStock
+from authapp.repositories.market_listing_repo import add_listing
+from authapp.repositories.price_level_repo import add_sell_order
 from datetime import timedelta
 from django.utils import timezone
 from django.db.models import Min, F
 from django.db import transaction
 
 
+# Shares bought can only be sold this long after the first purchase
+SETTLEMENT_DELAY = timedelta(days=3)
+
+
 def fetch_user_stock(user, stock):
     """
     Fetch the UserStock object and lock it for update.
@@ -30,14 +36,31 @@ def is_t_plus_3_restricted(user, stock):
         user=user, stock=stock, transaction_type="BUY"
     ).aggregate(purchase_date=Min("transaction_date"))["purchase_date"]
 
-    if purchase_date and timezone.now() < purchase_date + timedelta(days=3):
+    if purchase_date and timezone.now() < purchase_date + SETTLEMENT_DELAY:
         return True
     return False
 
 
+def t_plus_3_restricted_stocks(user, stock_ids):
+    """
+    The ids among `stock_ids` that `user` cannot sell yet, in one query.
+    """
+    now = timezone.now()
+    return {
+        row["stock_id"]
+        for row in MarketData.objects.filter(
+            user=user, stock_id__in=stock_ids, transaction_type="BUY"
+        )
+        .values("stock_id")
+        .annotate(purchase_date=Min("transaction_date"))
+        if now < row["purchase_date"] + SETTLEMENT_DELAY
+    }
+
+
 def process_sell_order(user_stock, stock, quantity, price):
     """
-    Update UserStock and create a sell order in MarketData.
+    Update UserStock, create a sell order in MarketData and add it to its
+    price level and to the listings. Returns the sell order.
     """
     with transaction.atomic():
         UserStock.objects.filter(id=user_stock.id).update(
@@ -45,11 +68,14 @@ def process_sell_order(user_stock, stock, quantity, price):
             sold_quantity=F("sold_quantity") + quantity,
         )
 
-        MarketData.objects.create(
-            user=user_stock.user,
+        sell_order = MarketData.objects.create(
+            user_id=user_stock.user_id,
             stock=stock,
             transaction_type="SELL",
             quantity=quantity,
             price=price,
             transaction_date=timezone.now(),
         )
+        add_sell_order(stock.pk, price, quantity)
+        add_listing(sell_order)
+    return sell_order
@@ -0,0 +1,75 @@
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+EXPORT_FIELDS = [
+    "id",
+    "stock_id",
+    "transaction_type",
+    "quantity",
+    "price",
+    "transaction_date",
+    "status",
+]
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def iter_transaction_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield transactions as plain dicts, reading the queryset in server-side chunks.
+    """
+    return (
+        queryset.order_by("transaction_date", "id")
+        .values(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def stream_ndjson(rows):
+    """
+    Encode rows as newline-delimited JSON, one line per row.
+    """
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = encoder.encode(row)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= EXPORT_FLUSH_BYTES:
+            yield "\n".join(lines) + "\n"
+            lines = []
+            size = 0
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def stream_csv(rows):
+    """
+    Encode rows as CSV with a header line, reusing one small buffer.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+    "csv": (stream_csv, "text/csv"),
+}
@@ -1,8 +1,16 @@
 from django.utils import timezone
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
 
 from stocks.serializers import StockSerializer
 
+from .claims import claims_version
+from .permission_registry import registry
+from .token_blacklist import FilteredRefreshToken
+from .repositories.balance_ledger_repo import balance_of, get_balance
 from .models import (
     User,
     Role,
@@ -11,6 +19,8 @@ from .models import (
     RolePermission,
     Order,
     MarketData,
+    MarketListing,
+    PriceAlert,
     Transaction,
     UserStock,
 )
@@ -51,6 +61,29 @@ class SignUpSerializer(serializers.ModelSerializer):
         return user
 
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Embed the role and the user's claims version in issued tokens, so
+    ClaimsJWTAuthentication can authenticate requests without a user query.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["role_id"] = user.role_id
+        token["role"] = registry.role_name(user)
+        token["claims_version"] = claims_version(user.pk)
+        return token
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Check the refresh token against the in-memory blacklist filter.
+    """
+
+    token_class = FilteredRefreshToken
+
+
 class UserStockFollowedSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     # stock = serializers.StringRelatedField()
@@ -88,6 +121,26 @@ class AddMoneySerializer(serializers.Serializer):
         return value
 
 
+class BalanceAdjustmentSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=20, decimal_places=2)
+    reference = serializers.CharField(
+        max_length=255, required=False, allow_blank=True, default=""
+    )
+
+    def validate_amount(self, value):
+        if value == 0:
+            raise serializers.ValidationError("Amount must not be zero.")
+        return value
+
+
+class BulkBalanceAdjustmentSerializer(serializers.Serializer):
+    adjustments = BalanceAdjustmentSerializer(
+        many=True, allow_empty=False, max_length=10000
+    )
+    all_or_nothing = serializers.BooleanField(default=False)
+
+
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
@@ -124,6 +177,24 @@ class TransactionSerializer(serializers.ModelSerializer):
         ]
 
 
+class BatchOrderSerializer(serializers.Serializer):
+    # A plain symbol: the batch checks every stock in one query
+    stock = serializers.CharField(max_length=255)
+    transaction_type = serializers.ChoiceField(choices=["BUY", "SELL"])
+    quantity = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=20, decimal_places=2)
+
+    def validate_price(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Price must be a positive number.")
+        return value
+
+
+class BatchOrdersSerializer(serializers.Serializer):
+    orders = BatchOrderSerializer(many=True, allow_empty=False, max_length=100)
+    all_or_nothing = serializers.BooleanField(default=False)
+
+
 class MarketDataSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source="user.username", read_only=True)
 
@@ -140,6 +211,15 @@ class MarketDataSerializer(serializers.ModelSerializer):
         ]
 
 
+class MarketListingSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="order_id", read_only=True)
+    transaction_type = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = MarketListing
+        fields = MarketDataSerializer.Meta.fields
+
+
 class UserStockSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source="user.username", read_only=True)
 
@@ -148,6 +228,33 @@ class UserStockSerializer(serializers.ModelSerializer):
         fields = ["id", "user_id", "username", "stock", "quantity", "sold_quantity"]
 
 
+class PriceAlertSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceAlert
+        fields = [
+            "id",
+            "stock",
+            "direction",
+            "threshold",
+            "reference_price",
+            "is_active",
+            "triggered_at",
+            "triggered_price",
+            "created_at",
+        ]
+        read_only_fields = [
+            "reference_price",
+            "is_active",
+            "triggered_at",
+            "triggered_price",
+        ]
+
+    def validate_threshold(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Threshold must be a positive number.")
+        return value
+
+
 class BuyStockSerializer(serializers.Serializer):
     stock_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
@@ -159,6 +266,7 @@ class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
     stocks_owned = UserStockSerializer(source="userstock_set", many=True)
     user_stocks_followed = UserStockFollowedSerializer(many=True, read_only=True)
+    account_balance = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -173,6 +281,12 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id"]
 
+    def get_account_balance(self, obj):
+        # Lists annotate the balance with with_balances() instead
+        if hasattr(obj, "entries_total"):
+            return f"{balance_of(obj):.2f}"
+        return f"{get_balance(obj):.2f}"
+
 
 class SellStockSerializer(serializers.Serializer):
     stock_id = serializers.CharField(max_length=255)
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save
+
+from .claims import invalidate_claims
+from .models import Permission, Role, RolePermission, User
+from .permission_registry import registry
+
+USER_CLAIM_UPDATE_FIELDS = {"role", "role_id", "is_active"}
+
+
+def invalidate_permission_registry(sender, **kwargs):
+    registry.invalidate()
+
+
+def invalidate_user_claims(sender, instance, created, update_fields=None, **kwargs):
+    # Sends the user's earlier tokens back to the database lookup, which sees
+    # the new role and rejects inactive users; other users' tokens are not
+    # affected. Queryset update() bypasses this: call invalidate_claims()
+    # for each user after one.
+    if (
+        not created
+        and (update_fields is None or USER_CLAIM_UPDATE_FIELDS & set(update_fields))
+        and instance.claims_changed()
+    ):
+        invalidate_claims(instance.pk)
+    instance._loaded_claims = instance.claim_values()
+
+
+def invalidate_deleted_user_claims(sender, instance, **kwargs):
+    # Tokens of a deleted user must fail the lookup instead of building a user
+    invalidate_claims(instance.pk)
+
+
+for model in (Role, Permission, RolePermission):
+    post_save.connect(invalidate_permission_registry, sender=model)
+    post_delete.connect(invalidate_permission_registry, sender=model)
+
+post_save.connect(invalidate_user_claims, sender=User)
+post_delete.connect(invalidate_deleted_user_claims, sender=User)
@@ -1,3 +1,1019 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase
+
+from stocks.models import PriceLevel, Stock
+from utils.log_handlers import (
+    AsyncHandler,
+    RateLimitFilter,
+    SamplingFilter,
+    dropped_records,
+)
+from utils.metrics import render_prometheus
+from utils.server_timing import QueryBudgetExceeded
+from utils.testing import PASSWORD, QUERY_COUNT_TEST_SETTINGS, QueryCountTestMixin
+
+from .authentication import ClaimsJWTAuthentication
+from .checks import shared_cache_check
+from .models import (
+    BalanceEntry,
+    BalanceSnapshot,
+    MarketData,
+    MarketListing,
+    Permission,
+    PriceAlert,
+    Role,
+    RolePermission,
+    Transaction,
+    User,
+    UserStock,
+)
+from .permission_registry import PermissionRegistry
+from .price_alerts import PriceAlertEvaluator
+from .serializers import (
+    ClaimsTokenObtainPairSerializer,
+    MarketDataSerializer,
+    TransactionSerializer,
+    UserSerializer,
+)
+from .repositories.balance_ledger_repo import (
+    ZERO,
+    apply_adjustments,
+    compact_balances,
+    credit,
+    debit,
+    get_balance,
+    get_balances,
+    with_balances,
+)
+from .repositories.buy_stock_repo import validate_buyer_balance, validate_market_data
+from .repositories.market_listing_repo import rebuild_market_listings
+from .repositories.partition_repo import (
+    add_months,
+    create_monthly_partition,
+    partition_month,
+    partition_name,
+)
+from .repositories.price_level_repo import rebuild_price_levels
+from .repositories.sell_stock_repo import fetch_user_stock, is_t_plus_3_restricted
+from .views import PriceAlertViewSet
+
 
 # Create your tests here.
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans are Postgres specific")
+class TradingQueryPlanTests(TestCase):
+    """
+    Run EXPLAIN on the trading hot paths over a seeded data set and fail when
+    a plan falls back to a sequential scan of one of the big tables.
+    """
+
+    STOCKS = 50
+    USERS = 200
+    ROWS = 20000
+    BIG_TABLES = [
+        "authapp_marketdata",
+        "authapp_transaction",
+        "authapp_userstock",
+        "stocks_pricelevel",
+        "authapp_marketlisting",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(28)
+        now = timezone.now()
+
+        role = Role.objects.create(name="User")
+        cls.stocks = Stock.objects.bulk_create(
+            Stock(
+                id=f"S{i:03d}",
+                name=f"Stock {i}",
+                marketPrice=Decimal("10.00"),
+                sectionIndex="TEST",
+                details={},
+            )
+            for i in range(cls.STOCKS)
+        )
+        cls.users = User.objects.bulk_create(
+            User(username=f"user{i}", password="!", role=role)
+            for i in range(cls.USERS)
+        )
+
+        UserStock.objects.bulk_create(
+            UserStock(user=user, stock=stock, quantity=100)
+            for user in cls.users
+            for stock in rng.sample(cls.stocks, 10)
+        )
+        MarketData.objects.bulk_create(
+            MarketData(
+                user=rng.choice(cls.users),
+                stock=rng.choice(cls.stocks),
+                quantity=rng.randint(1, 100),
+                price=Decimal(rng.randint(100, 10000)) / 100,
+                transaction_type="SELL" if i % 4 else "BUY",
+                transaction_date=now - timedelta(minutes=i),
+            )
+            for i in range(cls.ROWS)
+        )
+        Transaction.objects.bulk_create(
+            Transaction(
+                user=rng.choice(cls.users),
+                stock=rng.choice(cls.stocks),
+                transaction_type=rng.choice(["BUY", "SELL"]),
+                quantity=rng.randint(1, 100),
+                price=Decimal(rng.randint(100, 10000)) / 100,
+                status="COMPLETED",
+            )
+            for _ in range(cls.ROWS)
+        )
+
+        with connection.cursor() as cursor:
+            rebuild_price_levels(cursor)
+            rebuild_market_listings(cursor)
+            for table in cls.BIG_TABLES:
+                cursor.execute(f"ANALYZE {table}")
+
+    def explain_plans(self, func):
+        """
+        Capture the SELECTs issued by `func` and return their EXPLAIN output.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            func()
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in captured.captured_queries:
+                if not query["sql"].lstrip().upper().startswith("SELECT"):
+                    continue
+                cursor.execute(f"EXPLAIN {query['sql']}")
+                plans.append("\n".join(row[0] for row in cursor.fetchall()))
+        return plans
+
+    def assertNoSeqScan(self, func):
+        plans = self.explain_plans(func)
+        self.assertTrue(plans, "No SELECT was captured")
+        pattern = re.compile(r"Seq Scan on (%s)\w*" % "|".join(self.BIG_TABLES))
+        for plan in plans:
+            self.assertIsNone(pattern.search(plan), plan)
+
+    def test_sell_book_lookup_uses_index(self):
+        stock = self.stocks[0]
+        self.assertNoSeqScan(
+            lambda: list(validate_market_data(stock, Decimal("20.00"), 1)[1])
+        )
+
+    def test_market_listing_uses_index(self):
+        listings = MarketListing.objects.filter(stock=self.stocks[0])
+        self.assertNoSeqScan(lambda: list(listings.order_by("price")[:10]))
+        self.assertNoSeqScan(lambda: list(listings.order_by("-updated_at")[:10]))
+
+    def test_t_plus_3_check_uses_index(self):
+        self.assertNoSeqScan(
+            lambda: is_t_plus_3_restricted(self.users[0], self.stocks[0])
+        )
+
+    def test_user_stock_lookup_uses_index(self):
+        self.assertNoSeqScan(lambda: fetch_user_stock(self.users[0], self.stocks[0]))
+
+    def test_transaction_history_uses_index(self):
+        self.assertNoSeqScan(
+            lambda: list(
+                Transaction.objects.filter(user=self.users[0]).order_by(
+                    "-transaction_date", "-id"
+                )[:21]
+            )
+        )
+
+
+@override_settings(**QUERY_COUNT_TEST_SETTINGS)
+class AuthappQueryCountTests(QueryCountTestMixin, APITestCase):
+    """
+    Every authapp endpoint runs a fixed number of queries, whatever the
+    number of positions, follows, sell orders or permissions involved.
+    """
+
+    def test_signup(self):
+        response = self.assertMaxQueries(
+            3,
+            self.client.post,
+            "/api/signup/",
+            {"username": "newcomer", "password": PASSWORD},
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_token_obtain(self):
+        response = self.assertMaxQueries(
+            3,
+            self.client.post,
+            "/api/token/",
+            {"username": "trader", "password": PASSWORD},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_refresh(self):
+        refresh = self.client.post(
+            "/api/token/", {"username": "trader", "password": PASSWORD}
+        ).data["refresh"]
+        response = self.assertMaxQueries(
+            12, self.client.post, "/api/token/refresh/", {"refresh": refresh}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_add_money(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            3,
+            self.client.put,
+            f"/api/accounts/{self.data.sellers[0].pk}/add-money/",
+            {"amount": "10.00"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_adjust(self):
+        self.authenticate(self.data.admin)
+        adjustments = [
+            {"user_id": seller.pk, "amount": "5.00"} for seller in self.data.sellers
+        ]
+        adjustments.append({"user_id": self.data.trader.pk, "amount": "-5.00"})
+        response = self.assertMaxQueries(
+            6,
+            self.client.post,
+            "/api/accounts/bulk-adjust/",
+            {"adjustments": adjustments},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_roles_list(self):
+        self.authenticate(self.data.admin)
+        response = self.assertMaxQueries(2, self.client.get, "/api/roles/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_permissions_list(self):
+        self.authenticate(self.data.admin)
+        response = self.assertMaxQueries(2, self.client.get, "/api/permissions/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_role_permissions_list(self):
+        self.authenticate(self.data.admin)
+        response = self.assertMaxQueries(2, self.client.get, "/api/role-permissions/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_transactions_list(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(1, self.client.get, "/api/transactions/")
+        self.assertEqual(response.status_code, 200)
+        self.assertListMatchesSerializer(
+            "/api/transactions/", TransactionSerializer, Transaction.objects.all()
+        )
+
+    def test_transactions_export(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            1, self.client.get, "/api/transactions/export/"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_sell(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            11,
+            self.client.post,
+            "/api/transactions/sell/",
+            {
+                "stock": self.data.stocks[1].pk,
+                "quantity": 10,
+                "price": "12.00",
+                "transaction_type": "SELL",
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(
+                PriceLevel.objects.filter(stock=self.data.stocks[1]).values_list(
+                    "price", "quantity", "orders"
+                )
+            ),
+            [(Decimal("12.00"), 10, 1)],
+        )
+        self.assertEqual(
+            list(
+                MarketListing.objects.filter(stock=self.data.stocks[1]).values_list(
+                    "username", "quantity", "price"
+                )
+            ),
+            [("trader", 10, Decimal("12.00"))],
+        )
+
+    def test_buy_matching_every_sell_order(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            18,
+            self.client.post,
+            "/api/transactions/buy/",
+            {
+                "stock": self.data.book_stock.pk,
+                "quantity": 10 * self.FANOUT,
+                "price": "10.00",
+                "transaction_type": "BUY",
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["buyer_transactions"]), self.FANOUT)
+        # The sweep emptied the only price level of the book and every listing
+        self.assertFalse(PriceLevel.objects.filter(stock=self.data.book_stock).exists())
+        self.assertFalse(
+            MarketListing.objects.filter(stock=self.data.book_stock).exists()
+        )
+
+    def test_buy_rejects_levels_without_orders(self):
+        # A price level the sell orders do not back must not fill the buy
+        stock = self.data.stocks[1]
+        PriceLevel.objects.create(stock=stock, price="10.00", quantity=10, orders=1)
+        transactions = Transaction.objects.count()
+        self.authenticate(self.data.trader)
+        response = self.client.post(
+            "/api/transactions/buy/",
+            {
+                "stock": stock.pk,
+                "quantity": 10,
+                "price": "10.00",
+                "transaction_type": "BUY",
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            UserStock.objects.get(user=self.data.trader, stock=stock).quantity, 100
+        )
+        self.assertEqual(Transaction.objects.count(), transactions)
+
+    def batch_orders(self, **extra):
+        return {
+            "orders": [
+                {
+                    "stock": self.data.stocks[1].pk,
+                    "transaction_type": "SELL",
+                    "quantity": 10,
+                    "price": "12.00",
+                },
+                {
+                    "stock": self.data.book_stock.pk,
+                    "transaction_type": "BUY",
+                    "quantity": 10 * self.FANOUT,
+                    "price": "10.00",
+                },
+                {
+                    "stock": "UNKNOWN",
+                    "transaction_type": "BUY",
+                    "quantity": 1,
+                    "price": "10.00",
+                },
+            ],
+            **extra,
+        }
+
+    def test_batch_best_effort(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            33,
+            self.client.post,
+            "/api/transactions/batch/",
+            self.batch_orders(),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["placed", "filled", "rejected"],
+        )
+        self.assertEqual(response.data["accepted"], 2)
+        self.assertEqual(
+            len(response.data["results"][1]["transaction_ids"]), self.FANOUT
+        )
+        listings = MarketListing.objects.filter(stock=self.data.stocks[1])
+        self.assertTrue(listings.exists())
+
+    def test_batch_all_or_nothing(self):
+        self.authenticate(self.data.trader)
+        response = self.client.post(
+            "/api/transactions/batch/",
+            self.batch_orders(all_or_nothing=True),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data["committed"])
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["rolled_back", "rolled_back", "rejected"],
+        )
+        self.assertNotIn("transaction_ids", response.data["results"][1])
+        self.assertEqual(response.data["results"][2]["error"], "Stock not found")
+        # The sell and the buy were rolled back with the batch
+        listings = MarketListing.objects.filter(stock=self.data.stocks[1])
+        self.assertFalse(listings.exists())
+        self.assertEqual(
+            MarketListing.objects.filter(stock=self.data.book_stock).count(),
+            self.FANOUT,
+        )
+
+    def test_batch_sell_after_buy_is_held_by_t_plus_3(self):
+        self.authenticate(self.data.trader)
+        buy = dict(self.batch_orders()["orders"][1], quantity=1)
+        orders = [buy, dict(buy, transaction_type="SELL")]
+        position = UserStock.objects.filter(
+            user=self.data.trader, stock=self.data.book_stock
+        )
+        for held_before in (True, False):
+            if not held_before:
+                position.delete()
+            response = self.client.post(
+                "/api/transactions/batch/", {"orders": orders}, format="json"
+            )
+            self.assertEqual(response.status_code, 200)
+            results = response.data["results"]
+            self.assertEqual(
+                [result["status"] for result in results], ["filled", "rejected"]
+            )
+            self.assertEqual(results[1]["error"], "Cannot sell stock before T+3")
+
+    def test_marketdata_list(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(2, self.client.get, "/api/marketdata/")
+        self.assertEqual(response.status_code, 200)
+        self.assertListMatchesSerializer(
+            "/api/marketdata/", MarketDataSerializer, MarketData.objects.all()
+        )
+
+    def test_marketdata_search(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            2,
+            self.client.get,
+            "/api/marketdata/",
+            {"search": self.data.book_stock.pk.lower(), "ordering": "price"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], self.FANOUT)
+
+    def test_user_stocks_list(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(2, self.client.get, "/api/user-stocks/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(4, self.client.get, "/api/users/profile/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["stocks_owned"]), self.FANOUT + 1)
+
+    def test_alerts_list(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(2, self.client.get, "/api/alerts/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], self.FANOUT + 1)
+
+    def test_alert_create(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            2,
+            self.client.post,
+            "/api/alerts/",
+            {
+                "stock": self.data.book_stock.pk,
+                "direction": "BELOW",
+                "threshold": "9.50",
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Decimal(response.data["reference_price"]),
+            self.data.book_stock.marketPrice,
+        )
+
+    def test_alert_cancel(self):
+        self.authenticate(self.data.trader)
+        alert = PriceAlert.objects.filter(user=self.data.trader).first()
+        response = self.assertMaxQueries(
+            2, self.client.delete, f"/api/alerts/{alert.pk}/"
+        )
+        self.assertEqual(response.status_code, 204)
+        alert.refresh_from_db()
+        self.assertFalse(alert.is_active)
+
+        response = self.client.delete(f"/api/alerts/{alert.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(PriceAlert.objects.filter(pk=alert.pk).exists())
+
+
+    def test_blown_budget_raises_on_reads(self):
+        self.authenticate(self.data.trader)
+        with mock.patch.object(
+            PriceAlertViewSet, "query_budgets", {"list": 0}, create=True
+        ):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/alerts/")
+
+    def test_blown_budget_only_flags_writes(self):
+        self.authenticate(self.data.trader)
+        alerts = PriceAlert.objects.count()
+        with mock.patch.object(
+            PriceAlertViewSet, "query_budgets", {"create": 0}, create=True
+        ), self.assertLogs("utils.server_timing", "WARNING"):
+            response = self.client.post(
+                "/api/alerts/",
+                {
+                    "stock": self.data.book_stock.pk,
+                    "direction": "BELOW",
+                    "threshold": "9.50",
+                },
+            )
+        # The alert committed, so the client has to see it
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["X-Query-Budget-Exceeded"], "2;budget=0")
+        self.assertEqual(PriceAlert.objects.count(), alerts + 1)
+
+
+class AuthappQueryCountFanOutTests(AuthappQueryCountTests):
+    FANOUT = 25
+
+
+class PriceAlertEvaluatorTests(SimpleTestCase):
+    def setUp(self):
+        self.evaluator = PriceAlertEvaluator()
+        for alert_id, direction, threshold in [
+            (1, "ABOVE", 70),
+            (2, "ABOVE", 75),
+            (3, "ABOVE", 70),
+            (4, "BELOW", 60),
+            (5, "BELOW", 65),
+        ]:
+            self.evaluator.add(alert_id, "VNM", direction, Decimal(threshold))
+        self.evaluator.add(6, "FPT", "ABOVE", Decimal(1))
+
+    def test_price_between_thresholds_triggers_nothing(self):
+        self.assertEqual(self.evaluator.evaluate("VNM", Decimal(67)), [])
+        self.assertEqual(len(self.evaluator), 6)
+
+    def test_crossing_up_triggers_every_reached_threshold_once(self):
+        self.assertCountEqual(self.evaluator.evaluate("VNM", Decimal(72)), [1, 3])
+        self.assertCountEqual(self.evaluator.evaluate("VNM", Decimal(80)), [2])
+        self.assertEqual(self.evaluator.evaluate("VNM", Decimal(80)), [])
+
+    def test_crossing_down_includes_the_threshold(self):
+        self.assertCountEqual(self.evaluator.evaluate("VNM", Decimal(60)), [4, 5])
+
+    def test_removed_and_replaced_alerts(self):
+        self.evaluator.remove(1)
+        self.evaluator.add(3, "VNM", "ABOVE", Decimal(90))
+        self.assertEqual(self.evaluator.evaluate("VNM", Decimal(80)), [2])
+        self.assertEqual(self.evaluator.symbols(), {"VNM", "FPT"})
+        self.assertIn(3, self.evaluator)
+
+    def test_alerts_created_past_the_threshold_wait_for_a_crossing(self):
+        self.evaluator.add(7, "HPG", "ABOVE", Decimal(70), Decimal(80))
+        self.evaluator.add(8, "HPG", "BELOW", Decimal(50), Decimal(40))
+        self.assertEqual(self.evaluator.evaluate("HPG", Decimal(75)), [])
+        self.assertEqual(self.evaluator.evaluate("HPG", Decimal(70)), [])
+        self.assertEqual(self.evaluator.evaluate("HPG", Decimal(69)), [])
+        self.assertEqual(self.evaluator.evaluate("HPG", Decimal(70)), [7])
+        self.assertEqual(self.evaluator.evaluate("HPG", Decimal(50)), [8])
+
+    def test_last_evaluated_price_is_the_reference(self):
+        self.evaluator.evaluate("VNM", Decimal(80))
+        self.evaluator.add(7, "VNM", "ABOVE", Decimal(78))
+        self.assertEqual(self.evaluator.evaluate("VNM", Decimal(81)), [])
+
+        # Already held: re-reading the creation price keeps its state
+        self.evaluator.evaluate("VNM", Decimal(70))
+        self.evaluator.add(7, "VNM", "ABOVE", Decimal(78), Decimal(80))
+        self.assertEqual(self.evaluator.evaluate("VNM", Decimal(78)), [7])
+
+    def test_reload_keeps_the_state_of_held_alerts(self):
+        self.evaluator.add(7, "HPG", "ABOVE", Decimal(70), Decimal(80))
+        self.evaluator.evaluate("HPG", Decimal(60))
+        self.evaluator.reload(
+            [
+                (7, "HPG", "ABOVE", Decimal(70), Decimal(80)),
+                (8, "HPG", "ABOVE", Decimal(65), Decimal(80)),
+            ]
+        )
+        self.assertEqual(len(self.evaluator), 2)
+        self.assertEqual(self.evaluator.evaluate("HPG", Decimal(72)), [7])
+
+
+@mock.patch("authapp.permission_registry.VERSION_CHECK_INTERVAL", 0)
+class PermissionRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="User")
+        cls.permission = Permission.objects.create(name="trade", description="")
+        cls.user = User.objects.create_user("rbac", PASSWORD, role=cls.role)
+
+    def test_changes_reach_other_processes_through_the_cache(self):
+        # Another worker's registry: only the cache is shared
+        other = PermissionRegistry()
+        self.assertFalse(other.has_perm(self.user, "trade"))
+
+        grant = RolePermission.objects.create(
+            role=self.role, permission=self.permission
+        )
+        self.assertTrue(other.has_perm(self.user, "trade"))
+        grant.delete()
+        self.assertFalse(other.has_perm(self.user, "trade"))
+        with self.assertNumQueries(0):
+            other.has_perm(self.user, "trade")
+
+    def test_a_shared_cache_is_required(self):
+        backends = "django.core.cache.backends"
+        local = {"default": {"BACKEND": f"{backends}.locmem.LocMemCache"}}
+        shared = {"default": {"BACKEND": f"{backends}.redis.RedisCache"}}
+        with override_settings(CACHES=local, ALLOW_PROCESS_LOCAL_CACHE=False):
+            errors = shared_cache_check(None)
+        self.assertEqual([error.id for error in errors], ["authapp.E001"])
+        with override_settings(CACHES=shared, ALLOW_PROCESS_LOCAL_CACHE=False):
+            self.assertEqual(shared_cache_check(None), [])
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="User")
+        cls.vip = Role.objects.create(name="VIP")
+        cls.user = User.objects.create_user("claims", PASSWORD, role=cls.role)
+
+    def setUp(self):
+        self.authentication = ClaimsJWTAuthentication()
+        self.token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+
+    def get_user(self):
+        return self.authentication.get_user(self.token)
+
+    def test_claims_build_the_user_without_a_query(self):
+        with self.assertNumQueries(0):
+            user = self.get_user()
+        self.assertEqual((user.pk, user.role_id), (self.user.pk, self.role.pk))
+
+    def test_unrelated_save_keeps_the_claims(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.username = "renamed"
+        user.save()
+        with self.assertNumQueries(0):
+            self.get_user()
+
+    def test_role_change_invalidates_the_claims(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.role = self.vip
+        user.save()
+        self.assertEqual(self.get_user().role_id, self.vip.pk)
+
+    def test_role_change_of_a_claims_user(self):
+        user = self.get_user()
+        user.role_id = self.vip.pk
+        user.save(update_fields=["role"])
+        self.assertEqual(self.get_user().role_id, self.vip.pk)
+
+    def test_inactive_user_is_rejected(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        with self.assertRaises(AuthenticationFailed):
+            self.get_user()
+
+    def test_deleted_user_is_rejected(self):
+        User.objects.filter(pk=self.user.pk).delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.get_user()
+
+    def test_user_deleted_after_the_check_fails_authentication(self):
+        user = self.get_user()
+        User.objects.filter(pk=self.user.pk).delete()
+        with self.assertRaises(AuthenticationFailed):
+            user.username
+
+    def test_other_users_keep_their_claims(self):
+        other = User.objects.create_user("other", PASSWORD, role=self.role)
+        other.role = self.vip
+        other.save()
+        with self.assertNumQueries(0):
+            self.get_user()
+
+
+class BalanceLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="User")
+        cls.users = [
+            User.objects.create_user(
+                f"ledger{i}", PASSWORD, role=role, account_balance=Decimal("100.00")
+            )
+            for i in range(2)
+        ]
+
+    def test_balance_is_opening_balance_plus_entries(self):
+        alice, bob = self.users
+        credit(alice, Decimal("50.00"), "DEPOSIT")
+        debit(alice, Decimal("30.25"), "BUY")
+        debit(bob, Decimal("100.00"), "BUY")
+        with self.assertNumQueries(1):
+            balances = get_balances([alice.pk, bob.pk])
+        self.assertEqual(balances, {alice.pk: Decimal("119.75"), bob.pk: ZERO})
+
+    def test_compaction_keeps_balances(self):
+        alice, bob = self.users
+        credit(alice, Decimal("50.00"), "DEPOSIT")
+        debit(bob, Decimal("20.00"), "BUY")
+        self.assertEqual(compact_balances(), 2)
+        credit(alice, Decimal("5.00"), "DEPOSIT")
+        self.assertEqual(compact_balances(), 1)
+        self.assertEqual(compact_balances(), 0)
+
+        self.assertEqual(
+            get_balances([alice.pk, bob.pk]),
+            {alice.pk: Decimal("155.00"), bob.pk: Decimal("80.00")},
+        )
+        self.assertEqual(BalanceSnapshot.objects.filter(user=alice).count(), 1)
+        self.assertFalse(BalanceEntry.objects.filter(compacted=False).exists())
+
+    def test_compaction_folds_entries_committed_late(self):
+        # An entry whose id precedes the last snapshot, as when its
+        # transaction commits after a later one was compacted
+        alice = self.users[0]
+        late = credit(alice, Decimal("7.00"), "DEPOSIT")
+        BalanceEntry.objects.filter(pk=late.pk).update(compacted=True)
+        credit(alice, Decimal("3.00"), "DEPOSIT")
+        compact_balances()
+        BalanceEntry.objects.filter(pk=late.pk).update(compacted=False)
+
+        self.assertEqual(get_balance(alice), Decimal("110.00"))
+        compact_balances()
+        self.assertEqual(get_balance(alice), Decimal("110.00"))
+        self.assertEqual(
+            BalanceSnapshot.objects.get(user=alice).balance, Decimal("110.00")
+        )
+
+    def test_listed_users_are_annotated(self):
+        credit(self.users[0], Decimal("1.00"), "DEPOSIT")
+        users = with_balances(
+            User.objects.filter(pk__in=[user.pk for user in self.users])
+        ).prefetch_related("userstock_set", "user_stocks_followed__stock")
+        # The users with their balances, and one query per prefetch
+        with self.assertNumQueries(3):
+            data = UserSerializer(users.order_by("pk"), many=True).data
+        self.assertEqual(
+            [row["account_balance"] for row in data], ["101.00", "100.00"]
+        )
+
+    def test_overdraft_is_rejected(self):
+        self.assertEqual(
+            validate_buyer_balance(self.users[0], Decimal("100.01")),
+            {"error": "Insufficient balance"},
+        )
+        self.assertIsNone(validate_buyer_balance(self.users[0], Decimal("100.00")))
+
+
+@skipUnless(connection.vendor == "postgresql", "Row locks are Postgres specific")
+class BalanceLockTests(TransactionTestCase):
+    def setUp(self):
+        role = Role.objects.create(name="User")
+        self.user = User.objects.create_user("locked", PASSWORD, role=role)
+
+    def try_lock(self, results):
+        try:
+            with transaction.atomic():
+                list(
+                    User.objects.select_for_update(no_key=True, nowait=True).filter(
+                        pk=self.user.pk
+                    )
+                )
+            results.append("locked")
+        except DatabaseError:
+            results.append("blocked")
+        finally:
+            connections.close_all()
+
+    def test_validate_buyer_balance_holds_the_lock(self):
+        results = []
+        with transaction.atomic():
+            validate_buyer_balance(self.user, ZERO)
+            thread = threading.Thread(target=self.try_lock, args=(results,))
+            thread.start()
+            thread.join()
+        # A credit references the user and must not wait for the lock
+        with transaction.atomic():
+            validate_buyer_balance(self.user, ZERO)
+            thread = threading.Thread(
+                target=lambda: credit(self.user, Decimal("1.00"), "DEPOSIT")
+            )
+            thread.start()
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(results, ["blocked"])
+
+
+class PartitionNamingTests(SimpleTestCase):
+    def test_months(self):
+        self.assertEqual(add_months(date(2024, 11, 1), 3), date(2025, 2, 1))
+        self.assertEqual(add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+        self.assertEqual(
+            partition_name("authapp_transaction", date(2024, 2, 1)),
+            "authapp_transaction_p202402",
+        )
+        self.assertEqual(
+            partition_month("authapp_transaction_p202402"), date(2024, 2, 1)
+        )
+        self.assertIsNone(partition_month("authapp_transaction_default"))
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning is Postgres specific")
+class PartitionMaintenanceTests(TestCase):
+    TABLE = "authapp_transaction"
+    OLD_MONTH = date(2001, 1, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="User")
+        user = User.objects.create_user("archived", PASSWORD, role=role)
+        stock = Stock.objects.create(
+            id="OLD", name="Old", marketPrice=10, sectionIndex="TEST", details={}
+        )
+        cls.transaction = Transaction.objects.create(
+            user=user, stock=stock, transaction_type="BUY", quantity=1, price=10
+        )
+        # Older than every monthly partition: the row moves to the default one
+        Transaction.objects.filter(pk=cls.transaction.pk).update(
+            transaction_date=timezone.make_aware(datetime(2001, 1, 15))
+        )
+
+    def count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_partition_takes_the_default_partition_rows(self):
+        with connection.cursor() as cursor:
+            name = create_monthly_partition(cursor, self.TABLE, self.OLD_MONTH)
+        self.assertEqual(self.count(name), 1)
+        self.assertEqual(self.count(f"{self.TABLE}_default"), 0)
+        self.assertTrue(Transaction.objects.filter(pk=self.transaction.pk).exists())
+
+    def test_archive_covers_the_default_partition_rows(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command(
+                "archive_partitions",
+                table="transaction",
+                archive_dir=archive_dir,
+                stdout=io.StringIO(),
+            )
+            self.assertEqual(
+                os.listdir(archive_dir),
+                [f"{partition_name(self.TABLE, self.OLD_MONTH)}.csv.gz"],
+            )
+        self.assertFalse(Transaction.objects.filter(pk=self.transaction.pk).exists())
+        self.assertEqual(self.count(f"{self.TABLE}_default"), 0)
+
+
+class BulkAdjustBalancesCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name="User")
+        cls.rich, cls.poor = (
+            User.objects.create_user(
+                username, PASSWORD, role=role, account_balance=Decimal(balance)
+            )
+            for username, balance in [("rich", "100.00"), ("poor", "5.00")]
+        )
+
+    def run_command(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "adjustments.csv")
+            report = os.path.join(directory, "report.ndjson")
+            with open(path, "w") as fileobj:
+                fileobj.write("user_id,amount\n")
+                fileobj.write(f"{self.rich.pk},10.00\n")
+                fileobj.write(f"{self.poor.pk},-10.00\n")
+                fileobj.write(f"{self.rich.pk},-1.00\n")
+            error = None
+            try:
+                call_command(
+                    "bulk_adjust_balances",
+                    path,
+                    *args,
+                    report=report,
+                    stdout=io.StringIO(),
+                )
+            except CommandError as exc:
+                error = exc
+            with open(report) as fileobj:
+                statuses = [json.loads(line)["status"] for line in fileobj]
+        return error, statuses
+
+    def test_overdraft_is_rejected(self):
+        error, statuses = self.run_command()
+        self.assertIsNone(error)
+        self.assertEqual(statuses, ["applied", "rejected", "applied"])
+        self.assertEqual(
+            get_balances([self.rich.pk, self.poor.pk]),
+            {self.rich.pk: Decimal("109.00"), self.poor.pk: Decimal("5.00")},
+        )
+
+    def test_credits_cover_later_debits(self):
+        with transaction.atomic():
+            results = apply_adjustments(
+                [
+                    {"user_id": self.poor.pk, "amount": Decimal("10.00")},
+                    {"user_id": self.poor.pk, "amount": Decimal("-15.00")},
+                    {"user_id": self.poor.pk, "amount": Decimal("-0.01")},
+                ]
+            )
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["applied", "applied", "rejected"],
+        )
+        self.assertEqual(get_balance(self.poor), ZERO)
+
+    def test_all_or_nothing_rolls_back_and_stops(self):
+        error, statuses = self.run_command("--all-or-nothing")
+        self.assertIsNotNone(error)
+        self.assertEqual(statuses, ["rolled_back", "rejected", "skipped"])
+        self.assertFalse(BalanceEntry.objects.exists())
+
+
+def make_record(msg, level=logging.INFO, name="tests", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class LogFilterTests(SimpleTestCase):
+    def test_sampling_keeps_the_rate_of_listed_levels(self):
+        sampler = SamplingFilter(rates={"INFO": 0.1})
+        with mock.patch("utils.log_handlers.random.random", side_effect=[0.05, 0.5]):
+            kept, dropped = make_record("kept"), make_record("dropped")
+            self.assertTrue(sampler.filter(kept))
+            self.assertFalse(sampler.filter(dropped))
+            # Unlisted levels draw nothing
+            self.assertTrue(sampler.filter(make_record("warn", logging.WARNING)))
+
+        # Every handler sharing the filter sees the same decision
+        with mock.patch("utils.log_handlers.random.random", return_value=0.0):
+            self.assertFalse(sampler.filter(dropped))
+            self.assertFalse(SamplingFilter(rates={"INFO": 1}).filter(dropped))
+
+    @mock.patch("utils.log_handlers.time.monotonic")
+    def test_rate_limit_suppresses_repeats_per_window(self, monotonic):
+        limiter = RateLimitFilter(rate=2, per=60.0)
+        monotonic.return_value = 0.0
+        allowed = [limiter.filter(make_record("Client error")) for _ in range(4)]
+        self.assertEqual(allowed, [True, True, False, False])
+        self.assertTrue(limiter.filter(make_record("Other error")))
+        self.assertTrue(
+            limiter.filter(make_record("Client error", rate_limit_key="other"))
+        )
+        self.assertTrue(limiter.filter(make_record("Client error", logging.ERROR)))
+
+        record = make_record("Client error")
+        self.assertFalse(limiter.filter(record))
+        # Handlers sharing the filter do not count the record again
+        self.assertFalse(limiter.filter(record))
+
+        monotonic.return_value = 60.0
+        record = make_record("Client error")
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+    def test_full_queue_drops_are_counted_in_metrics(self):
+        handler = AsyncHandler(queue_size=1)
+        handler.set_name("tests")
+        self.addCleanup(handler.close)
+        for _ in range(3):
+            handler.enqueue(make_record("queued"))
+
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(dropped_records()["tests"], 2)
+        self.assertIn(
+            'log_records_dropped_total{handler="tests"} 2',
+            render_prometheus({}, {}, dropped=dropped_records()),
+        )
@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+import time
+
+from django.db import connection
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between incremental syncs, and between full rebuilds that drop
+# JTIs whose rows were pruned.
+SYNC_INTERVAL = 2.0
+REBUILD_INTERVAL = 3600.0
+SYNC_BATCH_SIZE = 10000
+SYNC_OVERLAP = 1000
+
+
+class BlacklistFilter:
+    """
+    Per-process set of blacklisted JTIs.
+
+    A background thread appends newly blacklisted rows (by increasing id)
+    every SYNC_INTERVAL seconds, so checking a token that is not blacklisted
+    never touches the database. Tokens blacklisted by another process are
+    seen after at most one sync interval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jtis = set()
+        self._last_id = 0
+        self._rebuilt_at = 0.0
+        self._pid = None
+
+    def _fetch(self, after_id):
+        return list(
+            BlacklistedToken.objects.filter(id__gt=after_id)
+            .order_by("id")
+            .values_list("id", "token__jti")[:SYNC_BATCH_SIZE]
+        )
+
+    def sync(self, rebuild=False):
+        # Ids are allocated before commit, so a row can become visible after
+        # a higher id was already read; re-reading a window of recent ids
+        # catches those late commits.
+        last_id = 0 if rebuild else max(self._last_id - SYNC_OVERLAP, 0)
+        jtis = set()
+
+        while True:
+            rows = self._fetch(last_id)
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            jtis.update(jti for _, jti in rows)
+
+        with self._lock:
+            if rebuild:
+                self._jtis = jtis
+                self._last_id = last_id
+                self._rebuilt_at = time.monotonic()
+            else:
+                self._jtis |= jtis
+                self._last_id = max(self._last_id, last_id)
+
+    def _run(self):
+        while True:
+            time.sleep(SYNC_INTERVAL)
+            try:
+                rebuild = time.monotonic() - self._rebuilt_at >= REBUILD_INTERVAL
+                self.sync(rebuild=rebuild)
+            except Exception:
+                logger.exception("Token blacklist sync failed")
+            finally:
+                # Do not hold a connection open between syncs
+                connection.close()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so (re)start per worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.sync(rebuild=True)
+        threading.Thread(
+            target=self._run, name="token-blacklist-sync", daemon=True
+        ).start()
+
+    def add(self, jti):
+        with self._lock:
+            self._jtis.add(jti)
+
+    def might_contain(self, jti):
+        self._ensure_started()
+        return jti in self._jtis
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist check consults the in-memory filter first
+    and only queries the database when the filter reports a hit.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        if (
+            blacklist_filter.might_contain(jti)
+            and BlacklistedToken.objects.filter(token__jti=jti).exists()
+        ):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
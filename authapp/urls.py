@@ -3,11 +3,13 @@ from .views import (
     SignUpView,
     RoleView,
     AccountView,
+    BalanceAdjustmentView,
     PermissionView,
     RolePermissionView,
     UserDetailViewSet,
     MarketDataViewSet,
     UserStockViewSet,
+    PriceAlertViewSet,
     TransactionBuySellViewSet,
 )
 from django.urls import include, path
@@ -22,6 +24,7 @@ router.register(r"transactions", TransactionBuySellViewSet, basename="transactio
 router.register(r"marketdata", MarketDataViewSet, basename="market-data")
 router.register(r"user-stocks", UserStockViewSet, basename="user-stock")
 router.register(r"users", UserDetailViewSet, basename="user-detail")
+router.register(r"alerts", PriceAlertViewSet, basename="price-alerts")
 
 urlpatterns = [
     path("signup/", SignUpView.as_view(), name="signup"),
@@ -32,5 +35,10 @@ urlpatterns = [
         AccountView.as_view({"put": "add_money"}),
         name="add_money",
     ),
+    path(
+        "accounts/bulk-adjust/",
+        BalanceAdjustmentView.as_view({"post": "bulk_adjust"}),
+        name="bulk_adjust",
+    ),
     path("", include(router.urls)),
 ]
@@ -7,49 +7,72 @@ from rest_framework.permissions import (
     AllowAny,
     IsAuthenticatedOrReadOnly,
 )
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework.decorators import action
 from django.db import transaction as db_transaction
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Value
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.filters import OrderingFilter, SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
 
 from .serializers import (
-    MarketDataSerializer,
+    BatchOrdersSerializer,
+    MarketListingSerializer,
     SignUpSerializer,
     RoleSerializer,
     AddMoneySerializer,
+    BulkBalanceAdjustmentSerializer,
     PermissionSerializer,
+    PriceAlertSerializer,
     RolePermissionSerializer,
     TransactionSerializer,
     UserSerializer,
     UserStockSerializer,
 )
+from stocks.filters import SymbolSearchFilter
 from stocks.permissions import IsAdminUser
+from utils.db_router import use_primary
+from utils.fast_list import ValuesListMixin
 from .permissions import CanAddMoneyPermission
+from .token_blacklist import FilteredRefreshToken
 from .models import (
-    MarketData,
+    MarketListing,
     Role,
     Transaction,
     User,
     Permission,
+    PriceAlert,
     RolePermission,
     UserStock,
 )
 from .repositories.buy_stock_repo import (
+    InsufficientLiquidity,
     validate_buyer_balance,
     validate_market_data,
     process_transactions,
     update_user_stock_and_balance,
 )
 
+from .repositories.balance_ledger_repo import (
+    apply_adjustments,
+    credit,
+    get_balance,
+    roll_back_adjustments,
+    with_balances,
+)
+from .repositories.batch_order_repo import place_orders, roll_back
 from .repositories.sell_stock_repo import (
     fetch_user_stock,
     has_sufficient_stock,
     is_t_plus_3_restricted,
     process_sell_order,
 )
+from .repositories.transaction_history_repo import (
+    EXPORT_FORMATS,
+    iter_transaction_rows,
+)
 
 
 # Create your views here.
@@ -68,6 +91,17 @@ class CustomPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class TransactionCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (transaction_date, id), newest first.
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-transaction_date", "-id")
+
+
 class BaseReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
@@ -78,7 +112,8 @@ class BaseUserRelatedViewSet(BaseReadOnlyViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        if hasattr(self, "queryset") and self.queryset:
+        # Compare with None: truth-testing a queryset evaluates the whole table
+        if self.queryset is not None:
             return self.queryset.filter(user=self.request.user)
         else:
             return UserStock.objects.none()
@@ -116,7 +151,7 @@ class LogOutView(APIView):
             access_token = request.data.get("access", None)
 
             if refresh_token:
-                token = RefreshToken(refresh_token)
+                token = FilteredRefreshToken(refresh_token)
                 token.blacklist()
 
             if access_token:
@@ -142,6 +177,7 @@ class RoleView(viewsets.ModelViewSet):
 class AccountView(viewsets.GenericViewSet):
     permission_classes = [CanAddMoneyPermission]
 
+    @use_primary()
     @action(detail=False, methods=["put"], url_path="add-money")
     def add_money(self, request, pk=None):
         user = User.objects.filter(pk=pk).first()
@@ -156,17 +192,54 @@ class AccountView(viewsets.GenericViewSet):
             return validation_response
 
         amount = serializer.validated_data["amount"]
-        user.account_balance += amount
-        user.save()
+        credit(user, amount, "DEPOSIT", f"add-money:{request.user.pk}")
         return Response(
             {
                 "message": "Balance updated successfully",
-                "new_balance": user.account_balance,
+                "new_balance": get_balance(user),
             },
             status=status.HTTP_200_OK,
         )
 
 
+class BalanceAdjustmentView(viewsets.GenericViewSet):
+    """
+    Admin can credit/debit many accounts at once (e.g. payroll-style funding)
+    """
+
+    permission_classes = [IsAdminUser]
+    serializer_class = BulkBalanceAdjustmentSerializer
+
+    def bulk_adjust(self, request):
+        serializer = self.get_serializer(data=request.data)
+        validation_response = is_valid_response(serializer)
+        if validation_response:
+            return validation_response
+
+        adjustments = serializer.validated_data["adjustments"]
+        all_or_nothing = serializer.validated_data["all_or_nothing"]
+
+        with db_transaction.atomic():
+            results = apply_adjustments(
+                adjustments, stop_on_rejection=all_or_nothing
+            )
+            rejected = sum(1 for result in results if result["status"] == "rejected")
+            committed = not (all_or_nothing and rejected)
+            if not committed:
+                db_transaction.set_rollback(True)
+                roll_back_adjustments(results)
+
+        return Response(
+            {
+                "committed": committed,
+                "applied": len(results) - rejected if committed else 0,
+                "rejected": rejected,
+                "results": results,
+            },
+            status=status.HTTP_200_OK if committed else status.HTTP_400_BAD_REQUEST,
+        )
+
+
 """
 Admin can control permissions
 """
@@ -191,17 +264,23 @@ class RolePermissionView(
     viewsets.GenericViewSet,
 ):
     permission_classes = [IsAdminUser]
-    queryset = RolePermission.objects.all()
+    queryset = RolePermission.objects.select_related("role", "permission")
     serializer_class = RolePermissionSerializer
 
 
 class UserDetailViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
+    query_budgets = {"profile": 4}
 
     @action(detail=False, methods=["get"], url_path="profile")
     def profile(self, request):
-        serializer = self.get_serializer(request.user)
+        user = (
+            with_balances(User.objects.all())
+            .prefetch_related("userstock_set", "user_stocks_followed__stock")
+            .get(pk=request.user.pk)
+        )
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
 
@@ -217,15 +296,28 @@ class UserDetailViewSet(viewsets.GenericViewSet):
 #     search_fields = ["stock__id"]
 
 
-class MarketDataViewSet(BaseReadOnlyViewSet):
+class MarketDataViewSet(ValuesListMixin, BaseReadOnlyViewSet):
+    """
+    Open sell orders, served from the `MarketListing` read model.
+    """
+
     permission_classes = [IsAuthenticatedOrReadOnly]
-    serializer_class = MarketDataSerializer
+    serializer_class = MarketListingSerializer
+    list_values = {
+        "id": "order_id",
+        "username": "username",
+        "stock": "stock",
+        "quantity": "quantity",
+        "price": "price",
+        "transaction_type": Value(MarketListing.transaction_type),
+        "transaction_date": "transaction_date",
+    }
+    filter_backends = [DjangoFilterBackend, OrderingFilter, SymbolSearchFilter]
     filterset_fields = ["stock", "price"]
     ordering_fields = ["price", "updated_at"]
+    ordering = ["order_id"]
     search_fields = ["stock__id"]
-
-    def get_queryset(self):
-        return MarketData.objects.filter(transaction_type="SELL")
+    queryset = MarketListing.objects.all()
 
 
 class UserStockViewSet(BaseUserRelatedViewSet):
@@ -233,28 +325,89 @@ class UserStockViewSet(BaseUserRelatedViewSet):
     Get information about stocks of one user
     """
 
-    queryset = UserStock.objects.select_related("stock")
+    queryset = UserStock.objects.select_related("stock", "user")
     serializer_class = UserStockSerializer
     filterset_fields = ["stock"]
     ordering_fields = ["quantity", "updated_at"]
     search_fields = ["stock__id"]
 
 
+class PriceAlertViewSet(
+    mixins.CreateModelMixin,
+    mixins.DestroyModelMixin,
+    BaseUserRelatedViewSet,
+):
+    """
+    The user's price alerts; `run_price_alerts` triggers them. Deleting an
+    active alert cancels it, deleting a cancelled or triggered one removes it.
+    """
+
+    queryset = PriceAlert.objects.all()
+    serializer_class = PriceAlertSerializer
+    filterset_fields = ["stock", "direction", "is_active"]
+    ordering_fields = ["created_at", "threshold", "triggered_at"]
+    search_fields = ["stock__id"]
+
+    def perform_create(self, serializer):
+        stock = serializer.validated_data["stock"]
+        serializer.save(user=self.request.user, reference_price=stock.marketPrice)
+
+    def perform_destroy(self, instance):
+        if not instance.is_active:
+            instance.delete()
+            return
+        # Kept as a row so the evaluator sees the cancellation
+        instance.is_active = False
+        instance.save(update_fields=["is_active", "updated_at"])
+
+
 class TransactionBuySellViewSet(
+    ValuesListMixin,
     viewsets.GenericViewSet,
 ):
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        "transaction_type": ["exact"],
+        "stock": ["exact"],
+        "status": ["exact"],
+        "transaction_date": ["gte", "lte"],
+    }
+    list_values = {field: field for field in TransactionSerializer.Meta.fields}
+    # Buys grow with the number of sell orders they match
+    query_budgets = {"list": 3, "sell": 12, "buy": 40}
 
     def get_permissions(self):
         if self.action == "list":
             return [AllowAny()]
+        return super().get_permissions()
 
-    def list(self, request):
-        user = request.user
-        transactions = Transaction.objects.filter(user=user)
-        transaction_serializer = TransactionSerializer(transactions, many=True)
-        return Response(transaction_serializer.data, status=status.HTTP_200_OK)
+    def get_queryset(self):
+        return Transaction.objects.filter(user=self.request.user)
+
+    @action(detail=False, methods=["get"], url_path="export")
+    def export(self, request):
+        """
+        Stream the user's full (filtered) transaction history as NDJSON or CSV.
+        """
+        export_format = request.query_params.get("output", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported export format: {export_format}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        encoder, content_type = EXPORT_FORMATS[export_format]
+        rows = iter_transaction_rows(self.filter_queryset(self.get_queryset()))
+
+        response = StreamingHttpResponse(encoder(rows), content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="transactions.{export_format}"'
+        )
+        return response
 
+    @use_primary()
     @db_transaction.atomic
     @action(detail=False, methods=["post"], url_path="sell")
     def sell(self, request):
@@ -301,6 +454,7 @@ class TransactionBuySellViewSet(
             status=status.HTTP_201_CREATED,
         )
 
+    @use_primary()
     @db_transaction.atomic
     @action(detail=False, methods=["post"], url_path="buy")
     def buy(self, request):
@@ -326,18 +480,23 @@ class TransactionBuySellViewSet(
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
         # Process transactions for both buyer and seller
-        (
-            total_cost,
-            initial_quantity,
-            buyer_transactions,
-            seller_transactions,
-        ) = process_transactions(user, stock, quantity, price, market_data_queryset)
+        try:
+            (
+                total_cost,
+                filled_quantity,
+                buyer_transactions,
+                seller_transactions,
+            ) = process_transactions(
+                user, stock, quantity, price, market_data_queryset
+            )
+        except InsufficientLiquidity as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Update stocks and balances
         update_user_stock_and_balance(
             user,
             stock,
-            initial_quantity,
+            filled_quantity,
             total_cost,
             buyer_transactions,
             seller_transactions,
@@ -357,3 +516,40 @@ class TransactionBuySellViewSet(
             },
             status=status.HTTP_201_CREATED,
         )
+
+    @use_primary()
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        """
+        Place up to 100 buy and sell orders in one transaction, in order.
+        Best effort by default: rejected orders are reported and the others
+        kept. With `all_or_nothing`, the first rejection rolls the whole
+        batch back.
+        """
+        serializer = BatchOrdersSerializer(data=request.data)
+        validation_response = is_valid_response(serializer)
+        if validation_response:
+            return validation_response
+
+        all_or_nothing = serializer.validated_data["all_or_nothing"]
+        with db_transaction.atomic():
+            results = place_orders(
+                request.user,
+                serializer.validated_data["orders"],
+                stop_on_rejection=all_or_nothing,
+            )
+            rejected = sum(1 for result in results if result["status"] == "rejected")
+            committed = not (all_or_nothing and rejected)
+            if not committed:
+                db_transaction.set_rollback(True)
+                roll_back(results)
+
+        return Response(
+            {
+                "committed": committed,
+                "accepted": len(results) - rejected if committed else 0,
+                "rejected": rejected,
+                "results": results,
+            },
+            status=status.HTTP_200_OK if committed else status.HTTP_400_BAD_REQUEST,
+        )
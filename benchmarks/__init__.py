@@ -0,0 +1,3 @@
+"""
+Micro-benchmarks for the API hot paths; run with `manage.py run_benchmarks`.
+"""
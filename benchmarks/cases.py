@@ -0,0 +1,236 @@
+"""
+Benchmark cases for the API hot paths. Data is generated from fixed seeds so
+runs on the same machine are comparable.
+"""
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from authapp.models import (
+    MarketData,
+    MarketListing,
+    Role,
+    User,
+    UserStock,
+    UserStockFollowed,
+)
+from authapp.repositories.balance_ledger_repo import with_balances
+from authapp.repositories.buy_stock_repo import (
+    process_transactions,
+    validate_market_data,
+)
+from authapp.repositories.market_listing_repo import rebuild_market_listings
+from authapp.repositories.price_level_repo import rebuild_price_levels
+from authapp.serializers import MarketDataSerializer, UserSerializer
+from authapp.views import CustomPagination, MarketDataViewSet
+from stocks.models import Stock
+from stocks.serializers import StockSerializer
+from utils.custom_exception_handler import custom_exception_handler
+from utils.metrics import MetricsMiddleware
+from utils.renderers import ORJSONRenderer
+
+from .runner import benchmark
+
+
+SEED = 38
+
+
+def make_stocks(count, rng, save=True):
+    stocks = [
+        Stock(
+            id=f"BENCH{i:05d}",
+            name=f"Benchmark stock {i}",
+            marketPrice=Decimal(rng.randint(100, 100000)) / 100,
+            sectionIndex=rng.choice(["VN30", "HNX30", "UPCOM"]),
+            details={"exchange": "HOSE", "lot_size": 100, "sector": f"S{i % 12}"},
+        )
+        for i in range(count)
+    ]
+    return Stock.objects.bulk_create(stocks) if save else stocks
+
+
+def make_users(count, prefix="bench"):
+    role, _ = Role.objects.get_or_create(name="User")
+    return User.objects.bulk_create(
+        User(username=f"{prefix}{i}", password="!", role=role) for i in range(count)
+    )
+
+
+@benchmark("serializers.stock", rows=[100, 1000])
+def stock_serializer(rows):
+    stocks = make_stocks(rows, random.Random(SEED), save=False)
+    return lambda: StockSerializer(stocks, many=True).data
+
+
+@benchmark("serializers.user", users=[10, 100], positions=[10])
+def user_serializer(users, positions):
+    rng = random.Random(SEED)
+    stocks = make_stocks(positions * 2, rng)
+    owners = make_users(users)
+    UserStock.objects.bulk_create(
+        UserStock(user=user, stock=stock, quantity=rng.randint(1, 1000))
+        for user in owners
+        for stock in rng.sample(stocks, positions)
+    )
+    UserStockFollowed.objects.bulk_create(
+        UserStockFollowed(user=user, stock=stock)
+        for user in owners
+        for stock in rng.sample(stocks, positions)
+    )
+    queryset = with_balances(
+        User.objects.filter(pk__in=[user.pk for user in owners])
+    ).prefetch_related("userstock_set", "user_stocks_followed__stock")
+    return lambda: UserSerializer(queryset.all(), many=True).data
+
+
+@benchmark("matching.buy", depth=[10, 100, 1000])
+def match_buy(depth):
+    """
+    Sweep a book of `depth` sell orders with one buy; every iteration is
+    rolled back to a savepoint so the book is identical each time.
+    """
+    rng = random.Random(SEED)
+    stock = make_stocks(1, rng)[0]
+    sellers = make_users(depth, prefix="seller")
+    buyer = make_users(1, prefix="buyer")[0]
+    UserStock.objects.bulk_create(
+        UserStock(user=seller, stock=stock, quantity=0, sold_quantity=100)
+        for seller in sellers
+    )
+    now = timezone.now()
+    MarketData.objects.bulk_create(
+        MarketData(
+            user=seller,
+            stock=stock,
+            quantity=100,
+            price=Decimal(rng.randint(1000, 2000)) / 100,
+            transaction_type="SELL",
+            transaction_date=now - timedelta(minutes=i),
+        )
+        for i, seller in enumerate(sellers)
+    )
+    with connection.cursor() as cursor:
+        rebuild_price_levels(cursor, [stock.pk])
+        rebuild_market_listings(cursor, [stock.pk])
+    quantity = 100 * depth
+    price = Decimal("20.00")
+
+    def run():
+        savepoint = transaction.savepoint()
+        try:
+            _, market_data = validate_market_data(stock, price, quantity)
+            process_transactions(buyer, stock, quantity, price, market_data)
+        finally:
+            transaction.savepoint_rollback(savepoint)
+
+    return run
+
+
+@benchmark("pagination.custom", page=[1, 100, 1000])
+def custom_pagination(page):
+    rng = random.Random(SEED)
+    stocks = make_stocks(20, rng)
+    users = make_users(50)
+    now = timezone.now()
+    MarketData.objects.bulk_create(
+        MarketData(
+            user=rng.choice(users),
+            stock=rng.choice(stocks),
+            quantity=rng.randint(1, 1000),
+            price=Decimal(rng.randint(100, 10000)) / 100,
+            transaction_type="SELL",
+            transaction_date=now - timedelta(seconds=i),
+        )
+        for i in range(10000)
+    )
+    queryset = MarketData.objects.filter(stock__in=stocks).order_by("id")
+    request = Request(RequestFactory().get("/api/marketdata/", {"page": page}))
+
+    def run():
+        paginator = CustomPagination()
+        list(paginator.paginate_queryset(queryset, request))
+        return paginator
+
+    return run
+
+
+EXCEPTIONS = {
+    "validation": lambda: ValidationError({"quantity": ["Must be positive."]}),
+    "not_found": lambda: NotFound("No such stock"),
+    "permission_denied": lambda: PermissionDenied(),
+    "unhandled": lambda: ValueError("boom"),
+}
+
+
+RENDERERS = {"stdlib": JSONRenderer, "orjson": ORJSONRenderer}
+
+
+@benchmark("renderers.json", renderer=list(RENDERERS), rows=[100, 1000])
+def json_renderer(renderer, rows):
+    stocks = make_stocks(rows, random.Random(SEED), save=False)
+    data = StockSerializer(stocks, many=True).data
+    return lambda: RENDERERS[renderer]().render(data)
+
+
+@benchmark("lists.marketdata", path=["serializer", "values"], rows=[100, 1000])
+def marketdata_list(path, rows):
+    """
+    The serializer + stdlib JSON path over MarketData against the view's
+    path, `ValuesListMixin` over the MarketListing read model + orjson, from
+    the query to the response body.
+    """
+    rng = random.Random(SEED)
+    stocks = make_stocks(20, rng)
+    users = make_users(20)
+    now = timezone.now()
+    MarketData.objects.bulk_create(
+        MarketData(
+            user=rng.choice(users),
+            stock=rng.choice(stocks),
+            quantity=rng.randint(1, 1000),
+            price=Decimal(rng.randint(100, 10000)) / 100,
+            transaction_type="SELL",
+            transaction_date=now - timedelta(seconds=i),
+        )
+        for i in range(rows)
+    )
+    queryset = MarketData.objects.filter(transaction_type="SELL")
+
+    if path == "serializer":
+        queryset = queryset.select_related("user")
+        return lambda: JSONRenderer().render(
+            MarketDataSerializer(queryset.all(), many=True).data
+        )
+
+    with connection.cursor() as cursor:
+        rebuild_market_listings(cursor, [stock.pk for stock in stocks])
+    fields, expressions = MarketDataViewSet().get_list_values()
+    listings = MarketListing.objects.all()
+    return lambda: ORJSONRenderer().render(
+        list(listings.values(*fields, **expressions))
+    )
+
+
+@benchmark("exceptions.handler", exc=list(EXCEPTIONS))
+def exception_handler(exc):
+    make_exception = EXCEPTIONS[exc]
+    request = Request(RequestFactory().get("/api/stocks/BENCH00000/"))
+    context = {"request": request, "view": None}
+    return lambda: custom_exception_handler(make_exception(), context)
+
+
+@benchmark("middleware.metrics")
+def metrics_middleware():
+    middleware = MetricsMiddleware(lambda request: HttpResponse(b"{}"))
+    request = RequestFactory().get("/api/stocks/")
+    request.resolver_match = None
+    return lambda: middleware(request)
@@ -0,0 +1,137 @@
+import platform
+import statistics
+import time
+
+import django
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name, **params):
+    """
+    Register a benchmark. The decorated function does the (untimed) setup
+    for one set of `params` and returns the callable that is timed; every
+    combination of the listed param values becomes its own case:
+
+        @benchmark("serializers.stock", rows=[100, 1000])
+        def stock_serializer(rows): ...
+    """
+
+    def decorator(setup):
+        combinations = [{}]
+        for key, values in params.items():
+            combinations = [
+                {**combination, key: value}
+                for combination in combinations
+                for value in values
+            ]
+        for combination in combinations:
+            suffix = ",".join(f"{key}={value}" for key, value in combination.items())
+            case_name = f"{name}[{suffix}]" if suffix else name
+            BENCHMARKS[case_name] = (setup, combination)
+        return setup
+
+    return decorator
+
+
+def autorange(func, min_time):
+    """
+    Number of calls per repeat so that one repeat lasts at least `min_time`.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time:
+            return number
+        number *= 2
+
+
+def time_case(func, repeat, min_time):
+    func()  # warm up caches, lazy imports and query plans
+    number = autorange(func, min_time)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run(names, repeat=5, min_time=0.2, log=None):
+    """
+    Run the named cases and return the JSON-serializable results. Each case
+    seeds its data inside a transaction that is rolled back afterwards.
+    """
+    results = {}
+    for name in names:
+        setup, params = BENCHMARKS[name]
+        with transaction.atomic():
+            results[name] = time_case(setup(**params), repeat, min_time)
+            transaction.set_rollback(True)
+        if log:
+            log(name, results[name])
+
+    return {
+        "meta": {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.05):
+    """
+    Return (rows, regressions) comparing median timings of two runs. A case
+    is faster or slower when its median moved by more than `threshold`.
+    """
+    rows = []
+    regressions = []
+    old_results = baseline["results"]
+    new_results = current["results"]
+
+    for name in sorted(old_results.keys() | new_results.keys()):
+        old = old_results.get(name)
+        new = new_results.get(name)
+        if old is None or new is None:
+            verdict = "new" if old is None else "missing"
+            old_median = old and old["median"]
+            new_median = new and new["median"]
+            rows.append((name, old_median, new_median, None, verdict))
+            continue
+
+        change = new["median"] / old["median"] - 1
+        if change > threshold:
+            verdict = "slower"
+            regressions.append(name)
+        elif change < -threshold:
+            verdict = "faster"
+        else:
+            verdict = "same"
+        rows.append((name, old["median"], new["median"], change, verdict))
+
+    return rows, regressions
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * scale >= 1:
+            return f"{seconds * scale:.2f}{unit}"
+    return f"{seconds * 1e9:.0f}ns"
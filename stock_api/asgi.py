@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stock_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up: it loads models
+from stocks.streaming import STREAMS  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    Serve the live price streams outside Django's request cycle: they are
+    long-lived and their updates come from per-symbol pollers.
+    """
+    if scope["type"] == "http" and scope["path"] in STREAMS:
+        return await STREAMS[scope["path"]](scope, receive, send)
+    return await django_application(scope, receive, send)
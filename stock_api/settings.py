@@ -15,6 +15,9 @@ from pathlib import Path
 from django.conf import settings  # noqa: F401
 from pythonjsonlogger import jsonlogger  # noqa: F401
 import os
+import tempfile
+
+from utils.silk_sampling import should_intercept
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "utils.metrics.MetricsMiddleware",
+    "utils.db_router.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,6 +65,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "silk.middleware.SilkyMiddleware",
+    "utils.server_timing.ServerTimingMiddleware",
 ]
 
 ROOT_URLCONF = "stock_api.urls"
@@ -94,8 +100,64 @@ DATABASES = {
         "NAME": os.environ.get("PG_DB", "postgres"),
         "PORT": os.environ.get("PG_PORT", "5432"),
         "HOST": os.environ.get("PG_HOST", "localhost"),
+        # Keep connections between requests and ping them before reuse
+        "CONN_MAX_AGE": int(os.environ.get("PG_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": True,
+    }
+}
+
+# Pooled connections (psycopg 3 only), e.g. PG_POOL=1. Every WSGI thread or
+# ASGI request holds one connection while it runs, so PG_POOL_MAX_SIZE should
+# cover the server's threads per worker.
+if os.environ.get("PG_POOL", "") == "1":
+    from psycopg_pool import ConnectionPool
+
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # the pool owns reuse
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("PG_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("PG_POOL_MAX_SIZE", "10")),
+            # Seconds a request waits for a free connection before failing
+            "timeout": float(os.environ.get("PG_POOL_TIMEOUT", "10")),
+            "max_idle": float(os.environ.get("PG_POOL_MAX_IDLE", "300")),
+            "max_lifetime": float(os.environ.get("PG_POOL_MAX_LIFETIME", "3600")),
+            # Ping on checkout so connections dropped by the server or a
+            # failover are replaced instead of failing the request
+            "check": ConnectionPool.check_connection,
+        }
+    }
+
+# Read replicas, e.g. PG_REPLICA_HOSTS="localhost:5433,localhost:5434"; each
+# becomes a `replica_<n>` alias with the primary's credentials and database
+DATABASE_REPLICAS = []
+for index, address in enumerate(
+    filter(None, os.environ.get("PG_REPLICA_HOSTS", "").split(",")), start=1
+):
+    host, _, port = address.strip().partition(":")
+    alias = f"replica_{index}"
+    # Each replica alias gets its own pool when pooling is on
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Cache shared by every worker process: the permission matrix, token claims,
+# the follower index and replica stickiness are invalidated through it
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
     }
 }
+# Only a single process may run on a process-local cache (authapp.E001)
+ALLOW_PROCESS_LOCAL_CACHE = False
+
+DATABASE_ROUTERS = ["utils.db_router.PrimaryReplicaRouter"]
+# Reads of a user who just wrote stay on the primary for this long
+REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS", "5"))
 
 
 # Password validation
@@ -148,10 +210,19 @@ AUTH_USER_MODEL = "authapp.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authapp.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "EXCEPTION_HANDLER": "utils.custom_exception_handler.custom_exception_handler",
+    "DEFAULT_RENDERER_CLASSES": (
+        "utils.renderers.TimedORJSONRenderer",
+        "utils.server_timing.TimedBrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "utils.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     # Config PAGINATION
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
@@ -184,8 +255,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_EXP_CLAIM": "refresh_exp",
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "authapp.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "authapp.serializers.FilteredTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -206,16 +277,31 @@ LOGGING = {
             "format": "{asctime} | {levelname:8} | {message}",
             "style": "{",
         },
+        # One compact JSON object per line
         "json": {
             "()": "pythonjsonlogger.jsonlogger.JsonFormatter",
             "format": "%(asctime)s %(levelname)s %(name)s %(message)s %(pathname)s %(lineno)d",
-            "json_indent": 4,
         },
     },
+    "filters": {
+        # Keep 10% of INFO records (e.g. per-request access lines)
+        "sample_info": {
+            "()": "utils.log_handlers.SamplingFilter",
+            "rates": {"INFO": float(os.environ.get("LOG_INFO_SAMPLE_RATE", "0.1"))},
+        },
+        # At most 20 identical client errors per minute
+        "rate_limit_client_errors": {
+            "()": "utils.log_handlers.RateLimitFilter",
+            "rate": 20,
+            "per": 60.0,
+            "max_level": "WARNING",
+        },
+    },
+    # Handlers only enqueue; a background thread per handler formats and writes
     "handlers": {
         # Rotating File Handler for Errors
         "error_rotating_file": {
-            "class": "logging.handlers.RotatingFileHandler",
+            "class": "utils.log_handlers.AsyncRotatingFileHandler",
             "filename": "logs/error_logs.json",
             "maxBytes": 5 * 1024 * 1024,  # 5 MB max file size
             "backupCount": 3,  # Keep 3 backup files
@@ -224,17 +310,19 @@ LOGGING = {
         },
         # Rotating File Handler for General Logs
         "general_rotating_file": {
-            "class": "logging.handlers.RotatingFileHandler",
+            "class": "utils.log_handlers.AsyncRotatingFileHandler",
             "filename": "logs/app_logs.log",
             "maxBytes": 5 * 1024 * 1024,  # 5 MB max file size
             "backupCount": 3,  # Keep 3 backup files
             "level": "INFO",
             "formatter": "detailed",
+            "filters": ["sample_info", "rate_limit_client_errors"],
         },
         # Console Handler
         "console": {
-            "class": "logging.StreamHandler",
+            "class": "utils.log_handlers.AsyncStreamHandler",
             "formatter": "detailed",
+            "filters": ["sample_info", "rate_limit_client_errors"],
         },
     },
     "loggers": {
@@ -248,8 +336,59 @@ LOGGING = {
             "level": "ERROR",
             "propagate": False,
         },
+        "utils": {
+            "handlers": ["console", "general_rotating_file", "error_rotating_file"],
+            "level": "INFO",
+            "propagate": False,
+        },
+        "authapp": {
+            "handlers": ["console", "general_rotating_file", "error_rotating_file"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
 
 APPEND_SLASH = True
+
+# Configuration METRICS (Prometheus text on /metrics)
+# Every worker process flushes its counters here; /metrics merges them
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "stock_api_metrics")
+)
+METRICS_FLUSH_INTERVAL = 5.0
+
+# Configuration SILK (sampled profiling)
+# Only a fraction of requests per route prefix is recorded and cProfiled;
+# send the header printed by `manage.py silk_profile_token` to force one.
+SILK_SAMPLING = {
+    "DEFAULT_RATE": float(os.environ.get("SILK_SAMPLE_RATE", "0.01")),
+    "ROUTES": {
+        "/api/transactions/": float(os.environ.get("SILK_TRADING_SAMPLE_RATE", "0.05")),
+        "/metrics": 0.0,
+    },
+    "HEADER": "X-Silk-Profile",
+    "TOKEN_MAX_AGE": 300,
+}
+SILKY_INTERCEPT_FUNC = should_intercept
+SILKY_PYTHON_PROFILER = True
+SILKY_PYTHON_PROFILER_BINARY = False
+# Keep storage bounded: silk drops the oldest requests past this count
+SILKY_MAX_RECORDED_REQUESTS = 2000
+SILKY_MAX_RECORDED_REQUESTS_CHECK_PERCENT = 10
+
+# Per-view query budgets (`query_budgets` on the view class): "log" or "raise"
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE", "log")
+
+# Configuration PRICE_STREAM (SSE on /api/stream/prices/, served by asgi.py)
+PRICE_STREAM = {
+    "POLL_INTERVAL": float(os.environ.get("PRICE_STREAM_POLL_INTERVAL", "1")),
+    "UPSTREAM_TIMEOUT": 5.0,
+    "HEARTBEAT_SECONDS": 15.0,
+    # Clients whose connection blocks a write this long are dropped
+    "SEND_TIMEOUT": 10.0,
+    "MAX_SYMBOLS": 20,
+    # Watchlist notifications are batched per user over this many seconds
+    "NOTIFY_INTERVAL": 0.25,
+}
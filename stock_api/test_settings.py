@@ -0,0 +1,18 @@
+"""
+Settings for the test suite, which runs in a single process:
+
+    python manage.py test --settings=stock_api.test_settings
+"""
+
+from .settings import *  # noqa: F401, F403
+from .settings import DATABASES
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+ALLOW_PROCESS_LOCAL_CACHE = True
+
+# A replica alias mirroring the test database, so the routing tests can
+# enable it (override DATABASE_REPLICAS) without a server
+TEST_REPLICA_ALIAS = "replica_1"
+DATABASES.setdefault(
+    TEST_REPLICA_ALIAS, {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+)
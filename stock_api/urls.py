@@ -19,6 +19,7 @@ from django.contrib import admin
 from django.urls import include, path
 from django.conf.urls import handler404, handler500
 from utils.custom_exception_handler import custom_404_handler, custom_500_handler
+from utils.metrics import metrics_view
 
 handler404 = custom_404_handler
 handler500 = custom_500_handler
@@ -28,4 +29,5 @@ urlpatterns = [
     path("api/", include("stocks.urls")),
     path("admin/", admin.site.urls),
     path("silk/", include("silk.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
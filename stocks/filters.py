@@ -0,0 +1,22 @@
+from rest_framework.filters import SearchFilter
+
+from .models import Stock
+
+
+class SymbolSearchFilter(SearchFilter):
+    """
+    `?search=` over the stock symbol of rows that reference a stock.
+
+    The terms are matched against the (small) stocks table and the rows are
+    then filtered on the matching symbols, which the rows' stock indexes
+    serve, instead of running a LIKE over every row.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        stocks = Stock.objects.all()
+        for term in terms:
+            stocks = stocks.filter(id__icontains=term)
+        return queryset.filter(stock__in=stocks.values("pk"))
@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+SEQUENCE_CACHE_KEY = "stocks:followers:seq"
+CHANGE_CACHE_KEY = "stocks:followers:change:{seq}"
+
+# How often (seconds) other processes' changes are applied, how long they
+# stay replayable, and the longest a process keeps an index, should a change
+# be lost (e.g. a cache restart).
+CHANGE_CHECK_INTERVAL = 1.0
+CHANGE_TTL = 600
+MAX_INDEX_AGE = 300.0
+LOAD_CHUNK_SIZE = 10000
+
+
+class FollowerIndex:
+    """
+    In-memory inverted index: stock symbol -> ids of the users following it.
+
+    Loaded once from `UserStockFollowed` and then kept current incrementally:
+    `follow()`/`unfollow()` apply a change locally and append it to a log in
+    the default cache, shared by every process (authapp.E001), which every
+    other process replays in order. When a process falls too far behind for
+    the log, or MAX_INDEX_AGE passes, it reloads the whole index.
+
+    Listeners are called with every change applied, as (following, user_id,
+    symbols), or with None after a reload, from whichever thread applied it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._followers = defaultdict(set)
+        self._seq = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self.listeners = []
+
+    @property
+    def sequence(self):
+        sequence = cache.get(SEQUENCE_CACHE_KEY)
+        if sequence is None:
+            cache.add(SEQUENCE_CACHE_KEY, 0, timeout=None)
+            sequence = cache.get(SEQUENCE_CACHE_KEY, 0)
+        return sequence
+
+    def _rows(self):
+        from authapp.models import UserStockFollowed
+
+        rows = UserStockFollowed.objects.values_list("stock_id", "user_id")
+        return rows.iterator(chunk_size=LOAD_CHUNK_SIZE)
+
+    def _load(self, sequence):
+        followers = defaultdict(set)
+        for symbol, user_id in self._rows():
+            followers[symbol].add(user_id)
+
+        with self._lock:
+            self._followers = followers
+            self._seq = sequence
+            self._loaded_at = time.monotonic()
+        self._notify([None])
+
+    def _notify(self, changes):
+        for listener in self.listeners:
+            for change in changes:
+                listener(change)
+
+    def _replay(self, sequence):
+        keys = [
+            CHANGE_CACHE_KEY.format(seq=seq)
+            for seq in range(self._seq + 1, sequence + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            # Part of the log expired: start over from the database
+            self._load(sequence)
+            return
+        with self._lock:
+            for key in keys:
+                self._apply(*changes[key])
+            self._seq = sequence
+        self._notify([changes[key] for key in keys])
+
+    def _apply(self, following, user_id, symbols):
+        for symbol in symbols:
+            if following:
+                self._followers[symbol].add(user_id)
+            else:
+                followers = self._followers.get(symbol)
+                if followers is not None:
+                    followers.discard(user_id)
+                    if not followers:
+                        del self._followers[symbol]
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if (
+            self._seq is not None
+            and now - self._checked_at < CHANGE_CHECK_INTERVAL
+            and now - self._loaded_at < MAX_INDEX_AGE
+        ):
+            return
+
+        sequence = self.sequence
+        self._checked_at = now
+        if self._seq is None or now - self._loaded_at >= MAX_INDEX_AGE:
+            self._load(sequence)
+        elif sequence > self._seq:
+            self._replay(sequence)
+
+    def _record(self, following, user_id, symbols):
+        symbols = sorted(symbols)
+        if not symbols:
+            return
+        change = (following, user_id, symbols)
+        try:
+            sequence = cache.incr(SEQUENCE_CACHE_KEY)
+        except ValueError:
+            cache.add(SEQUENCE_CACHE_KEY, 0, timeout=None)
+            sequence = cache.incr(SEQUENCE_CACHE_KEY)
+        cache.set(CHANGE_CACHE_KEY.format(seq=sequence), change, CHANGE_TTL)
+        # Processes that never read the index do not load it just to write
+        if self._seq is not None:
+            with self._lock:
+                self._apply(*change)
+            self._notify([change])
+
+    def refresh(self):
+        """
+        Load the index or catch up with other processes' changes, at most
+        once per CHANGE_CHECK_INTERVAL.
+        """
+        self._ensure_loaded()
+
+    def follow(self, user_id, symbols):
+        """
+        Record that `user_id` follows `symbols` once the transaction commits.
+        """
+        symbols = list(symbols)
+        transaction.on_commit(lambda: self._record(True, user_id, symbols))
+
+    def unfollow(self, user_id, symbols):
+        symbols = list(symbols)
+        transaction.on_commit(lambda: self._record(False, user_id, symbols))
+
+    def followers_among(self, symbol, user_ids):
+        """
+        The users in `user_ids` who follow `symbol`; costs one dict lookup and
+        a set intersection (iterating the smaller side).
+        """
+        self._ensure_loaded()
+        with self._lock:
+            followers = self._followers.get(symbol)
+            if not followers:
+                return set()
+            return followers.intersection(user_ids)
+
+    def followed_by(self, user_ids):
+        """
+        {user_id: symbols followed} for `user_ids`, in one pass over the
+        index as it is (no refresh).
+        """
+        user_ids = set(user_ids)
+        followed = defaultdict(set)
+        with self._lock:
+            for symbol, followers in self._followers.items():
+                for user_id in followers.intersection(user_ids):
+                    followed[user_id].add(symbol)
+        return followed
+
+
+follower_index = FollowerIndex()
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Aggregate the open sell orders into their price levels. A frozen copy of
+# the rebuild: the migration must keep doing the same whatever later happens
+# to authapp.repositories.price_level_repo
+BACKFILL_SQL = (
+    "INSERT INTO stocks_pricelevel (stock_id, price, quantity, orders) "
+    "SELECT stock_id, price, SUM(quantity), COUNT(*) FROM authapp_marketdata "
+    "WHERE transaction_type = 'SELL' "
+    "GROUP BY stock_id, price"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0008_price_alert'),
+        ('stocks', '0002_alter_stock_id_alter_stock_marketprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('quantity', models.PositiveIntegerField()),
+                ('orders', models.PositiveIntegerField()),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_levels', to='stocks.stock')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stock', 'price'), name='pricelevel_stock_price_uniq')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -13,3 +13,31 @@ class Stock(models.Model):
 
     def __str__(self):
         return f"{self.id} - {self.name}"
+
+
+class PriceLevel(models.Model):
+    """
+    One price of a stock's sell side: the shares and orders resting at it.
+
+    Derived from the open SELL rows of MarketData and kept in step by the sell
+    and buy paths, so the top of book and the depth are read from a handful of
+    rows instead of aggregating the orders.
+    """
+
+    stock = models.ForeignKey(
+        Stock, on_delete=models.CASCADE, related_name="price_levels"
+    )
+    price = models.DecimalField(max_digits=20, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # Also the depth index: a stock's levels, cheapest first
+            models.UniqueConstraint(
+                fields=["stock", "price"], name="pricelevel_stock_price_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_id} - {self.quantity} @ {self.price}"
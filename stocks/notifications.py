@@ -0,0 +1,137 @@
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .followers import CHANGE_CHECK_INTERVAL, follower_index
+
+
+def flush_interval():
+    return getattr(settings, "PRICE_STREAM", {}).get("NOTIFY_INTERVAL", 0.25)
+
+
+class NotificationDispatcher:
+    """
+    Fan price ticks out to the watchlist streams of the symbols' followers.
+
+    A tick only records the newest data per (event, symbol). Every
+    NOTIFY_INTERVAL seconds the dispatcher looks up the online followers of
+    each ticked symbol in the follower index (one lookup per symbol, off the
+    event loop) and hands each user a single batch holding all of their
+    updates, so a symbol's follower count never turns into per-tick queries
+    or per-update writes.
+
+    While streams are connected it also keeps the index current and hands
+    each follow/unfollow of a connected user to the user's subscribers
+    (`follow(symbols)`/`unfollow(symbols)`/`set_symbols(symbols)`), so their
+    symbols are polled from the moment they are followed.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.connections = defaultdict(set)
+        self.ticks = {}
+        self.flushing = None
+        self.syncing = None
+        self.loop = None
+        index.listeners.append(self.on_follow_change)
+
+    def connect(self, user_id, subscriber):
+        self.connections[user_id].add(subscriber)
+        if self.syncing is None:
+            self.loop = asyncio.get_running_loop()
+            self.syncing = self.loop.create_task(self.sync())
+
+    def disconnect(self, user_id, subscriber):
+        subscribers = self.connections.get(user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.connections[user_id]
+
+    def on_follow_change(self, change):
+        """
+        Index listener; called from the thread that applied the change.
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.connections:
+            return
+        if change is None:
+            # Reloaded: resynchronize every connected user
+            followed = self.index.followed_by(list(self.connections))
+            loop.call_soon_threadsafe(self.resync, followed)
+        else:
+            loop.call_soon_threadsafe(self.apply_change, *change)
+
+    def apply_change(self, following, user_id, symbols):
+        for subscriber in self.connections.get(user_id, ()):
+            if following:
+                subscriber.follow(symbols)
+            else:
+                subscriber.unfollow(symbols)
+
+    def resync(self, followed):
+        for user_id, subscribers in self.connections.items():
+            for subscriber in subscribers:
+                subscriber.set_symbols(followed.get(user_id, ()))
+
+    def refresh_index(self):
+        close_old_connections()
+        try:
+            self.index.refresh()
+        finally:
+            close_old_connections()
+
+    async def sync(self):
+        refresh = sync_to_async(self.refresh_index, thread_sensitive=False)
+        try:
+            while self.connections:
+                await refresh()
+                await asyncio.sleep(CHANGE_CHECK_INTERVAL)
+        finally:
+            self.syncing = None
+
+    def on_tick(self, symbol, event, data):
+        if not self.connections:
+            return
+        self.ticks[(event, symbol)] = data
+        if self.flushing is None:
+            self.flushing = asyncio.get_running_loop().create_task(self.flush())
+
+    def route(self, ticks, online):
+        """
+        {user_id: {(event, symbol): data}} for the `online` users who follow a
+        ticked symbol. Runs in a worker thread: the index may need to load.
+        """
+        close_old_connections()
+        try:
+            followers = {
+                symbol: self.index.followers_among(symbol, online)
+                for symbol in {symbol for _, symbol in ticks}
+            }
+        finally:
+            close_old_connections()
+
+        batches = defaultdict(dict)
+        for (event, symbol), data in ticks.items():
+            for user_id in followers[symbol]:
+                batches[user_id][(event, symbol)] = data
+        return batches
+
+    async def flush(self):
+        route = sync_to_async(self.route, thread_sensitive=False)
+        try:
+            while self.ticks:
+                await asyncio.sleep(flush_interval())
+                ticks, self.ticks = self.ticks, {}
+                batches = await route(ticks, set(self.connections))
+                for user_id, updates in batches.items():
+                    for subscriber in self.connections.get(user_id, ()):
+                        subscriber.push_many(updates)
+        finally:
+            self.flushing = None
+
+
+dispatcher = NotificationDispatcher(follower_index)
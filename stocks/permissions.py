@@ -1,9 +1,11 @@
 from rest_framework.permissions import BasePermission
 
+from authapp.permission_registry import role_name
+
 
 class IsAdminUser(BasePermission):
     def has_permission(self, request, view):
-        if request.user.is_authenticated and request.user.role.name == "Admin":
+        if request.user.is_authenticated and role_name(request.user) == "Admin":
             return True
         return False
 
@@ -12,6 +14,6 @@ class IsUserOrReadOnly(BasePermission):
     def has_permission(self, request, view):
         if request.method == "GET":
             return True
-        if request.user and request.user.role == "User":
+        if request.user and role_name(request.user) == "User":
             return True
         return False
@@ -19,6 +19,21 @@ class StockSerializer(serializers.ModelSerializer):
         return value
 
 
+class StockTopOfBookSerializer(StockSerializer):
+    """
+    A stock with its best ask and the shares on sale at any price, read from
+    the annotations of `with_top_of_book()`.
+    """
+
+    best_ask = serializers.DecimalField(
+        max_digits=20, decimal_places=2, read_only=True, default=None
+    )
+    total_ask_size = serializers.IntegerField(read_only=True, default=0)
+
+    class Meta(StockSerializer.Meta):
+        fields = StockSerializer.Meta.fields + ["best_ask", "total_ask_size"]
+
+
 class AddStocksFollowSerializer(serializers.Serializer):
     stock_symbols = serializers.ListField(
         child=serializers.CharField(),
@@ -27,9 +42,8 @@ class AddStocksFollowSerializer(serializers.Serializer):
     )
 
     def validate_stock_symbols(self, value):
-        missing_stocks = [
-            symbol for symbol in value if not Stock.objects.filter(id=symbol).exists()
-        ]
+        existing = set(Stock.objects.filter(id__in=value).values_list("id", flat=True))
+        missing_stocks = [symbol for symbol in value if symbol not in existing]
         if missing_stocks:
             raise serializers.ValidationError(
                 f"Stocks not found: {', '.join(missing_stocks)}"
@@ -0,0 +1,433 @@
+"""
+Server-Sent Events stream of live prices and top of book.
+
+    GET /api/stream/prices/?symbols=VNM,FPT&token=<access token>
+    GET /api/stream/watchlist/?token=<access token>
+
+The token may also come in the usual `Authorization: Bearer` header;
+browsers' EventSource cannot set headers. The watchlist stream carries the
+same events for every stock the user follows.
+
+Each worker process runs one `SymbolPoller` per subscribed symbol. It polls
+the upstream intraday API and the order book every POLL_INTERVAL seconds and
+pushes what changed to every subscriber of the symbol, so the upstream load
+no longer grows with the number of clients. A subscriber holds only the
+latest unsent update per (event, symbol): a slow client skips intermediate
+updates instead of queuing them, and one whose connection stays blocked for
+SEND_TIMEOUT seconds is dropped.
+
+Events:
+
+    event: price   data: {"symbol", "market_price", "intraday"}
+    event: book    data: {"symbol", "best_ask", "ask_size", "ask_orders"}
+"""
+
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from authapp.authentication import ClaimsJWTAuthentication
+from authapp.models import UserStockFollowed
+from utils.renderers import ORJSONRenderer
+
+from .models import PriceLevel, Stock
+from .notifications import dispatcher
+from .upstream import fetch_intraday
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    "POLL_INTERVAL": 1.0,
+    "UPSTREAM_TIMEOUT": 5.0,
+    "HEARTBEAT_SECONDS": 15.0,
+    "SEND_TIMEOUT": 10.0,
+    "MAX_SYMBOLS": 20,
+}
+
+
+def stream_setting(name):
+    return getattr(settings, "PRICE_STREAM", {}).get(name, DEFAULTS[name])
+
+
+def read_book(symbol):
+    """
+    Best ask of `symbol` with the shares and orders resting at that price.
+    """
+    best = (
+        PriceLevel.objects.filter(stock_id=symbol)
+        .order_by("price")
+        .values_list("price", "quantity", "orders")
+        .first()
+    )
+    if best is None:
+        return {"symbol": symbol, "best_ask": None, "ask_size": 0, "ask_orders": 0}
+    price, size, orders = best
+    return {"symbol": symbol, "best_ask": price, "ask_size": size, "ask_orders": orders}
+
+
+def poll_symbol(symbol):
+    """
+    One snapshot of `symbol` per event type. Runs in a worker thread; the
+    price is left out when the upstream call fails.
+    """
+    close_old_connections()
+    try:
+        book = read_book(symbol)
+        market_price = (
+            Stock.objects.filter(pk=symbol)
+            .values_list("marketPrice", flat=True)
+            .first()
+        )
+    finally:
+        close_old_connections()
+
+    snapshot = {"book": book}
+    try:
+        intraday = fetch_intraday(symbol, timeout=stream_setting("UPSTREAM_TIMEOUT"))
+    except requests.RequestException as exc:
+        logger.warning("Price poll of %s failed: %s", symbol, exc)
+    else:
+        snapshot["price"] = {
+            "symbol": symbol,
+            "market_price": market_price,
+            "intraday": intraday,
+        }
+    return snapshot
+
+
+class Subscriber:
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def push(self, event, symbol, data):
+        # Coalesce: a newer update replaces the unsent one
+        self.pending[(event, symbol)] = data
+        self.ready.set()
+
+    def push_many(self, updates):
+        self.pending.update(updates)
+        self.ready.set()
+
+    def take(self):
+        pending, self.pending = self.pending, {}
+        self.ready.clear()
+        return pending
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+
+class WatchlistSubscriber(Subscriber):
+    """
+    Subscriber of a watchlist stream: keeps exactly the symbols the user
+    follows polled, as the dispatcher reports follows and unfollows.
+    """
+
+    def __init__(self, hub, symbols):
+        super().__init__(set())
+        self.hub = hub
+        self.follow(symbols)
+
+    def follow(self, symbols):
+        for symbol in set(symbols) - self.symbols:
+            self.symbols.add(symbol)
+            poller = self.hub.acquire(symbol)
+            # Start from the last known state instead of waiting a poll
+            for event, data in poller.latest.items():
+                self.push(event, symbol, data)
+
+    def unfollow(self, symbols):
+        for symbol in self.symbols.intersection(symbols):
+            self.symbols.discard(symbol)
+            self.hub.release(symbol)
+
+    def set_symbols(self, symbols):
+        symbols = set(symbols)
+        self.unfollow(self.symbols - symbols)
+        self.follow(symbols)
+
+
+class SymbolPoller:
+    def __init__(self, hub, symbol):
+        self.hub = hub
+        self.symbol = symbol
+        self.holders = 0
+        self.subscribers = set()
+        self.latest = {}
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        self.task.cancel()
+
+    def publish(self, snapshot):
+        for event, data in snapshot.items():
+            if data == self.latest.get(event):
+                continue
+            self.latest[event] = data
+            for subscriber in self.subscribers:
+                subscriber.push(event, self.symbol, data)
+            for listener in self.hub.tick_listeners:
+                listener(self.symbol, event, data)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        poll = sync_to_async(poll_symbol, thread_sensitive=False)
+        while True:
+            started = loop.time()
+            try:
+                self.publish(await poll(self.symbol))
+            except Exception:
+                logger.exception("Price poll of %s failed", self.symbol)
+            elapsed = loop.time() - started
+            await asyncio.sleep(max(stream_setting("POLL_INTERVAL") - elapsed, 0))
+
+
+class PriceHub:
+    """
+    The pollers of one worker process, shared by all its streams.
+    """
+
+    def __init__(self):
+        self.pollers = {}
+        # Called as listener(symbol, event, data) for every published change
+        self.tick_listeners = []
+
+    def acquire(self, symbol):
+        """
+        Keep `symbol` polled until the matching `release()`.
+        """
+        poller = self.pollers.get(symbol)
+        if poller is None:
+            poller = self.pollers[symbol] = SymbolPoller(self, symbol)
+            poller.start()
+        poller.holders += 1
+        return poller
+
+    def release(self, symbol):
+        poller = self.pollers[symbol]
+        poller.holders -= 1
+        if not poller.holders:
+            poller.stop()
+            del self.pollers[symbol]
+
+    def subscribe(self, symbols):
+        subscriber = Subscriber(symbols)
+        for symbol in symbols:
+            poller = self.acquire(symbol)
+            poller.subscribers.add(subscriber)
+            # Start from the last known state instead of waiting a poll
+            for event, data in poller.latest.items():
+                subscriber.push(event, symbol, data)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        for symbol in subscriber.symbols:
+            self.pollers[symbol].subscribers.discard(subscriber)
+            self.release(symbol)
+
+
+hub = PriceHub()
+hub.tick_listeners.append(dispatcher.on_tick)
+
+renderer = ORJSONRenderer()
+
+
+def format_event(event, data):
+    return b"event: %s\ndata: %s\n\n" % (event.encode(), renderer.render(data))
+
+
+def authenticate(raw_token):
+    authentication = ClaimsJWTAuthentication()
+    close_old_connections()
+    try:
+        return authentication.get_user(
+            authentication.get_validated_token(raw_token)
+        )
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    finally:
+        close_old_connections()
+
+
+def unknown_symbols(symbols):
+    close_old_connections()
+    try:
+        existing = set(
+            Stock.objects.filter(pk__in=symbols).values_list("pk", flat=True)
+        )
+    finally:
+        close_old_connections()
+    return [symbol for symbol in symbols if symbol not in existing]
+
+
+def parse_request(scope):
+    query = parse_qs(scope["query_string"].decode())
+    symbols = list(
+        dict.fromkeys(
+            symbol.strip()
+            for value in query.get("symbols", [])
+            for symbol in value.split(",")
+            if symbol.strip()
+        )
+    )
+    token = query.get("token", [None])[0]
+    if token is None:
+        headers = dict(scope["headers"])
+        scheme, _, value = headers.get(b"authorization", b"").decode().partition(" ")
+        if scheme == "Bearer":
+            token = value
+    return symbols, token
+
+
+async def send_error(send, status, message):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": renderer.render(message)})
+
+
+async def watch_disconnect(receive, subscriber):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            subscriber.close()
+            return
+
+
+async def open_stream(send):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # Stop nginx from buffering the stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+
+
+async def price_stream(scope, receive, send):
+    if scope["method"] != "GET":
+        return await send_error(send, 405, {"error": "Method not allowed"})
+
+    symbols, token = parse_request(scope)
+    if not symbols:
+        return await send_error(send, 400, {"error": "No symbols requested"})
+    if len(symbols) > stream_setting("MAX_SYMBOLS"):
+        return await send_error(
+            send,
+            400,
+            {"error": f"At most {stream_setting('MAX_SYMBOLS')} symbols per stream"},
+        )
+    if not token or await sync_to_async(authenticate)(token) is None:
+        return await send_error(send, 401, {"error": "Invalid or missing token"})
+    unknown = await sync_to_async(unknown_symbols)(symbols)
+    if unknown:
+        return await send_error(
+            send, 404, {"error": f"Stocks not found: {', '.join(unknown)}"}
+        )
+
+    await open_stream(send)
+    subscriber = hub.subscribe(symbols)
+    watcher = asyncio.create_task(watch_disconnect(receive, subscriber))
+    try:
+        await stream_events(subscriber, send)
+    finally:
+        hub.unsubscribe(subscriber)
+        watcher.cancel()
+
+
+def followed_symbols(user_id):
+    close_old_connections()
+    try:
+        return list(
+            UserStockFollowed.objects.filter(user_id=user_id).values_list(
+                "stock_id", flat=True
+            )
+        )
+    finally:
+        close_old_connections()
+
+
+async def watchlist_stream(scope, receive, send):
+    """
+    Updates for every stock the user follows, delivered in per-user batches
+    by the notification dispatcher. The stocks followed are polled while the
+    stream is open, including those followed after it connected.
+    """
+    if scope["method"] != "GET":
+        return await send_error(send, 405, {"error": "Method not allowed"})
+
+    _, token = parse_request(scope)
+    user = await sync_to_async(authenticate)(token) if token else None
+    if user is None:
+        return await send_error(send, 401, {"error": "Invalid or missing token"})
+    symbols = await sync_to_async(followed_symbols)(user.pk)
+
+    await open_stream(send)
+    subscriber = WatchlistSubscriber(hub, symbols)
+    dispatcher.connect(user.pk, subscriber)
+    watcher = asyncio.create_task(watch_disconnect(receive, subscriber))
+    try:
+        await stream_events(subscriber, send)
+    finally:
+        dispatcher.disconnect(user.pk, subscriber)
+        subscriber.unfollow(list(subscriber.symbols))
+        watcher.cancel()
+
+
+STREAMS = {
+    "/api/stream/prices/": price_stream,
+    "/api/stream/watchlist/": watchlist_stream,
+}
+
+
+async def stream_events(subscriber, send):
+    while not subscriber.closed:
+        try:
+            await asyncio.wait_for(
+                subscriber.ready.wait(), stream_setting("HEARTBEAT_SECONDS")
+            )
+        except asyncio.TimeoutError:
+            body = b": keep-alive\n\n"
+        else:
+            body = b"".join(
+                format_event(event, data)
+                for (event, _), data in subscriber.take().items()
+            )
+        if subscriber.closed:
+            return
+
+        try:
+            await asyncio.wait_for(
+                send({"type": "http.response.body", "body": body, "more_body": True}),
+                stream_setting("SEND_TIMEOUT"),
+            )
+        except asyncio.TimeoutError:
+            logger.info("Dropping slow price stream of %s", subscriber.symbols)
+            return
+        except OSError:
+            # The client went away mid-write
+            return
@@ -1,3 +1,507 @@
-from django.test import TestCase
+import asyncio
+from collections import Counter
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from authapp.repositories.price_level_repo import with_top_of_book
+from utils.db_router import (
+    PrimaryReplicaRouter,
+    ReplicaRoutingMiddleware,
+    bind_user,
+    use_primary,
+)
+from utils.testing import QUERY_COUNT_TEST_SETTINGS, QueryCountTestMixin
+
+from .followers import CHANGE_CACHE_KEY, FollowerIndex
+from .models import Stock
+from .notifications import NotificationDispatcher
+from .serializers import StockTopOfBookSerializer
+from .streaming import PriceHub, Subscriber, WatchlistSubscriber, stream_events
+
 
 # Create your tests here.
+
+REPLICA = settings.TEST_REPLICA_ALIAS
+
+
+@override_settings(**QUERY_COUNT_TEST_SETTINGS)
+class StocksQueryCountTests(QueryCountTestMixin, APITestCase):
+    """
+    Every stocks endpoint runs a fixed number of queries, whatever the number
+    of stocks listed or followed.
+    """
+
+    def test_stock_list(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(2, self.client.get, "/api/stocks/")
+        self.assertEqual(response.status_code, 200)
+
+        def normalize(row):
+            # SQLite drops the scale of computed decimals; Postgres keeps it
+            if connection.vendor == "sqlite" and row["best_ask"] is not None:
+                row["best_ask"] = f"{Decimal(row['best_ask']):.2f}"
+
+        self.assertListMatchesSerializer(
+            "/api/stocks/",
+            StockTopOfBookSerializer,
+            with_top_of_book(Stock.objects.all()),
+            normalize,
+        )
+
+    def test_stock_retrieve(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            1, self.client.get, f"/api/stocks/{self.data.book_stock.pk}/"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_stock_depth(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            2, self.client.get, f"/api/stocks/{self.data.book_stock.pk}/depth/"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["asks"],
+            [{"price": "10.00", "quantity": 10 * self.FANOUT, "orders": self.FANOUT}],
+        )
+        self.assertEqual(response.json()["total_ask_size"], 10 * self.FANOUT)
+
+    def test_stock_depth_levels_bounds(self):
+        self.authenticate(self.data.trader)
+        for levels in ("0", "51", "ten"):
+            response = self.client.get(
+                f"/api/stocks/{self.data.book_stock.pk}/depth/", {"levels": levels}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_stock_create(self):
+        self.authenticate(self.data.admin)
+        response = self.assertMaxQueries(
+            2,
+            self.client.post,
+            "/api/stocks/",
+            {
+                "id": "NEW",
+                "name": "New stock",
+                "marketPrice": "10.00",
+                "sectionIndex": "TEST",
+                "details": {},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_stock_update(self):
+        self.authenticate(self.data.admin)
+        response = self.assertMaxQueries(
+            2,
+            self.client.patch,
+            f"/api/stocks/{self.data.book_stock.pk}/",
+            {"marketPrice": "11.00"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_market_price(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            2, self.client.get, "/api/stocks/market-price/"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_section_index(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            2, self.client.get, "/api/stocks/section-index/"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_list(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(1, self.client.get, "/api/stocks/follow/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_add(self):
+        self.authenticate(self.data.sellers[0])
+        response = self.assertMaxQueries(
+            6,
+            self.client.post,
+            "/api/stocks/follow/add/",
+            {"stock_symbols": [stock.pk for stock in self.data.stocks]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["added_stocks"]), self.FANOUT + 1)
+
+    def test_follow_remove(self):
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            3,
+            self.client.post,
+            "/api/stocks/follow/remove/",
+            {"stock_symbols": [stock.pk for stock in self.data.stocks]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["removed_stocks"]), self.FANOUT + 1)
+
+    @mock.patch("stocks.upstream.requests.get")
+    def test_stock_price(self, get):
+        get.return_value.json.return_value = {"result": []}
+        self.authenticate(self.data.trader)
+        response = self.assertMaxQueries(
+            0, self.client.get, f"/api/stocks/{self.data.book_stock.pk}/price/"
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class StocksQueryCountFanOutTests(StocksQueryCountTests):
+    FANOUT = 25
+
+
+@override_settings(
+    **QUERY_COUNT_TEST_SETTINGS,
+    DATABASE_REPLICAS=[REPLICA],
+    REPLICA_STICKY_SECONDS=60,
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Route through the replica alias that mirrors the test database: queries
+    land on the alias the router picks, with the primary's data.
+    """
+
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        cache.clear()
+
+    def in_request(self, func):
+        return ReplicaRoutingMiddleware(lambda request: func())(None)
+
+    def read_alias(self):
+        return self.router.db_for_read(Stock)
+
+    def write(self):
+        Stock.objects.create(
+            id="RT", name="Routed", marketPrice=1, sectionIndex="TEST", details={}
+        )
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(self.read_alias(), DEFAULT_DB_ALIAS)
+
+    def test_request_reads_use_the_replica(self):
+        with (
+            CaptureQueriesContext(connections[REPLICA]) as replica,
+            CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary,
+        ):
+            response = self.client.get("/api/stocks/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica.captured_queries)
+        self.assertFalse(primary.captured_queries)
+
+    def test_writes_pin_the_request_to_the_primary(self):
+        def write_then_read():
+            self.assertEqual(self.read_alias(), REPLICA)
+            self.write()
+            return self.read_alias()
+
+        self.assertEqual(self.in_request(write_then_read), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(Stock), DEFAULT_DB_ALIAS)
+
+    def test_reads_after_a_write_stick_to_the_primary(self):
+        def bound(user_id, func=None):
+            def run():
+                bind_user(user_id)
+                if func:
+                    func()
+                return self.read_alias()
+
+            return self.in_request(run)
+
+        bound(1, self.write)
+        self.assertEqual(bound(1), DEFAULT_DB_ALIAS)
+        self.assertEqual(bound(2), REPLICA)
+        cache.clear()
+        self.assertEqual(bound(1), REPLICA)
+
+    def test_reads_inside_atomic_use_the_primary(self):
+        def read_in_atomic():
+            with transaction.atomic():
+                return self.read_alias()
+
+        self.assertEqual(self.in_request(read_in_atomic), DEFAULT_DB_ALIAS)
+
+    def test_use_primary(self):
+        def read_in_use_primary():
+            with use_primary():
+                return self.read_alias()
+
+        self.assertEqual(self.in_request(read_in_use_primary), DEFAULT_DB_ALIAS)
+
+
+class StaticFollowerIndex(FollowerIndex):
+    """
+    A follower index loaded from `rows` instead of the database.
+    """
+
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+        self.loads = 0
+
+    def _rows(self):
+        self.loads += 1
+        return list(self.rows)
+
+
+@mock.patch("stocks.followers.CHANGE_CHECK_INTERVAL", 0)
+class FollowerIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rows = [("VNM", 1), ("FPT", 1), ("VNM", 2)]
+        # Two processes sharing the cache
+        self.local = StaticFollowerIndex(self.rows)
+        self.remote = StaticFollowerIndex(self.rows)
+        self.local.refresh()
+        self.remote.refresh()
+
+    def test_changes_are_replayed_by_other_processes(self):
+        changes = []
+        self.remote.listeners.append(changes.append)
+        # Changes are recorded once the follow commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.local.follow(3, ["VNM"])
+            self.local.unfollow(1, ["VNM"])
+            self.assertEqual(self.local.followers_among("VNM", {3}), set())
+
+        self.assertEqual(self.local.followers_among("VNM", {1, 2, 3}), {2, 3})
+        self.assertEqual(self.remote.followers_among("VNM", {1, 2, 3}), {2, 3})
+        self.assertEqual(changes, [(True, 3, ["VNM"]), (False, 1, ["VNM"])])
+        self.assertEqual(self.remote.loads, 1)
+
+    def test_expired_log_reloads(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.local.follow(3, ["VNM"])
+        cache.delete(CHANGE_CACHE_KEY.format(seq=self.local.sequence))
+        self.rows.append(("VNM", 3))
+
+        self.assertEqual(self.remote.followers_among("VNM", {3}), {3})
+        self.assertEqual(self.remote.loads, 2)
+
+    def test_old_index_reloads(self):
+        changes = []
+        self.remote.listeners.append(changes.append)
+        self.rows.append(("FPT", 2))
+        with mock.patch("stocks.followers.MAX_INDEX_AGE", 0):
+            self.assertEqual(self.remote.followers_among("FPT", {1, 2}), {1, 2})
+        self.assertEqual(self.remote.loads, 2)
+        self.assertEqual(changes, [None])
+
+    def test_followed_by(self):
+        self.assertEqual(self.local.followed_by([1, 3]), {1: {"VNM", "FPT"}})
+
+
+class RecordingSubscriber:
+    def __init__(self, symbols=()):
+        self.batches = []
+        self.symbols = set(symbols)
+
+    def push_many(self, updates):
+        self.batches.append(updates)
+
+    def follow(self, symbols):
+        self.symbols.update(symbols)
+
+    def unfollow(self, symbols):
+        self.symbols.difference_update(symbols)
+
+    def set_symbols(self, symbols):
+        self.symbols = set(symbols)
+
+
+@override_settings(PRICE_STREAM={"NOTIFY_INTERVAL": 0})
+@mock.patch("stocks.followers.CHANGE_CHECK_INTERVAL", 0)
+@mock.patch("stocks.notifications.CHANGE_CHECK_INTERVAL", 0.01)
+class NotificationDispatcherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.index = StaticFollowerIndex([("VNM", 1), ("FPT", 1), ("VNM", 2)])
+        self.dispatcher = NotificationDispatcher(self.index)
+
+    def record(self, following, user_id, symbols):
+        with self.captureOnCommitCallbacks(execute=True):
+            if following:
+                self.index.follow(user_id, symbols)
+            else:
+                self.index.unfollow(user_id, symbols)
+
+    async def disconnect(self, *connections):
+        for user_id, subscriber in connections:
+            self.dispatcher.disconnect(user_id, subscriber)
+        if self.dispatcher.syncing is not None:
+            await self.dispatcher.syncing
+
+    async def test_ticks_are_batched_per_user(self):
+        first, second, offline = (RecordingSubscriber() for _ in range(3))
+        self.dispatcher.connect(1, first)
+        self.dispatcher.connect(2, second)
+
+        self.dispatcher.on_tick("VNM", "price", {"p": 1})
+        self.dispatcher.on_tick("VNM", "price", {"p": 2})
+        self.dispatcher.on_tick("FPT", "book", {"b": 1})
+        self.dispatcher.on_tick("HPG", "price", {"p": 3})
+        await self.dispatcher.flushing
+
+        self.assertEqual(
+            first.batches,
+            [{("price", "VNM"): {"p": 2}, ("book", "FPT"): {"b": 1}}],
+        )
+        self.assertEqual(second.batches, [{("price", "VNM"): {"p": 2}}])
+        self.assertEqual(offline.batches, [])
+        await self.disconnect((1, first), (2, second))
+
+    async def test_follow_changes_reach_connected_subscribers(self):
+        subscriber = RecordingSubscriber()
+        self.dispatcher.connect(1, subscriber)
+        # Loading the index resynchronizes the connected users
+        while subscriber.symbols != {"VNM", "FPT"}:
+            await asyncio.sleep(0.01)
+
+        await sync_to_async(self.record)(True, 1, ["HPG"])
+        await sync_to_async(self.record)(False, 1, ["FPT"])
+        await asyncio.sleep(0)
+        self.assertEqual(subscriber.symbols, {"VNM", "HPG"})
+        await self.disconnect((1, subscriber))
+
+
+class FakeHub:
+    def __init__(self):
+        self.held = Counter()
+
+    def acquire(self, symbol):
+        self.held[symbol] += 1
+        return SimpleNamespace(latest={"price": {"symbol": symbol}})
+
+    def release(self, symbol):
+        self.held[symbol] -= 1
+
+
+class WatchlistSubscriberTests(SimpleTestCase):
+    async def test_pollers_follow_the_watchlist(self):
+        hub = FakeHub()
+        subscriber = WatchlistSubscriber(hub, ["VNM"])
+        self.assertEqual(subscriber.take(), {("price", "VNM"): {"symbol": "VNM"}})
+
+        subscriber.follow(["VNM", "FPT"])
+        subscriber.unfollow(["VNM", "HPG"])
+        self.assertEqual(subscriber.symbols, {"FPT"})
+        self.assertEqual(+hub.held, Counter({"FPT": 1}))
+
+        subscriber.set_symbols(["HPG"])
+        subscriber.unfollow(list(subscriber.symbols))
+        self.assertEqual(+hub.held, Counter())
+
+
+def fake_snapshot(symbol):
+    return {"book": {"symbol": symbol, "best_ask": "10.00"}}
+
+
+@override_settings(
+    PRICE_STREAM={
+        "POLL_INTERVAL": 0.01,
+        "HEARTBEAT_SECONDS": 0.05,
+        "SEND_TIMEOUT": 0.05,
+    }
+)
+@mock.patch("stocks.streaming.poll_symbol", fake_snapshot)
+class PriceStreamTests(SimpleTestCase):
+    async def wait_ready(self, *subscribers):
+        await asyncio.wait_for(
+            asyncio.gather(*(subscriber.ready.wait() for subscriber in subscribers)),
+            1,
+        )
+
+    async def test_one_poller_fans_out_to_every_subscriber(self):
+        hub = PriceHub()
+        ticks = []
+        hub.tick_listeners.append(lambda *tick: ticks.append(tick))
+        first, second = hub.subscribe(["VNM"]), hub.subscribe(["VNM", "FPT"])
+        self.assertEqual(set(hub.pollers), {"VNM", "FPT"})
+        self.assertEqual(hub.pollers["VNM"].holders, 2)
+
+        await self.wait_ready(first, second)
+        await asyncio.sleep(0.05)
+        self.assertEqual(first.take(), {("book", "VNM"): fake_snapshot("VNM")["book"]})
+        self.assertEqual(set(second.take()), {("book", "VNM"), ("book", "FPT")})
+        # Unchanged snapshots are published once
+        self.assertCountEqual(
+            ticks,
+            [
+                ("VNM", "book", fake_snapshot("VNM")["book"]),
+                ("FPT", "book", fake_snapshot("FPT")["book"]),
+            ],
+        )
+
+        # Late subscribers start from the last known state
+        late = hub.subscribe(["VNM"])
+        self.assertEqual(set(late.take()), {("book", "VNM")})
+
+        for subscriber in (first, second, late):
+            hub.unsubscribe(subscriber)
+        self.assertEqual(hub.pollers, {})
+
+    async def test_unsent_updates_coalesce(self):
+        subscriber = Subscriber(["VNM"])
+        subscriber.push("price", "VNM", {"p": 1})
+        subscriber.push("book", "VNM", {"b": 1})
+        subscriber.push("price", "VNM", {"p": 2})
+        self.assertEqual(
+            subscriber.take(),
+            {("price", "VNM"): {"p": 2}, ("book", "VNM"): {"b": 1}},
+        )
+        self.assertFalse(subscriber.ready.is_set())
+
+    async def test_stream_sends_events_and_heartbeats(self):
+        subscriber = Subscriber(["VNM"])
+        bodies = []
+
+        async def send(message):
+            bodies.append(message["body"])
+            if len(bodies) == 2:
+                subscriber.close()
+
+        subscriber.push("price", "VNM", {"symbol": "VNM"})
+        await asyncio.wait_for(stream_events(subscriber, send), 1)
+        self.assertEqual(
+            bodies,
+            [b'event: price\ndata: {"symbol":"VNM"}\n\n', b": keep-alive\n\n"],
+        )
+
+    async def test_slow_consumer_is_dropped(self):
+        subscriber = Subscriber(["VNM"])
+        blocked = asyncio.Event()
+
+        async def send(message):
+            await blocked.wait()
+
+        subscriber.push("price", "VNM", {"symbol": "VNM"})
+        with self.assertLogs("stocks.streaming", "INFO") as logs:
+            await asyncio.wait_for(stream_events(subscriber, send), 1)
+        self.assertIn("Dropping slow price stream", logs.output[0])
+        self.assertFalse(subscriber.closed)
@@ -0,0 +1,16 @@
+import requests
+
+
+INTRADAY_URL = (
+    "https://fwtapi4.fialda.com/api/services/app/Stock/GetIntraday?symbol={symbol}"
+)
+
+
+def fetch_intraday(symbol, timeout=None):
+    """
+    Intraday prices of `symbol` from the upstream market data API. Raises
+    `requests.RequestException` on network and HTTP errors.
+    """
+    response = requests.get(INTRADAY_URL.format(symbol=symbol), timeout=timeout)
+    response.raise_for_status()
+    return response.json()
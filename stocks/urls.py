@@ -22,6 +22,11 @@ urlpatterns = [
         UserStockFollowViewSet.as_view({"post": "create"}),  # add stock follow by user
         name="follow_add",
     ),
+    path(
+        "stocks/follow/remove/",
+        UserStockFollowViewSet.as_view({"post": "remove"}),  # unfollow stocks
+        name="follow_remove",
+    ),
     path(
         "stocks/<symbol>/price/",
         StockPriceView.as_view({"get": "get_stock_price"}),  # Get current info stocks
@@ -2,36 +2,77 @@ from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 import requests
 from rest_framework.pagination import PageNumberPagination
 
+from .followers import follower_index
 from .models import Stock
-from .serializers import StockSerializer, AddStocksFollowSerializer
+from .serializers import (
+    StockSerializer,
+    StockTopOfBookSerializer,
+    AddStocksFollowSerializer,
+)
+from .upstream import fetch_intraday
 from .permissions import IsAdminUser, IsUserOrReadOnly
 from authapp.models import UserStockFollowed
+from authapp.repositories.price_level_repo import ask_levels, with_top_of_book
+from utils.fast_list import ValuesListMixin
+from utils.server_timing import timed
 
 
-class StockViewSet(viewsets.ModelViewSet):
+DEPTH_LEVELS = 10
+MAX_DEPTH_LEVELS = 50
+
+
+class StockViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Stock.objects.all()
-    serializer_class = StockSerializer
+    serializer_class = StockTopOfBookSerializer
+    list_values = {field: field for field in StockTopOfBookSerializer.Meta.fields}
     permission_classes = [IsAdminUser | IsUserOrReadOnly]
     pagination_class = PageNumberPagination
+    query_budgets = {"list": 2, "depth": 2}
+
+    def get_queryset(self):
+        return with_top_of_book(super().get_queryset())
 
-    def paginate_queryset(self, queryset, request):
-        paginator = self.pagination_class()
-        paginated_queryset = paginator.paginate_queryset(queryset, request)
-        return paginator.get_paginated_response(paginated_queryset)
+    def paginated_response(self, queryset):
+        return self.get_paginated_response(self.paginate_queryset(queryset))
 
     @action(detail=False, methods=["get"], url_path="market-price")
     def get_market_price(self, request):
         stocks = Stock.objects.values("id", "name", "marketPrice")
-        return self.paginate_queryset(stocks, request)
+        return self.paginated_response(stocks)
 
     @action(detail=False, methods=["get"], url_path="section-index")
     def get_section_index(self, request):
         stocks = Stock.objects.values("id", "name", "sectionIndex")
-        return self.paginate_queryset(stocks, request)
+        return self.paginated_response(stocks)
+
+    @action(detail=True, methods=["get"])
+    def depth(self, request, pk=None):
+        """
+        The `?levels=` (default 10) cheapest price levels of the sell side.
+        """
+        try:
+            levels = int(request.query_params.get("levels", DEPTH_LEVELS))
+        except ValueError:
+            levels = 0
+        if not 1 <= levels <= MAX_DEPTH_LEVELS:
+            raise ValidationError(
+                {"levels": [f"Must be an integer from 1 to {MAX_DEPTH_LEVELS}."]}
+            )
+
+        stock = self.get_object()
+        return Response(
+            {
+                "symbol": stock.pk,
+                "best_ask": stock.best_ask,
+                "total_ask_size": stock.total_ask_size,
+                "asks": ask_levels(stock, levels),
+            }
+        )
 
 
 class UserStockFollowViewSet(
@@ -43,7 +84,7 @@ class UserStockFollowViewSet(
     serializer_class = AddStocksFollowSerializer
 
     def get_serializer_class(self):
-        if self.action == "create":
+        if self.action in ("create", "remove"):
             return AddStocksFollowSerializer
         return StockSerializer
 
@@ -76,6 +117,7 @@ class UserStockFollowViewSet(
         UserStockFollowed.objects.bulk_create(
             [UserStockFollowed(user=user, stock=stock) for stock in not_followed_stocks]
         )
+        follower_index.follow(user.pk, not_followed_symbols)
 
         return Response(
             {
@@ -85,6 +127,28 @@ class UserStockFollowViewSet(
             status=status.HTTP_201_CREATED,
         )
 
+    def remove(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        stock_symbols = serializer.validated_data["stock_symbols"]
+        user = request.user
+
+        followed = UserStockFollowed.objects.filter(
+            user=user, stock_id__in=stock_symbols
+        )
+        removed = set(followed.values_list("stock_id", flat=True))
+        followed.delete()
+        follower_index.unfollow(user.pk, removed)
+
+        return Response(
+            {
+                "removed_stocks": sorted(removed),
+                "not_followed": sorted(set(stock_symbols) - removed),
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 # Get current stock's price
 class StockPriceView(viewsets.ViewSet):
@@ -95,12 +159,9 @@ class StockPriceView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_stock_price(self, request, symbol=None):
-        url = f"https://fwtapi4.fialda.com/api/services/app/Stock/GetIntraday?symbol={symbol}"
-
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            with timed("upstream-http"):
+                data = fetch_intraday(symbol)
             return Response(data, status=status.HTTP_200_OK)
         except requests.exceptions.RequestException as e:
             return Response(
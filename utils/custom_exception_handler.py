@@ -42,11 +42,10 @@ handler500 = custom_500_handler
 def custom_exception_handler(exc, context):
     response = exception_handler(exc, context)
 
-    logger.error(
-        f"Exception occurred: {type(exc).__name__} - {str(exc)}", exc_info=True
-    )
-
     if response is None:
+        logger.error(
+            f"Exception occurred: {type(exc).__name__} - {str(exc)}", exc_info=True
+        )
         return Response(
             {
                 "error": "Internal Server Error",
@@ -89,4 +88,15 @@ def custom_exception_handler(exc, context):
             "Something went wrong",
         )
 
+    # Client errors are routine: no traceback, and rate limited by key
+    if response.status_code < 500:
+        logger.warning(
+            "Client error %s %s: %s - %s",
+            response.status_code,
+            context["request"].path,
+            type(exc).__name__,
+            exc,
+            extra={"rate_limit_key": f"{type(exc).__name__}:{response.status_code}"},
+        )
+
     return response
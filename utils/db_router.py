@@ -0,0 +1,121 @@
+"""
+Primary/replica routing with read-after-write stickiness.
+
+Inside a request (see `ReplicaRoutingMiddleware`) reads go to a random alias
+of `settings.DATABASE_REPLICAS`, except when:
+
+- the request is inside an atomic block or a `use_primary()` block,
+- the request already wrote, or
+- the authenticated user wrote within the last REPLICA_STICKY_SECONDS (tracked
+  in the default cache, which is shared between workers: see the
+  authapp.E001 check).
+
+Everything outside a request (commands, threads, shells) uses the primary.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+STICKY_CACHE_KEY = "db:sticky:{user_id}"
+
+
+class RoutingState:
+    __slots__ = ("user_id", "pinned", "wrote")
+
+    def __init__(self):
+        self.user_id = None
+        self.pinned = False
+        self.wrote = False
+
+
+_state = ContextVar("db_routing_state", default=None)
+_force_primary = ContextVar("db_force_primary", default=False)
+
+
+def sticky_seconds():
+    return getattr(settings, "REPLICA_STICKY_SECONDS", 5.0)
+
+
+@contextmanager
+def use_primary():
+    """
+    Route every query in the block (or decorated function) to the primary.
+    """
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def bind_user(user_id):
+    """
+    Attach the authenticated user to the current request, pinning it to the
+    primary if that user wrote recently.
+    """
+    state = _state.get()
+    if state is None or state.user_id == user_id:
+        return
+    state.user_id = user_id
+    if not state.pinned and cache.get(STICKY_CACHE_KEY.format(user_id=user_id)):
+        state.pinned = True
+
+
+def _record_write():
+    state = _state.get()
+    if state is None or state.wrote:
+        return
+    state.wrote = state.pinned = True
+    if state.user_id is not None:
+        cache.set(
+            STICKY_CACHE_KEY.format(user_id=state.user_id), True, sticky_seconds()
+        )
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", ())
+        state = _state.get()
+        if (
+            not replicas
+            or state is None
+            or state.pinned
+            or _force_primary.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _record_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Give every request its own routing state; without it all reads use the
+    primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _state.set(RoutingState())
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
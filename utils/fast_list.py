@@ -0,0 +1,49 @@
+"""
+Serve read-only list endpoints straight from `QuerySet.values()`.
+
+Building a model instance and running every serializer field's
+`to_representation` dominates large list responses. Views whose list output
+is plain column data can declare it instead:
+
+    class MarketDataViewSet(ValuesListMixin, BaseReadOnlyViewSet):
+        list_values = {
+            "id": "id",
+            "username": "user__username",
+            "price": "price",
+        }
+
+Keys are output names, values are lookups (or expressions). Filtering,
+ordering and pagination run as usual; the renderer (`ORJSONRenderer`, on
+its orjson and its indented stdlib path alike) turns the remaining `Decimal`
+and `datetime` values into the same strings the serializer would.
+The serializer stays in charge of every other action.
+"""
+
+from django.db.models import F
+from rest_framework.response import Response
+
+
+class ValuesListMixin:
+    list_values = None
+
+    def get_list_values(self):
+        fields, expressions = [], {}
+        for name, lookup in self.list_values.items():
+            if lookup == name:
+                fields.append(name)
+            else:
+                expressions[name] = F(lookup) if isinstance(lookup, str) else lookup
+        return fields, expressions
+
+    def list(self, request, *args, **kwargs):
+        if self.list_values is None:
+            return super().list(request, *args, **kwargs)
+
+        fields, expressions = self.get_list_values()
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values(*fields, **expressions)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(list(rows))
@@ -0,0 +1,205 @@
+"""
+Non-blocking logging handlers and noise-reduction filters.
+
+The async handlers only put records on a bounded in-memory queue; a
+`QueueListener` thread formats them and does the actual I/O. When the
+queue is full, records are dropped rather than blocking the request thread;
+`dropped_records()` counts them per handler for /metrics.
+"""
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+
+# Every async handler of the process, for dropped_records()
+_handlers = weakref.WeakSet()
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for a listener thread that hands them to the handler built
+    by `make_target()`: stderr here, subclasses override it. Level, formatter
+    and filters set by `dictConfig` apply as usual; formatting happens on the
+    listener thread.
+    """
+
+    def __init__(self, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = self.make_target()
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        _handlers.add(self)
+
+    def make_target(self):
+        return logging.StreamHandler()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        # The listener thread does not survive a fork: start one per process
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self._stop_listener)
+
+    def _stop_listener(self):
+        # Flushes the queued records; safe to call more than once
+        listener, self._listener = self._listener, None
+        if listener is not None and self._pid == os.getpid():
+            listener.stop()
+        self._pid = None
+
+    def prepare(self, record):
+        # Only resolve the message now: its arguments may change once the
+        # call returns. JSON and traceback formatting wait for the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def close(self):
+        self._stop_listener()
+        self.target.close()
+        super().close()
+
+
+class AsyncRotatingFileHandler(AsyncHandler):
+    def __init__(
+        self, filename, maxBytes=0, backupCount=0, encoding=None, queue_size=10000
+    ):
+        self.filename = filename
+        self.max_bytes = maxBytes
+        self.backup_count = backupCount
+        self.encoding = encoding
+        super().__init__(queue_size=queue_size)
+
+    def make_target(self):
+        return logging.handlers.RotatingFileHandler(
+            self.filename,
+            maxBytes=self.max_bytes,
+            backupCount=self.backup_count,
+            encoding=self.encoding,
+        )
+
+
+class AsyncStreamHandler(AsyncHandler):
+    def __init__(self, stream=None, queue_size=10000):
+        self.stream = stream
+        super().__init__(queue_size=queue_size)
+
+    def make_target(self):
+        return logging.StreamHandler(self.stream)
+
+
+def dropped_records():
+    """
+    {handler name: records dropped} of this process's async handlers.
+    """
+    dropped = {}
+    for handler in list(_handlers):
+        name = handler.get_name() or type(handler).__name__
+        dropped[name] = dropped.get(name, 0) + handler.dropped
+    return dropped
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records of the given levels, e.g.
+    `rates={"INFO": 0.1}`. Levels that are not listed are always kept.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = {
+            logging.getLevelName(level): rate for level, rate in (rates or {}).items()
+        }
+
+    def filter(self, record):
+        # Decide once per record, so every handler sharing the filter agrees
+        keep = getattr(record, "_sampled", None)
+        if keep is None:
+            rate = self.rates.get(record.levelno)
+            keep = record._sampled = rate is None or random.random() < rate
+        return keep
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `rate` records per `per` seconds for each repeated
+    message at or below `max_level`. Records are grouped by their
+    `rate_limit_key` extra, falling back to the unformatted message. The
+    first record after a suppressed burst carries `suppressed=<count>`.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, rate=10, per=60.0, max_level="WARNING"):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self.max_level = logging.getLevelName(max_level)
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def _prune(self, now):
+        self._windows = {
+            key: window
+            for key, window in self._windows.items()
+            if now - window[0] < self.per
+        }
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        # Handlers sharing this filter see the same record: count it once
+        allowed = getattr(record, "_rate_limit_allowed", None)
+        if allowed is None:
+            allowed = record._rate_limit_allowed = self._allow(record)
+        return allowed
+
+    def _allow(self, record):
+        key = (
+            record.name,
+            record.levelno,
+            getattr(record, "rate_limit_key", None) or str(record.msg),
+        )
+        now = time.monotonic()
+        with self._lock:
+            if len(self._windows) >= self.MAX_KEYS:
+                self._prune(now)
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.per:
+                started, count = now, 0
+            if count >= self.rate:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
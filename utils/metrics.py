@@ -0,0 +1,351 @@
+"""
+Always-on, low-overhead request metrics exposed in Prometheus text format.
+
+Every thread records into its own shard (a plain dict), so the request path
+takes no lock. Each worker process periodically writes its merged shards to
+`<METRICS_DIR>/<pid>.json`; `/metrics` merges the files of all live workers.
+Connection pool stats, when pooling is on, and the log records the async
+log handlers dropped travel in the same files.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from .log_handlers import dropped_records
+from .query_counter import count_queries
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Layout of one histogram row: count, duration sum, db queries, db seconds,
+# response bytes, then one (non-cumulative) slot per bucket plus +Inf.
+COUNT, DURATION, DB_QUERIES, DB_SECONDS, RESPONSE_BYTES = range(5)
+FIRST_BUCKET = 5
+ROW_SIZE = FIRST_BUCKET + len(BUCKETS) + 1
+
+# psycopg_pool stats exported per alias: stat, metric name, type, help
+POOL_METRICS = (
+    ("pool_size", "db_pool_connections", "gauge", "Connections open in the pool."),
+    ("pool_available", "db_pool_idle_connections", "gauge", "Idle connections."),
+    ("pool_max", "db_pool_max_connections", "gauge", "Configured pool size limit."),
+    ("requests_waiting", "db_pool_waiting", "gauge", "Checkouts waiting right now."),
+    ("requests_num", "db_pool_checkouts_total", "counter", "Connection checkouts."),
+    (
+        "requests_queued",
+        "db_pool_checkouts_queued_total",
+        "counter",
+        "Checkouts that had to wait for a connection.",
+    ),
+    (
+        "requests_wait_ms",
+        "db_pool_checkout_wait_ms_total",
+        "counter",
+        "Time spent waiting for a connection.",
+    ),
+    (
+        "requests_errors",
+        "db_pool_checkout_errors_total",
+        "counter",
+        "Checkouts that timed out or failed.",
+    ),
+    (
+        "returns_bad",
+        "db_pool_bad_returns_total",
+        "counter",
+        "Connections returned broken or mid-transaction.",
+    ),
+    ("connections_num", "db_pool_connects_total", "counter", "Connections opened."),
+    (
+        "connections_lost",
+        "db_pool_lost_total",
+        "counter",
+        "Connections found dead by the health check.",
+    ),
+)
+
+
+def metrics_dir():
+    return getattr(
+        settings,
+        "METRICS_DIR",
+        os.path.join(tempfile.gettempdir(), "stock_api_metrics"),
+    )
+
+
+def flush_interval():
+    return getattr(settings, "METRICS_FLUSH_INTERVAL", 5.0)
+
+
+class MetricsStore:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._retired = ({}, {})
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = ({}, {})
+            self._local.shard = shard
+            # Only taken once per thread
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_shards(self):
+        # Servers that spawn a thread per request would otherwise keep one
+        # shard per request forever
+        with self._shards_lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    _merge_into(self._retired, *shard)
+            self._shards = alive
+
+    def record(self, route, method, status, duration, queries, db_seconds, size):
+        histograms, statuses = self._shard()
+
+        row = histograms.get((route, method))
+        if row is None:
+            row = histograms[(route, method)] = [0] * ROW_SIZE
+        row[COUNT] += 1
+        row[DURATION] += duration
+        row[DB_QUERIES] += queries
+        row[DB_SECONDS] += db_seconds
+        row[RESPONSE_BYTES] += size
+        row[FIRST_BUCKET + bisect_left(BUCKETS, duration)] += 1
+
+        key = (route, method, status)
+        statuses[key] = statuses.get(key, 0) + 1
+
+        if time.monotonic() - self._flushed_at >= flush_interval():
+            self.flush()
+
+    def snapshot(self):
+        self._retire_dead_shards()
+        totals = ({}, {})
+        _merge_into(totals, *self._retired)
+        for _, shard in list(self._shards):
+            _merge_into(totals, *shard)
+
+        histograms, statuses = totals
+        return {
+            "histograms": [[*key, row] for key, row in histograms.items()],
+            "statuses": [[*key, count] for key, count in statuses.items()],
+            "pools": pool_stats(),
+            "log_dropped": dropped_records(),
+        }
+
+    def flush(self):
+        """
+        Write this process's totals to its file in the shared metrics dir.
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flushed_at = time.monotonic()
+            directory = metrics_dir()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as fileobj:
+                json.dump(self.snapshot(), fileobj, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        finally:
+            self._flush_lock.release()
+
+
+def _merge_into(totals, histograms, statuses):
+    total_histograms, total_statuses = totals
+    for key, row in list(histograms.items()):
+        merged = total_histograms.setdefault(key, [0] * ROW_SIZE)
+        for index, value in enumerate(row):
+            merged[index] += value
+    for key, count in list(statuses.items()):
+        total_statuses[key] = total_statuses.get(key, 0) + count
+
+
+store = MetricsStore()
+
+
+def pool_stats():
+    """
+    Stats of this process's connection pools, keyed by database alias.
+    """
+    stats = {}
+    for alias, database in settings.DATABASES.items():
+        if not database.get("OPTIONS", {}).get("pool"):
+            continue
+        current = connections[alias].pool.get_stats()
+        stats[alias] = {stat: current.get(stat, 0) for stat, *_ in POOL_METRICS}
+    return stats
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """
+    Merge the request metrics, pool stats and dropped log records of every
+    live worker process.
+    """
+    store.flush()
+    totals = ({}, {})
+    pools = {}
+    dropped = {}
+    directory = metrics_dir()
+
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not name.endswith(".json") or not name[:-5].isdigit():
+            continue
+        path = os.path.join(directory, name)
+        if not _pid_alive(int(name[:-5])):
+            os.remove(path)
+            continue
+        try:
+            with open(path) as fileobj:
+                data = json.load(fileobj)
+        except (OSError, ValueError):
+            continue
+
+        _merge_into(
+            totals,
+            {(route, method): row for route, method, row in data["histograms"]},
+            {
+                (route, method, status): count
+                for route, method, status, count in data["statuses"]
+            },
+        )
+        # Every worker has its own pools: report the deployment's total
+        for alias, stats in data.get("pools", {}).items():
+            merged = pools.setdefault(alias, {})
+            for stat, value in stats.items():
+                merged[stat] = merged.get(stat, 0) + value
+        for handler, count in data.get("log_dropped", {}).items():
+            dropped[handler] = dropped.get(handler, 0) + count
+
+    return (*totals, pools, dropped)
+
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return ",".join(f'{name}="{value}"' for name, value in escaped)
+
+
+def render_prometheus(histograms, statuses, pools=None, dropped=None):
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (route, method), row in sorted(histograms.items()):
+        cumulative = 0
+        for bound, slot in zip((*BUCKETS, "+Inf"), row[FIRST_BUCKET:]):
+            cumulative += slot
+            labels = _labels(route=route, method=method, le=bound)
+            lines.append(f"http_request_duration_seconds_bucket{{{labels}}} {cumulative}")
+        labels = _labels(route=route, method=method)
+        lines.append(f"http_request_duration_seconds_sum{{{labels}}} {row[DURATION]}")
+        lines.append(f"http_request_duration_seconds_count{{{labels}}} {row[COUNT]}")
+
+    counters = [
+        ("http_db_queries_total", "Database queries run by route.", DB_QUERIES),
+        ("http_db_query_seconds_total", "Time spent in the database by route.", DB_SECONDS),
+        ("http_response_bytes_total", "Response body bytes by route.", RESPONSE_BYTES),
+    ]
+    for name, help_text, index in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (route, method), row in sorted(histograms.items()):
+            lines.append(f"{name}{{{_labels(route=route, method=method)}}} {row[index]}")
+
+    lines.append("# HELP http_requests_total Requests by route and status.")
+    lines.append("# TYPE http_requests_total counter")
+    for (route, method, status), count in sorted(statuses.items()):
+        labels = _labels(route=route, method=method, status=status)
+        lines.append(f"http_requests_total{{{labels}}} {count}")
+
+    for stat, name, metric_type, help_text in POOL_METRICS if pools else ():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for alias, stats in sorted(pools.items()):
+            lines.append(f"{name}{{{_labels(alias=alias)}}} {stats.get(stat, 0)}")
+
+    if dropped:
+        lines.append(
+            "# HELP log_records_dropped_total Log records dropped because the "
+            "handler's queue was full."
+        )
+        lines.append("# TYPE log_records_dropped_total counter")
+        for handler, count in sorted(dropped.items()):
+            labels = _labels(handler=handler)
+            lines.append(f"log_records_dropped_total{{{labels}}} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    return HttpResponse(
+        render_prometheus(*collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def route_label(request):
+    match = request.resolver_match
+    if match is None:
+        return "unmatched"
+    return match.route.replace("^", "").replace("$", "")
+
+
+class MetricsMiddleware:
+    """
+    Record latency, query count/time and response size for every request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path_info == "/metrics":
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        store.record(
+            route_label(request),
+            request.method,
+            response.status_code,
+            duration,
+            queries.count,
+            queries.duration,
+            0 if response.streaming else len(response.content),
+        )
+        return response
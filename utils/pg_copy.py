@@ -0,0 +1,43 @@
+"""
+Thin wrappers around Postgres COPY that work with both psycopg2 and psycopg 3.
+
+Django's CursorWrapper exposes the driver cursor as `.cursor`; psycopg2 offers
+`copy_expert`, psycopg 3 offers the `copy()` context manager.
+"""
+
+COPY_READ_SIZE = 1024 * 1024
+
+
+def _raw_cursor(cursor):
+    return getattr(cursor, "cursor", cursor)
+
+
+def copy_to(cursor, sql, fileobj):
+    """
+    Run a `COPY ... TO STDOUT` statement and write its output to a binary file.
+    """
+    raw = _raw_cursor(cursor)
+    if hasattr(raw, "copy_expert"):
+        raw.copy_expert(sql, fileobj)
+        return
+
+    with raw.copy(sql) as copy:
+        for data in copy:
+            fileobj.write(data)
+
+
+def copy_from(cursor, sql, fileobj):
+    """
+    Run a `COPY ... FROM STDIN` statement, feeding it from a file-like object.
+    """
+    raw = _raw_cursor(cursor)
+    if hasattr(raw, "copy_expert"):
+        raw.copy_expert(sql, fileobj)
+        return
+
+    with raw.copy(sql) as copy:
+        while True:
+            data = fileobj.read(COPY_READ_SIZE)
+            if not data:
+                break
+            copy.write(data)
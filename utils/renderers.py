@@ -0,0 +1,86 @@
+"""
+orjson-backed JSON renderer and parser.
+
+orjson is optional: without it both classes behave like DRF's stdlib-based
+`JSONRenderer` and `JSONParser`. Output matches DRF's defaults (compact,
+UTF-8, decimals as strings, UTC datetimes ending in "Z"); requests for
+indented output (`Accept: application/json; indent=4`, the browsable API)
+also go through the stdlib path, whose encoder renders raw `Decimal` values
+as strings too.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .server_timing import TimedRendererMixin
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class DecimalStringEncoder(JSONEncoder):
+    """
+    DRF's encoder turns `Decimal` into a float; render raw values() rows
+    the way DecimalField does instead.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, Decimal) and api_settings.COERCE_DECIMAL_TO_STRING:
+            return str(obj)
+        return super().default(obj)
+
+
+_fallback = DecimalStringEncoder()
+
+
+def default(obj):
+    """
+    Types orjson does not serialize natively, the way DRF's encoder does.
+    """
+    # Serializers already render DecimalFields as strings; this covers raw
+    # values() rows
+    return _fallback.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    encoder_class = DecimalStringEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = orjson.OPT_NON_STR_KEYS
+        if settings.USE_TZ:
+            options |= orjson.OPT_UTC_Z
+        ret = orjson.dumps(data, default=default, option=options)
+        # Same as DRF: keep the output a strict JavaScript subset
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+            ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class TimedORJSONRenderer(TimedRendererMixin, ORJSONRenderer):
+    pass
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
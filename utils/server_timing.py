@@ -0,0 +1,133 @@
+"""
+Per-request `Server-Timing` breakdown and per-view query budgets.
+
+`ServerTimingMiddleware` counts the request's queries and reports them, with
+the time recorded by `timed()` blocks (auth, serialize, upstream-http), as
+`Server-Timing` and `X-DB-Queries` response headers.
+
+Views declare budgets by action (or lower-case method for plain APIViews):
+
+    class UserDetailViewSet(viewsets.GenericViewSet):
+        query_budgets = {"profile": 3}
+
+Exceeding one logs a warning, or raises when QUERY_BUDGET_MODE is "raise".
+The budget is checked once the view has returned, after its transactions
+committed, so requests that may write (anything but GET, HEAD and OPTIONS)
+never raise: they log and flag the response with `X-Query-Budget-Exceeded`.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+from .query_counter import count_queries
+
+logger = logging.getLogger(__name__)
+
+
+_timings = ContextVar("server_timings", default=None)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the current request's `name` metric.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class TimedRendererMixin:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+def query_budget(request, view_func):
+    view_class = getattr(view_func, "cls", None)
+    budgets = getattr(view_class, "query_budgets", None)
+    if not budgets:
+        return None, None
+
+    method = request.method.lower()
+    # ViewSets map the method to an action name; APIViews use the method
+    actions = getattr(view_func, "actions", None) or {}
+    name = actions.get(method, method)
+    return budgets.get(name), f"{view_class.__name__}.{name}"
+
+
+def format_server_timing(timings):
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" + (f';desc="{desc}"' if desc else "")
+        for name, seconds, desc in timings
+    )
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with count_queries() as queries:
+                response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        total = time.perf_counter() - start
+
+        response["Server-Timing"] = format_server_timing(
+            [
+                ("db", queries.duration, f"{queries.count} queries"),
+                *((name, seconds, None) for name, seconds in timings.items()),
+                ("total", total, None),
+            ]
+        )
+        response["X-DB-Queries"] = str(queries.count)
+
+        budget, view_name = getattr(request, "_query_budget", (None, None))
+        if budget is not None and queries.count > budget:
+            message = (
+                f"{view_name} ran {queries.count} queries "
+                f"(budget {budget}) for {request.method} {request.path}"
+            )
+            if (
+                getattr(settings, "QUERY_BUDGET_MODE", "log") == "raise"
+                and request.method in SAFE_METHODS
+            ):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+            response["X-Query-Budget-Exceeded"] = f"{queries.count};budget={budget}"
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = query_budget(request, view_func)
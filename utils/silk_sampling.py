@@ -0,0 +1,64 @@
+"""
+Sampled and on-demand request interception for django-silk.
+
+Silk records (and, with SILKY_PYTHON_PROFILER, cProfiles) only the requests
+for which `should_intercept` returns True: a configurable fraction per route
+prefix, plus any request carrying a valid signed profiling header.
+"""
+
+import random
+
+from django.conf import settings
+from django.core import signing
+
+
+PROFILE_TOKEN_SALT = "utils.silk_sampling.profile"
+
+DEFAULTS = {
+    "DEFAULT_RATE": 0.0,
+    "ROUTES": {},
+    "HEADER": "X-Silk-Profile",
+    "TOKEN_MAX_AGE": 300,
+}
+
+
+def sampling_setting(name):
+    return getattr(settings, "SILK_SAMPLING", {}).get(name, DEFAULTS[name])
+
+
+def sample_rate(path):
+    """
+    Rate of the longest matching route prefix, or the default rate.
+    """
+    routes = sampling_setting("ROUTES")
+    matches = [prefix for prefix in routes if path.startswith(prefix)]
+    if matches:
+        return routes[max(matches, key=len)]
+    return sampling_setting("DEFAULT_RATE")
+
+
+def make_profile_token():
+    """
+    Value for the profiling header; valid for TOKEN_MAX_AGE seconds.
+    """
+    return signing.dumps({"profile": True}, salt=PROFILE_TOKEN_SALT)
+
+
+def is_profiling_forced(request):
+    token = request.headers.get(sampling_setting("HEADER"))
+    if not token:
+        return False
+    try:
+        signing.loads(
+            token, salt=PROFILE_TOKEN_SALT, max_age=sampling_setting("TOKEN_MAX_AGE")
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_intercept(request):
+    if is_profiling_forced(request):
+        return True
+    rate = sample_rate(request.path_info)
+    return rate > 0 and random.random() < rate
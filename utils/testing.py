@@ -0,0 +1,220 @@
+"""
+Helpers for the query-count regression tests in `authapp/tests.py` and
+`stocks/tests.py`.
+"""
+
+import json
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+
+# Fast hashing, no silk recording, and declared view budgets enforced
+QUERY_COUNT_TEST_SETTINGS = {
+    "PASSWORD_HASHERS": ["django.contrib.auth.hashers.MD5PasswordHasher"],
+    "MIDDLEWARE": [m for m in settings.MIDDLEWARE if not m.startswith("silk.")],
+    "QUERY_BUDGET_MODE": "raise",
+}
+
+PASSWORD = "password"
+
+
+def seed_trading_data(fanout):
+    """
+    Seed `fanout` of everything that a response can fan out over: the trader
+    holds, follows and has traded `fanout` stocks, and the first stock has one
+    sell order from each of `fanout` sellers.
+    """
+    from authapp.models import (
+        MarketData,
+        Permission,
+        PriceAlert,
+        Role,
+        RolePermission,
+        Transaction,
+        User,
+        UserStock,
+        UserStockFollowed,
+    )
+    from authapp.repositories.market_listing_repo import rebuild_market_listings
+    from authapp.repositories.price_level_repo import rebuild_price_levels
+    from stocks.models import Stock
+
+    now = timezone.now()
+    user_role = Role.objects.create(id=1, name="User")
+    admin_role = Role.objects.create(name="Admin")
+
+    can_add_money = Permission.objects.create(
+        name="can_add_money", description="Add money to an account"
+    )
+    RolePermission.objects.create(role=user_role, permission=can_add_money)
+    permissions = Permission.objects.bulk_create(
+        Permission(name=f"permission_{i}", description="Seeded")
+        for i in range(fanout)
+    )
+    RolePermission.objects.bulk_create(
+        RolePermission(role=admin_role, permission=permission)
+        for permission in permissions
+    )
+
+    stocks = Stock.objects.bulk_create(
+        Stock(
+            id=f"S{i:03d}",
+            name=f"Stock {i}",
+            marketPrice=Decimal("10.00"),
+            sectionIndex="TEST",
+            details={},
+        )
+        for i in range(fanout + 1)
+    )
+
+    admin = User.objects.create_user("admin", PASSWORD, role=admin_role)
+    trader = User.objects.create_user(
+        "trader", PASSWORD, role=user_role, account_balance=Decimal("1000000.00")
+    )
+    sellers = [
+        User.objects.create_user(f"seller{i}", PASSWORD, role=user_role)
+        for i in range(fanout)
+    ]
+
+    book_stock = stocks[0]
+    UserStock.objects.bulk_create(
+        [UserStock(user=trader, stock=stock, quantity=100) for stock in stocks]
+        + [
+            UserStock(user=seller, stock=book_stock, quantity=0, sold_quantity=10)
+            for seller in sellers
+        ]
+    )
+    UserStockFollowed.objects.bulk_create(
+        UserStockFollowed(user=trader, stock=stock) for stock in stocks
+    )
+    MarketData.objects.bulk_create(
+        [
+            MarketData(
+                user=seller,
+                stock=book_stock,
+                quantity=10,
+                price=Decimal("10.00"),
+                transaction_type="SELL",
+                transaction_date=now,
+            )
+            for seller in sellers
+        ]
+        + [
+            MarketData(
+                user=trader,
+                stock=stock,
+                quantity=100,
+                price=Decimal("10.00"),
+                transaction_type="BUY",
+                transaction_date=now - timedelta(days=10),
+            )
+            for stock in stocks
+        ]
+    )
+    with connection.cursor() as cursor:
+        rebuild_price_levels(cursor, [book_stock.pk])
+        rebuild_market_listings(cursor, [book_stock.pk])
+    Transaction.objects.bulk_create(
+        Transaction(
+            user=trader,
+            stock=stock,
+            transaction_type="BUY",
+            quantity=100,
+            price=Decimal("10.00"),
+            status="COMPLETED",
+        )
+        for stock in stocks
+    )
+
+    PriceAlert.objects.bulk_create(
+        PriceAlert(user=trader, stock=stock, direction="ABOVE", threshold=Decimal("12"))
+        for stock in stocks
+    )
+
+    return SimpleNamespace(
+        admin=admin,
+        trader=trader,
+        sellers=sellers,
+        stocks=stocks,
+        book_stock=book_stock,
+    )
+
+
+class QueryCountTestMixin:
+    """
+    Seeds `seed_trading_data(FANOUT)`; subclasses rerun every test with a
+    larger FANOUT so a bound that depends on the data size fails.
+    """
+
+    FANOUT = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_trading_data(cls.FANOUT)
+
+    def setUp(self):
+        from authapp.permission_registry import registry
+        from authapp.token_blacklist import blacklist_filter
+
+        # Process-wide caches would otherwise load inside the first request
+        registry.role_name(self.data.trader)
+        blacklist_filter.might_contain("")
+
+    def authenticate(self, user):
+        from authapp.serializers import ClaimsTokenObtainPairSerializer
+
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def assertMaxQueries(self, limit, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as captured:
+            response = func(*args, **kwargs)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+
+        queries = "\n".join(query["sql"] for query in captured.captured_queries)
+        self.assertLessEqual(
+            len(captured),
+            limit,
+            f"{len(captured)} queries, expected at most {limit}:\n{queries}",
+        )
+        # Writes only flag a blown view budget instead of raising
+        self.assertNotIn(
+            "X-Query-Budget-Exceeded",
+            response,
+            f"View query budget exceeded: {response.get('X-Query-Budget-Exceeded')}",
+        )
+        return response
+
+    def assertListMatchesSerializer(
+        self, path, serializer_class, queryset, normalize=None
+    ):
+        """
+        Rows served by the `ValuesListMixin` list at `path` render exactly
+        like the serializer renders the same objects, through the orjson path
+        and the indented (stdlib) one. `normalize` may adjust each row first.
+        """
+        from rest_framework.renderers import JSONRenderer
+
+        for accept in ("application/json", "application/json; indent=4"):
+            response = self.client.get(path, HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, 200)
+            rows = json.loads(response.content)["results"]
+            self.assertTrue(rows)
+            for row in rows if normalize else ():
+                normalize(row)
+            objects = queryset.filter(pk__in=[row["id"] for row in rows])
+            expected = json.loads(
+                JSONRenderer().render(serializer_class(objects, many=True).data)
+            )
+            self.assertEqual(
+                {row["id"]: row for row in rows},
+                {row["id"]: row for row in expected},
+                accept,
+            )